@@ -0,0 +1,177 @@
+import math
+import time
+import asyncio
+from contextlib import asynccontextmanager
+from typing import AsyncIterator
+
+from app.config import config
+from app.metrics import admission_queue_depth, admission_in_flight, admission_wait, admission_rejected
+
+
+class AdmissionRejected(Exception):
+    """No hay cupo: la cola está llena (429) o venció el plazo de espera (503)"""
+
+    def __init__(self, limiter: str, status_code: int, retry_after: int, message: str):
+        super().__init__(message)
+        self.limiter = limiter
+        self.status_code = status_code
+        self.retry_after = retry_after
+
+
+class Ticket:
+    """Cupo tomado de un limitador; liberarlo más de una vez no tiene efecto"""
+
+    def __init__(self, limiter: "Limiter"):
+        self._limiter = limiter
+        self._acquired_at = time.monotonic()
+        self._released = False
+
+
+    def release(self):
+        if self._released:
+            return
+        self._released = True
+        self._limiter._release(time.monotonic() - self._acquired_at)
+
+
+class Limiter:
+    """Límite de concurrencia con una cola de espera acotada y un plazo
+
+    Si no hay cupo libre y ya hay `max_queue` peticiones esperando se rechaza
+    de inmediato con 429; si el cupo no se libera en `timeout` segundos se
+    rechaza con 503. Retry-After se estima con la duración promedio de los
+    cupos y la cola actual.
+    """
+
+    def __init__(self, name: str, limit: int, max_queue: int, timeout: float):
+        self.name = name
+        self.limit = max(1, limit)
+        self.max_queue = max(0, max_queue)
+        self.timeout = timeout
+        self._semaphore = asyncio.Semaphore(self.limit)
+        self._in_flight = 0
+        self._waiting = 0
+        self._avg_hold = 0.0
+        self._admitted = 0
+        self._rejected = 0
+
+
+    def retry_after(self) -> int:
+        # Segundos hasta que se liberen los cupos de la cola actual
+        estimate = self._avg_hold * (self._waiting + 1) / self.limit
+        return min(60, max(1, math.ceil(estimate)))
+
+
+    def _reject(self, status_code: int, reason: str, message: str) -> AdmissionRejected:
+        self._rejected += 1
+        admission_rejected.inc(limiter=self.name, reason=reason)
+        return AdmissionRejected(self.name, status_code, self.retry_after(), message)
+
+
+    async def acquire(self) -> Ticket:
+        """Tomar un cupo, esperando en la cola hasta el plazo
+
+        Args: none
+        """
+
+        if self._semaphore.locked() and self._waiting >= self.max_queue:
+            raise self._reject(429, "queue_full", f"Demasiadas consultas en curso ({self.name}), intenta más tarde")
+
+        self._waiting += 1
+        admission_queue_depth.set(self._waiting, limiter=self.name)
+        start = time.monotonic()
+        try:
+            await asyncio.wait_for(self._semaphore.acquire(), self.timeout)
+        except asyncio.TimeoutError:
+            raise self._reject(503, "timeout", f"No hubo cupo ({self.name}) en {self.timeout}s, intenta más tarde")
+        finally:
+            self._waiting -= 1
+            admission_queue_depth.set(self._waiting, limiter=self.name)
+
+        admission_wait.observe(time.monotonic() - start, limiter=self.name)
+        self._in_flight += 1
+        self._admitted += 1
+        admission_in_flight.set(self._in_flight, limiter=self.name)
+        return Ticket(self)
+
+
+    def _release(self, held: float):
+        self._in_flight -= 1
+        admission_in_flight.set(self._in_flight, limiter=self.name)
+        self._avg_hold = held if self._avg_hold == 0 else 0.8 * self._avg_hold + 0.2 * held
+        self._semaphore.release()
+
+
+    @asynccontextmanager
+    async def slot(self):
+        """Tomar un cupo y liberarlo al terminar
+
+        Uso:
+            async with llm_limiter.slot():
+                await client.chat.completions.create(...)
+        """
+
+        ticket = await self.acquire()
+        try:
+            yield
+        finally:
+            ticket.release()
+
+
+    def stats(self) -> dict:
+        return {
+            "limit": self.limit,
+            "max_queue": self.max_queue,
+            "timeout": self.timeout,
+            "in_flight": self._in_flight,
+            "waiting": self._waiting,
+            "admitted": self._admitted,
+            "rejected": self._rejected,
+            "avg_hold_seconds": round(self._avg_hold, 3),
+        }
+
+
+async def read_ahead(events: AsyncIterator) -> AsyncIterator:
+    """Leer un stream en una tarea aparte y entregarlo desde un buffer
+
+    El stream de origen avanza a su ritmo aunque quien lo consume sea más
+    lento, así un cupo tomado dentro del stream (por ejemplo el del proveedor
+    LLM) se libera apenas el origen termina y no cuando el cliente termina de
+    leer. Si el consumidor se detiene antes, la lectura se cancela.
+
+    Args:
+        events: Stream de origen
+    """
+
+    queue: asyncio.Queue = asyncio.Queue()
+    end = object()
+
+    async def produce():
+        try:
+            async for event in events:
+                queue.put_nowait((event, None))
+        except Exception as e:
+            queue.put_nowait((end, e))
+        else:
+            queue.put_nowait((end, None))
+
+    producer = asyncio.create_task(produce())
+    try:
+        while True:
+            event, error = await queue.get()
+            if error is not None:
+                raise error
+            if event is end:
+                return
+            yield event
+    finally:
+        producer.cancel()
+        await asyncio.gather(producer, return_exceptions=True)
+
+
+# Consultas de chat en curso (los tres endpoints de chat)
+chat_limiter = Limiter("chat", config.ADMISSION_CHAT_CONCURRENCY, config.ADMISSION_CHAT_QUEUE, config.ADMISSION_CHAT_TIMEOUT)
+# Llamadas al proveedor LLM en curso (cliente MCP y agente ADK)
+llm_limiter = Limiter("llm", config.ADMISSION_LLM_CONCURRENCY, config.ADMISSION_LLM_QUEUE, config.ADMISSION_LLM_TIMEOUT)
+# Sesiones MCP tomadas del pool (el límite es el tamaño del pool)
+mcp_limiter = Limiter("mcp", config.MCP_POOL_SIZE, config.ADMISSION_MCP_QUEUE, config.ADMISSION_MCP_TIMEOUT)
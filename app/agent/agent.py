@@ -1,49 +1,132 @@
-import asyncio
-import json
+import time
+import logging
 from dotenv import load_dotenv
 from google.adk.agents.llm_agent import Agent
+from google.adk.agents.callback_context import CallbackContext
 from google.adk.models.lite_llm import LiteLlm
-from google.adk.sessions import InMemorySessionService
+from google.adk.models.llm_request import LlmRequest
+from google.adk.sessions import BaseSessionService
 from google.adk.runners import Runner
-from app.agent.tools import execute_sql_query, graphic_recomendation, format_insight, calculate_data
+from app.agent.tools import execute_sql_query, get_movement_summary, graphic_recomendation, format_insight, calculate_data
 from google.genai import types
+from app.logger import logger
+from app.db.schema_catalog import schema_catalog
+from app.metrics import record
+from app.admission import llm_limiter, read_ahead
+from app.config import config
 
 load_dotenv() # Cargar variables de entorno
 
 # Flag para determinar si se usará o no el modelo local
 LOCAL_MODEL = True
 
-# Definir constantes sobre el modelo
-MODEL_NAME = 'openai/gpt-4o' if not LOCAL_MODEL else 'ollama_chat/llama3.1'
+# Definir constantes sobre el modelo (AGENT_MODEL lo reemplaza, por ejemplo en los benchmarks)
+MODEL_NAME = config.AGENT_MODEL or ('openai/gpt-4o' if not LOCAL_MODEL else 'ollama_chat/llama3.1')
 
 # Definir constantes para indentificar la sesión
 APP_NAME = 'Cerámica de Altura App'
-USER_ID = 'user_1'
-SESSION_ID = 'session_1'
+USER_ID = 'user_1' # Usuario por defecto cuando la petición no envía uno
+
+# Instrucción fija del agente; el esquema relevante se agrega por pregunta en add_schema_context
+BASE_INSTRUCTION = """
+        Eres un asistente que ayuda a otorgar información de la base de datos.
+        Puedes usar la herramientas execute_sql_query para las consultas de
+        información de lo que respecta al inventario de Cerámica de Altura.
+        SIEMPRE que se te pida un gráfico, usa la herramienta graphic_recomendation.
+        execute_sql_query devuelve un result_id: pásalo a graphic_recomendation,
+        calculate_data y format_insight en lugar de copiar las filas.
+        No enviar imágenes en base64 del gráfic. Solo usar el tool.
+        No enviar imágenes del gráfico. Solo usar el tool.
+        No enviar archivos adjuntos.
+        SIEMPRE que se pida un insight sobre la data obtenida partir de execute_sql_query,
+        usar el tool format_insight.
+        Las respuestas textuales deben ser del mismo tamaño todas las partes. No usar
+        tamaños de letra grandes.
+        """
+
+
+class AdmittedLiteLlm(LiteLlm):
+    """LiteLlm que toma un cupo del límite de llamadas al proveedor LLM por cada llamada"""
+
+    async def generate_content_async(self, llm_request, stream: bool = False):
+        # read_ahead libera el cupo al terminar la respuesta del proveedor, no cuando el cliente termina de leerla
+        async for response in read_ahead(self._admitted_content(llm_request, stream)):
+            yield response
+
+
+    async def _admitted_content(self, llm_request, stream: bool):
+        async with llm_limiter.slot():
+            async for response in super().generate_content_async(llm_request, stream=stream):
+                yield response
+
+
+def add_schema_context(callback_context: CallbackContext, llm_request: LlmRequest) -> None:
+    """Agregar las tablas y JOINs relevantes para la pregunta actual antes de llamar al modelo
+
+    La instrucción del sistema queda fija (BASE_INSTRUCTION) para que el
+    proveedor reutilice el prefijo en caché. El esquema va como una parte
+    aparte al inicio del mensaje actual del usuario, solo en la petición al
+    modelo: no se guarda en la sesión.
+
+    Args:
+        callback_context: Contexto de la invocación
+        llm_request: Petición al modelo a completar
+    """
+
+    question = ""
+    if callback_context.user_content and callback_context.user_content.parts:
+        question = " ".join(part.text or "" for part in callback_context.user_content.parts)
+    schema = types.Part(text="Esquema de la base de datos relevante para la pregunta:\n" + schema_catalog.context_for(question))
+
+    # El mensaje actual es el último del usuario con texto (las respuestas de
+    # los tools también tienen rol user). Se reemplaza por una copia para no
+    # modificar el evento guardado en la sesión
+    contents = llm_request.contents
+    for index in range(len(contents) - 1, -1, -1):
+        content = contents[index]
+        if content.role == "user" and any(part.text for part in content.parts or []):
+            contents[index] = types.Content(role="user", parts=[schema, *content.parts])
+            return None
+    contents.append(types.Content(role="user", parts=[schema]))
+    return None
+
+
+# Tipo de evento del stream según el tool que respondió
+TOOL_EVENTS = {
+    'execute_sql_query': 'tool',
+    'get_movement_summary': 'tool',
+    'graphic_recomendation': 'tool_graphic',
+    'format_insight': 'insight',
+}
 
 # Función para manejar el agente de forma asíncrona
+# Genera eventos (tipo, datos); el formato de salida lo decide app.api.v1.agent.streaming
 async def call_agent_async(query: str, runner: Runner, user_id, session_id):
   content = types.Content(role='user', parts=[types.Part(text=query)])
 
   final_response_text = "El agente no ha enviado ningún mensaje." # Mensaje por defecto
+  debug = logger.isEnabledFor(logging.DEBUG)
+
+  # Tiempo al primer evento, duración total y tokens del modelo en toda la invocación
+  start = time.perf_counter()
+  first_event = True
+  tokens = {"prompt_tokens": 0, "completion_tokens": 0}
 
   async for event in runner.run_async(user_id=user_id, session_id=session_id, new_message=content):
-      print('El evento es: ', event.model_dump_json(indent=2))
+      if debug:
+          logger.debug(f'El evento es: {event.model_dump_json(indent=2)}')
+      if first_event:
+          record("agent.first_event", time.perf_counter() - start)
+          first_event = False
+      if event.usage_metadata:
+          tokens["prompt_tokens"] += event.usage_metadata.prompt_token_count or 0
+          tokens["completion_tokens"] += event.usage_metadata.candidates_token_count or 0
       if event.content and event.content.parts:
           for part in event.get_function_responses():
-              print('EL PART ES: ', part.model_dump_json(indent=2))
-              if part.name == 'execute_sql_query':
-                  print('Se usó este tool de sql')
-                  yield '[[TOOL]]' + json.dumps(part.response, default=str)
-                  await asyncio.sleep(0.1)
-              elif part.name == 'graphic_recomendation':
-                  print('Se usó este tool de graphics')
-                  yield '[[TOOL-GRAPHIC]]' + json.dumps(part.response, default=str)
-                  await asyncio.sleep(0.1)
-              elif part.name == 'format_insight':
-                  print('Se usó este tool para los insights')
-                  yield '[[INSIGHT]]' + json.dumps(part.response, default=str) 
-                  await asyncio.sleep(0.1)
+              event_type = TOOL_EVENTS.get(part.name)
+              if event_type:
+                  logger.debug(f'Se usó el tool {part.name}')
+                  yield event_type, part.response
 
       if event.is_final_response(): # Valida si es el mensaje final que tiene el texto final del modelo
           if event.content and event.content.parts:
@@ -52,47 +135,35 @@ async def call_agent_async(query: str, runner: Runner, user_id, session_id):
              final_response_text = f"Agent escalated: {event.error_message or 'No specific message.'}"
           break
 
+  record("agent.run", time.perf_counter() - start, **tokens)
+
+  # Con un servicio de sesiones compartido, el turno queda guardado antes de
+  # responder: el siguiente mensaje puede llegar a otro worker
+  flush = getattr(runner.session_service, "flush", None)
+  if flush is not None:
+      await flush()
+
   if final_response_text:
-      print(f"\nEl mensaje es: {final_response_text}\n")
-      yield '[[MENSAJE]]' + final_response_text
-      await asyncio.sleep(0.1)
+      logger.debug(f"El mensaje es: {final_response_text}")
+      yield 'message', final_response_text
   else:
-      yield 'Error response'
+      yield 'error', 'Error response'
 
 
 # Función para iniciar el agente
-async def init_agent():
+async def init_agent(session_service: BaseSessionService):
     # Se define nuestro agente de Cerámica de Altura
     agent = Agent(
         name='agente_ceramica_de_altura',
-        model=LiteLlm(model=MODEL_NAME),
+        model=AdmittedLiteLlm(model=MODEL_NAME),
         description='Extrae información de la bd de inventario de Cerámica de Altura',
-        instruction="""
-        Eres un asistente que ayuda a otorgar información de la base de datos.
-        Puedes usar la herramientas execute_sql_query para las consultas de
-        información de lo que respecta al inventario de Cerámica de Altura.
-        SIEMPRE que se te pida un gráfico, usa la herramienta graphic_recomendation.
-        No enviar imágenes en base64 del gráfic. Solo usar el tool.
-        No enviar imágenes del gráfico. Solo usar el tool.
-        No enviar archivos adjuntos.
-        SIEMPRE que se pida un insight sobre la data obtenida partir de execute_sql_query,
-        usar el tool format_insight.
-        Las respuestas textuales deben ser del mismo tamaño todas las partes. No usar
-        tamaños de letra grandes.
-        """,
-        tools=[execute_sql_query, graphic_recomendation, format_insight, calculate_data],
+        instruction=BASE_INSTRUCTION,
+        before_model_callback=add_schema_context,
+        tools=[execute_sql_query, get_movement_summary, graphic_recomendation, format_insight, calculate_data],
     )
     print(f"Se ha creado el agente {agent.name} usando el modelo {MODEL_NAME}")
 
-    # Iniciar el session service para memoria no persistente
-    session_service = InMemorySessionService()
-    await session_service.create_session(
-        app_name=APP_NAME,
-        user_id=USER_ID,
-        session_id=SESSION_ID
-    )
-    print(f"Sesión credada {APP_NAME} {USER_ID} {SESSION_ID}")
-
+    # Las sesiones se crean bajo demanda por usuario (ver SessionStore)
     runner = Runner(
         agent=agent,
         app_name=APP_NAME,
@@ -101,3 +172,15 @@ async def init_agent():
     print(f"Se creó el Runner {runner.agent.name}")
     
     return runner
+
+
+# Función para abrir la conexión con el proveedor del modelo antes de la primera conversación
+async def warm_up_model():
+    # LiteLlm usa los clientes HTTP en caché de litellm: una completion de 1
+    # token deja la conexión (DNS, TLS) abierta para todos los runners
+    import litellm
+    await litellm.acompletion(
+        model=MODEL_NAME,
+        messages=[{"role": "user", "content": "ping"}],
+        max_tokens=1
+    )
@@ -0,0 +1,237 @@
+import math
+from typing import Sequence
+
+import numpy as np
+
+# Operaciones que devuelven un solo valor por grupo
+SCALAR_OPERATIONS = [
+    "count", "sum", "average", "min", "max", "range",
+    "variance", "std_dev", "median", "product", "total_growth",
+]
+# Operaciones que devuelven una serie (mismo orden que los valores)
+SERIES_OPERATIONS = ["cumsum", "growth_rate"]
+
+ALIASES = {"mean": "average", "avg": "average", "std": "std_dev", "var": "variance", "total": "sum"}
+
+# Perfil completo: todas las escalares (menos product) más los percentiles por defecto
+PROFILE = "profile"
+DEFAULT_PERCENTILES = [25.0, 50.0, 75.0, 90.0]
+
+
+def _number(value) -> float | None:
+    # Los resultados deben ser serializables a JSON: NaN/inf se devuelven como None
+    value = float(value)
+    return value if math.isfinite(value) else None
+
+
+def _series(values: np.ndarray, max_series: int) -> dict:
+    result = {"values": [_number(v) for v in values[:max_series]]}
+    if len(values) > max_series:
+        result["truncated"] = True
+        result["length"] = int(len(values))
+    return result
+
+
+def parse_operations(operations: Sequence[str]) -> tuple[list[str], list[float]]:
+    """Normalizar la lista de operaciones pedidas
+
+    Acepta alias (mean, std...), "profile" y percentiles como "p90".
+    Devuelve (operaciones, percentiles).
+
+    Args:
+        operations: Operaciones pedidas por el modelo
+    """
+
+    selected: list[str] = []
+    percentiles: list[float] = []
+    for operation in operations:
+        name = ALIASES.get(operation.lower().strip(), operation.lower().strip())
+        if name == PROFILE:
+            selected += [op for op in SCALAR_OPERATIONS if op != "product"]
+            percentiles += DEFAULT_PERCENTILES
+        elif name.startswith("p") and name[1:].replace(".", "", 1).isdigit():
+            percentile = float(name[1:])
+            if not 0 <= percentile <= 100:
+                raise ValueError(f"Percentil fuera de rango: {operation}")
+            percentiles.append(percentile)
+        elif name in SCALAR_OPERATIONS or name in SERIES_OPERATIONS:
+            selected.append(name)
+        else:
+            supported = ", ".join(SCALAR_OPERATIONS + SERIES_OPERATIONS + [PROFILE, "p<N>"])
+            raise ValueError(f"Operación '{operation}' no soportada. Use: {supported}")
+
+    return list(dict.fromkeys(selected)), sorted(set(percentiles))
+
+
+def _scalar_stats(values: np.ndarray, operations: list[str], percentiles: list[float]) -> dict:
+    # Estadísticas de un arreglo sin NaN
+    n = len(values)
+    result: dict = {}
+    if "count" in operations:
+        result["count"] = n
+    if n == 0:
+        return result
+
+    total = values.sum()
+    mean = total / n
+    if "sum" in operations:
+        result["sum"] = _number(total)
+    if "average" in operations:
+        result["average"] = _number(mean)
+    if "min" in operations or "range" in operations:
+        low, high = values.min(), values.max()
+        if "min" in operations:
+            result["min"] = _number(low)
+        if "max" in operations:
+            result["max"] = _number(high)
+        if "range" in operations:
+            result["range"] = _number(high - low)
+    elif "max" in operations:
+        result["max"] = _number(values.max())
+    if "variance" in operations or "std_dev" in operations:
+        variance = values.var()
+        if "variance" in operations:
+            result["variance"] = _number(variance)
+        if "std_dev" in operations:
+            result["std_dev"] = _number(math.sqrt(variance))
+    if "median" in operations:
+        result["median"] = _number(np.median(values))
+    if "product" in operations:
+        result["product"] = _number(np.prod(values))
+    if "total_growth" in operations:
+        result["total_growth"] = _number((values[-1] - values[0]) / values[0]) if values[0] else None
+    if percentiles:
+        result["percentiles"] = {
+            f"p{p:g}": _number(v) for p, v in zip(percentiles, np.percentile(values, percentiles))
+        }
+    return result
+
+
+def _series_stats(values: np.ndarray, operations: list[str], max_series: int) -> dict:
+    result: dict = {}
+    if "cumsum" in operations:
+        result["cumsum"] = _series(np.cumsum(values), max_series)
+    if "growth_rate" in operations:
+        with np.errstate(divide="ignore", invalid="ignore"):
+            growth = np.diff(values) / values[:-1]
+        result["growth_rate"] = _series(growth, max_series)
+    return result
+
+
+def _grouped_stats(
+    values: np.ndarray,
+    keys: np.ndarray,
+    operations: list[str],
+    percentiles: list[float],
+    max_series: int,
+) -> dict:
+    # Agrupación vectorizada: los grupos quedan contiguos tras un orden estable
+    # por clave y las sumas/mín/máx se calculan con reduceat/bincount
+    unique_keys, inverse = np.unique(keys, return_inverse=True)
+    order = np.argsort(inverse, kind="stable")
+    sorted_values = values[order]
+    counts = np.bincount(inverse, minlength=len(unique_keys))
+    starts = np.concatenate(([0], np.cumsum(counts)[:-1]))
+
+    sums = np.add.reduceat(sorted_values, starts)
+    means = sums / counts
+    mins = np.minimum.reduceat(sorted_values, starts)
+    maxs = np.maximum.reduceat(sorted_values, starts)
+    variances = np.bincount(inverse, weights=(values - means[inverse]) ** 2) / counts
+
+    needs_slices = (
+        percentiles or "median" in operations or "product" in operations
+        or "total_growth" in operations or any(op in SERIES_OPERATIONS for op in operations)
+    )
+
+    groups = []
+    for index, key in enumerate(unique_keys):
+        stats: dict = {"key": key.item() if hasattr(key, "item") else key}
+        if "count" in operations:
+            stats["count"] = int(counts[index])
+        if "sum" in operations:
+            stats["sum"] = _number(sums[index])
+        if "average" in operations:
+            stats["average"] = _number(means[index])
+        if "min" in operations:
+            stats["min"] = _number(mins[index])
+        if "max" in operations:
+            stats["max"] = _number(maxs[index])
+        if "range" in operations:
+            stats["range"] = _number(maxs[index] - mins[index])
+        if "variance" in operations:
+            stats["variance"] = _number(variances[index])
+        if "std_dev" in operations:
+            stats["std_dev"] = _number(math.sqrt(variances[index]))
+
+        if needs_slices:
+            # Valores del grupo en su orden original
+            group = sorted_values[starts[index]:starts[index] + counts[index]]
+            slice_operations = [op for op in ("median", "product", "total_growth") if op in operations]
+            stats.update(_scalar_stats(group, slice_operations, percentiles))
+            stats.update(_series_stats(group, operations, max_series))
+        groups.append(stats)
+
+    return {"group_count": len(groups), "groups": groups}
+
+
+def calculate(
+    values: Sequence,
+    operations: Sequence[str],
+    keys: Sequence | None = None,
+    max_series: int = 1000,
+) -> dict:
+    """Calcular varias operaciones sobre una columna numérica en una sola pasada
+
+    Los valores nulos o no numéricos se descartan y se informan en "nulls".
+    Con `keys` (misma longitud que `values`) los resultados se agrupan por clave.
+
+    Args:
+        values: Valores numéricos
+        operations: Operaciones (sum, average, min, max, count, range, variance,
+            std_dev, median, product, total_growth, cumsum, growth_rate, p<N>, profile)
+        keys: Clave de agrupación de cada valor (opcional)
+        max_series: Máximo de elementos devueltos en cumsum/growth_rate
+    """
+
+    if values is None or len(values) == 0:
+        return {"success": False, "error": "La lista de valores no puede estar vacía"}
+    if keys is not None and len(keys) != len(values):
+        return {"success": False, "error": "group_keys debe tener la misma cantidad de elementos que values"}
+
+    try:
+        selected, percentiles = parse_operations(operations or [PROFILE])
+    except ValueError as e:
+        return {"success": False, "error": str(e)}
+
+    try:
+        # None se convierte en NaN sin recorrer los valores en Python
+        array = np.asarray(values, dtype=np.float64)
+    except (ValueError, TypeError):
+        # Valores de texto: se convierten uno a uno y los inválidos quedan como NaN
+        array = np.array([_to_float(v) for v in values], dtype=np.float64)
+
+    valid = ~np.isnan(array)
+    nulls = int(len(array) - valid.sum())
+    array = array[valid]
+
+    result: dict = {"success": True, "operations": selected, "nulls": nulls}
+
+    if keys is None:
+        result.update(_scalar_stats(array, selected, percentiles))
+        result.update(_series_stats(array, selected, max_series))
+        return result
+
+    key_array = np.array(["" if k is None else str(k) for k in keys])[valid]
+    if len(array) == 0:
+        result.update({"group_count": 0, "groups": []})
+        return result
+    result.update(_grouped_stats(array, key_array, selected, percentiles, max_series))
+    return result
+
+
+def _to_float(value) -> float:
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return math.nan
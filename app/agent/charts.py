@@ -0,0 +1,116 @@
+import math
+
+import numpy as np
+
+OTHERS_LABEL = "Otros"
+
+
+def _to_float(value) -> float:
+    try:
+        number = float(value)
+    except (TypeError, ValueError):
+        return math.nan
+    return number if math.isfinite(number) else math.nan
+
+
+def lttb(values: np.ndarray, threshold: int) -> np.ndarray:
+    """Índices a conservar de una serie con Largest-Triangle-Three-Buckets
+
+    Conserva el primer y el último punto y, de cada bucket intermedio, el
+    punto que forma el triángulo de mayor área con el punto elegido antes y el
+    promedio del bucket siguiente. Mantiene picos y valles con `threshold` puntos.
+
+    Args:
+        values: Valores de la serie (el eje x es la posición)
+        threshold: Cantidad de puntos a conservar
+    """
+
+    n = len(values)
+    if threshold >= n:
+        return np.arange(n)
+    if threshold < 3:
+        return np.array([0, n - 1])
+
+    x = np.arange(n, dtype=np.float64)
+    y = values.astype(np.float64)
+    # Límites de los buckets intermedios (el primer y el último punto van solos)
+    edges = np.linspace(1, n - 1, threshold - 1).astype(int)
+
+    selected = np.empty(threshold, dtype=int)
+    selected[0] = 0
+    previous = 0
+    for bucket in range(threshold - 2):
+        start, end = edges[bucket], edges[bucket + 1]
+        next_start, next_end = end, edges[bucket + 2] if bucket + 2 < len(edges) else n
+        avg_x = x[next_start:next_end].mean()
+        avg_y = y[next_start:next_end].mean()
+
+        area = np.abs(
+            (x[previous] - avg_x) * (y[start:end] - y[previous])
+            - (x[previous] - x[start:end]) * (avg_y - y[previous])
+        )
+        previous = start + int(np.argmax(area))
+        selected[bucket + 1] = previous
+    selected[-1] = n - 1
+    return selected
+
+
+def top_n_with_others(labels: list[str], values: np.ndarray, max_points: int) -> tuple[list[str], list[float]]:
+    """Las `max_points - 1` categorías mayores y el resto sumado en "Otros"
+
+    Args:
+        labels: Etiquetas de cada categoría
+        values: Valores de cada categoría
+        max_points: Máximo de categorías en el gráfico (incluida "Otros")
+    """
+
+    if len(labels) <= max_points:
+        return labels, values.tolist()
+
+    keep = max(1, max_points - 1)
+    order = np.argsort(-values, kind="stable")
+    top, rest = order[:keep], order[keep:]
+    return [labels[i] for i in top] + [OTHERS_LABEL], values[top].tolist() + [float(values[rest].sum())]
+
+
+def prepare_series(chart_type: str, labels: list[str], values: list, max_points: int) -> tuple[list[str], list]:
+    """Reducir una serie al presupuesto de puntos del gráfico
+
+    "lineas" se submuestrea con LTTB conservando el orden; "barras" y "pastel"
+    conservan las categorías mayores y agrupan el resto en "Otros". Si algún
+    valor no es numérico la serie solo se recorta.
+
+    Args:
+        chart_type: Tipo de gráfico (barras, lineas, pastel)
+        labels: Etiqueta de cada punto
+        values: Valor de cada punto
+        max_points: Máximo de puntos del gráfico
+    """
+
+    if len(labels) <= max_points:
+        return labels, values
+
+    try:
+        numbers = np.asarray(values, dtype=np.float64)
+    except (TypeError, ValueError):
+        numbers = np.array([_to_float(value) for value in values], dtype=np.float64)
+    if not np.isfinite(numbers).all():
+        return labels[:max_points], values[:max_points]
+
+    if chart_type == "lineas":
+        indices = lttb(numbers, max_points)
+        return [labels[i] for i in indices], [values[i] for i in indices]
+    return top_n_with_others(labels, numbers, max_points)
+
+
+def point_budget(chart_type: str, line_points: int, bar_points: int, pie_points: int) -> int:
+    """Máximo de puntos según el tipo de gráfico
+
+    Args:
+        chart_type: Tipo de gráfico (barras, lineas, pastel)
+        line_points: Presupuesto de "lineas"
+        bar_points: Presupuesto de "barras"
+        pie_points: Presupuesto de "pastel"
+    """
+
+    return {"lineas": line_points, "barras": bar_points, "pastel": pie_points}.get(chart_type, bar_points)
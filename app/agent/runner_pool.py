@@ -0,0 +1,82 @@
+import asyncio
+import logging
+from typing import AsyncIterator, Awaitable, Callable
+
+from google.adk.runners import Runner
+
+from app.metrics import span
+
+
+class RunnerPool:
+    """Runners ADK pre-construidos entre los que se reparten las conversaciones
+
+    Todos los runners comparten el mismo servicio de sesiones, así cualquier
+    runner puede continuar la sesión de un usuario. La construcción es
+    single-flight: peticiones concurrentes esperan al mismo arranque en lugar
+    de construir cada una su Agent, LiteLlm y Runner.
+    """
+
+    def __init__(self, factory: Callable[[], Awaitable[Runner]], size: int):
+        self.factory = factory
+        self.size = max(1, size)
+        self._runners: list[Runner] = []
+        self._in_flight: list[int] = []
+        self._next = 0
+        self._lock = asyncio.Lock()
+
+
+    @property
+    def started(self) -> bool:
+        return bool(self._runners)
+
+
+    async def start(self):
+        """Construir los runners del pool una sola vez
+
+        Si la construcción falla el pool queda vacío y la próxima llamada
+        vuelve a intentarlo.
+        """
+
+        if self._runners:
+            return
+
+        async with self._lock:
+            if self._runners:
+                return
+            with span("agent.init", runners=self.size):
+                runners = await asyncio.gather(*(self.factory() for _ in range(self.size)))
+            self._in_flight = [0] * len(runners)
+            self._runners = list(runners)
+            logging.info(f"Pool de runners ADK iniciado con {len(runners)} runners")
+
+
+    def _acquire(self) -> int:
+        # El runner con menos conversaciones en curso; los empates se reparten en ronda
+        count = len(self._runners)
+        order = [(self._next + i) % count for i in range(count)]
+        index = min(order, key=lambda i: self._in_flight[i])
+        self._next = (index + 1) % count
+        self._in_flight[index] += 1
+        return index
+
+
+    async def run(self, events: Callable[[Runner], AsyncIterator]) -> AsyncIterator:
+        """Ejecutar una conversación en el runner menos ocupado
+
+        El runner queda asignado hasta que termina el stream de eventos.
+
+        Args:
+            events: Función que recibe el runner y devuelve el generador de eventos
+        """
+
+        await self.start()
+        index = self._acquire()
+        try:
+            async for event in events(self._runners[index]):
+                yield event
+        finally:
+            self._in_flight[index] -= 1
+
+
+    def stats(self) -> dict:
+        return {"size": self.size, "started": self.started, "in_flight": list(self._in_flight)}
@@ -0,0 +1,183 @@
+import time
+import uuid
+import asyncio
+import logging
+from collections import OrderedDict
+
+from google.adk.sessions import BaseSessionService, Session
+
+
+class SessionStore:
+    """Sesiones ADK por usuario con un máximo de sesiones residentes
+
+    Las sesiones se crean bajo demanda. Cuando se supera `max_sessions` se
+    elimina la menos usada recientemente (LRU) y las que no se usan durante
+    `ttl_seconds` se eliminan en el siguiente acceso.
+
+    Con `shared_storage` (servicio compartido entre workers) el LRU solo deja
+    de seguir la sesión en este proceso, y el TTL la elimina solo si ningún
+    worker la actualizó en ese tiempo.
+    """
+
+    def __init__(
+        self,
+        session_service: BaseSessionService,
+        app_name: str,
+        max_sessions: int,
+        ttl_seconds: float,
+        shared_storage: bool = False
+    ):
+        self.session_service = session_service
+        self.app_name = app_name
+        self.max_sessions = max(1, max_sessions)
+        self.ttl_seconds = ttl_seconds
+        self.shared_storage = shared_storage
+        self._last_access: OrderedDict[tuple[str, str], float] = OrderedDict()
+        self._key_locks: dict[tuple[str, str], list] = {} # llave -> [lock, peticiones que lo usan]
+        self._evicted = 0
+
+
+    async def ensure_session(self, user_id: str, session_id: str | None = None) -> Session:
+        """Obtener la sesión del usuario o crearla si no existe
+
+        Args:
+            user_id: Identificador del usuario
+            session_id: Identificador de la sesión (se genera uno si no se envía)
+        """
+
+        session_id = session_id or uuid.uuid4().hex
+        key = (user_id, session_id)
+
+        # El registro LRU/TTL se actualiza sin awaits (no lo intercala otra
+        # petición); las llamadas al servicio van fuera, con un lock por sesión
+        now = time.monotonic()
+        removed = self._expired(now)
+        self._last_access[key] = now
+        self._last_access.move_to_end(key)
+        while len(self._last_access) > self.max_sessions:
+            oldest, _ = self._last_access.popitem(last=False)
+            if not self.shared_storage:
+                removed.append((oldest, "LRU"))
+
+        entry = self._key_locks.setdefault(key, [asyncio.Lock(), 0])
+        entry[1] += 1
+        try:
+            async with entry[0]:
+                session = await self._get_or_create(user_id, session_id)
+        finally:
+            entry[1] -= 1
+            if entry[1] == 0:
+                del self._key_locks[key]
+
+        for removed_key, reason in removed:
+            await self._delete(removed_key, reason)
+        return session
+
+
+    async def _get_or_create(self, user_id: str, session_id: str) -> Session:
+        session = await self.session_service.get_session(
+            app_name=self.app_name,
+            user_id=user_id,
+            session_id=session_id
+        )
+        if session is not None:
+            return session
+        try:
+            session = await self.session_service.create_session(
+                app_name=self.app_name,
+                user_id=user_id,
+                session_id=session_id
+            )
+            logging.info(f"Sesión creada {self.app_name} {user_id} {session_id}")
+            return session
+        except ValueError:
+            # Otro worker la creó entre la lectura y la creación
+            session = await self.session_service.get_session(
+                app_name=self.app_name,
+                user_id=user_id,
+                session_id=session_id
+            )
+            if session is None:
+                raise
+            return session
+
+
+    def _expired(self, now: float) -> list[tuple[tuple[str, str], str]]:
+        # El OrderedDict está ordenado por último acceso: basta revisar el inicio
+        expired = []
+        while self._last_access:
+            key, last_access = next(iter(self._last_access.items()))
+            if now - last_access < self.ttl_seconds:
+                break
+            self._last_access.popitem(last=False)
+            expired.append((key, "TTL"))
+        return expired
+
+
+    async def _delete(self, key: tuple[str, str], reason: str):
+        user_id, session_id = key
+        if key in self._last_access:
+            # Otra petición volvió a usar la sesión mientras tanto
+            return
+        try:
+            if self.shared_storage and reason == "TTL":
+                session = await self.session_service.get_session(
+                    app_name=self.app_name,
+                    user_id=user_id,
+                    session_id=session_id
+                )
+                if session is None or time.time() - session.last_update_time < self.ttl_seconds:
+                    return
+            await self.session_service.delete_session(
+                app_name=self.app_name,
+                user_id=user_id,
+                session_id=session_id
+            )
+            self._evicted += 1
+            logging.info(f"Sesión eliminada por {reason}: {user_id} {session_id}")
+        except Exception as e:
+            logging.error(f"Error al eliminar la sesión {user_id} {session_id}: {str(e)}")
+
+
+    async def stats(self) -> dict:
+        """Totales de las sesiones residentes (eventos y bytes aproximados)
+
+        Solo agregados: los ids de usuario y sesión no se exponen porque
+        /chat-agent-v2 acepta cualquier user_id/session_id.
+
+        Args: none
+        """
+
+        now = time.monotonic()
+        for key, reason in self._expired(now):
+            await self._delete(key, reason)
+        keys = list(self._last_access.items())
+
+        sessions = 0
+        events = 0
+        size_bytes = 0
+        largest_bytes = 0
+        for (user_id, session_id), _ in keys:
+            session = await self.session_service.get_session(
+                app_name=self.app_name,
+                user_id=user_id,
+                session_id=session_id
+            )
+            if session is None:
+                continue
+            size = len(session.model_dump_json().encode())
+            sessions += 1
+            events += len(session.events)
+            size_bytes += size
+            largest_bytes = max(largest_bytes, size)
+
+        return {
+            "max_sessions": self.max_sessions,
+            "ttl_seconds": self.ttl_seconds,
+            "evicted": self._evicted,
+            "sessions": sessions,
+            "events": events,
+            "size_bytes": size_bytes,
+            "largest_session_bytes": largest_bytes,
+            "oldest_idle_seconds": round(now - keys[0][1], 1) if keys else 0.0,
+        }
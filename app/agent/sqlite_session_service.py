@@ -0,0 +1,482 @@
+import json
+import time
+import uuid
+import asyncio
+import logging
+import sqlite3
+import threading
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any, Optional
+
+from google.adk.events import Event
+from google.adk.sessions import BaseSessionService, Session
+from google.adk.sessions.base_session_service import GetSessionConfig, ListSessionsResponse
+from google.adk.sessions.state import State
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS sessions (
+    app_name TEXT NOT NULL,
+    user_id TEXT NOT NULL,
+    id TEXT NOT NULL,
+    state TEXT NOT NULL DEFAULT '{}',
+    last_seq INTEGER NOT NULL DEFAULT 0,
+    update_time REAL NOT NULL,
+    PRIMARY KEY (app_name, user_id, id)
+);
+CREATE TABLE IF NOT EXISTS events (
+    app_name TEXT NOT NULL,
+    user_id TEXT NOT NULL,
+    session_id TEXT NOT NULL,
+    seq INTEGER NOT NULL,
+    event TEXT NOT NULL,
+    PRIMARY KEY (app_name, user_id, session_id, seq)
+);
+CREATE TABLE IF NOT EXISTS app_states (
+    app_name TEXT PRIMARY KEY,
+    state TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS user_states (
+    app_name TEXT NOT NULL,
+    user_id TEXT NOT NULL,
+    state TEXT NOT NULL,
+    PRIMARY KEY (app_name, user_id)
+);
+"""
+
+SessionKey = tuple[str, str, str]
+
+
+def split_state(delta: dict[str, Any]) -> tuple[dict, dict, dict]:
+    """Separar un delta de estado en estado de la app, del usuario y de la sesión
+
+    Las claves temp: no se guardan.
+
+    Args:
+        delta: Cambios de estado (claves con prefijo app:, user:, temp: o sin prefijo)
+    """
+
+    app_state, user_state, session_state = {}, {}, {}
+    for key, value in (delta or {}).items():
+        if key.startswith(State.APP_PREFIX):
+            app_state[key.removeprefix(State.APP_PREFIX)] = value
+        elif key.startswith(State.USER_PREFIX):
+            user_state[key.removeprefix(State.USER_PREFIX)] = value
+        elif not key.startswith(State.TEMP_PREFIX):
+            session_state[key] = value
+    return app_state, user_state, session_state
+
+
+def merged_state(session_state: dict, app_state: dict, user_state: dict) -> dict:
+    # Vista del estado que ve el agente: la sesión más las claves app: y user:
+    state = dict(session_state)
+    state.update({State.APP_PREFIX + key: value for key, value in app_state.items()})
+    state.update({State.USER_PREFIX + key: value for key, value in user_state.items()})
+    return state
+
+
+class _CachedSession:
+    def __init__(self, session: Session, last_seq: int):
+        self.session = session
+        self.last_seq = last_seq
+
+
+class SQLiteSessionService(BaseSessionService):
+    """Servicio de sesiones ADK en SQLite (modo WAL) compartido entre workers
+
+    Varios procesos del mismo host pueden usar el mismo archivo: cualquier
+    worker puede continuar la conversación de otro.
+
+    - Escrituras en lote: append_event actualiza la sesión en memoria y deja el
+      evento pendiente; una tarea escribe todos los pendientes en una sola
+      transacción (group commit). flush() espera a que estén escritos.
+    - Caché de lectura: las sesiones leídas quedan en un LRU del proceso.
+      get_session solo compara el último número de evento con la base y, si
+      otro worker agregó eventos, lee únicamente los nuevos.
+    - Expiración: cada `sweep_seconds` se eliminan de la base las sesiones
+      que ningún worker actualizó en `ttl_seconds`, sin depender de qué
+      sesiones sigue cada proceso.
+    """
+
+    def __init__(
+        self,
+        path: str | Path,
+        cache_entries: int = 256,
+        flush_delay: float = 0.01,
+        ttl_seconds: float = 1800,
+        sweep_seconds: float = 300,
+    ):
+        self.path = Path(path)
+        self.cache_entries = max(1, cache_entries)
+        self.flush_delay = flush_delay
+        self.ttl_seconds = ttl_seconds
+        self.sweep_seconds = sweep_seconds
+        self._connection: sqlite3.Connection | None = None
+        self._db_lock = threading.Lock()
+        self._cache: OrderedDict[SessionKey, _CachedSession] = OrderedDict()
+        self._pending: list[tuple[SessionKey, Event]] = []
+        self._flush_task: asyncio.Task | None = None
+        self._flush_error: Exception | None = None
+        self._sweep_task: asyncio.Task | None = None
+        self._last_sweep = time.monotonic()
+
+
+    def _db(self) -> sqlite3.Connection:
+        # Se abre en el primer uso; siempre se usa bajo _db_lock desde un hilo
+        if self._connection is None:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            connection = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None, timeout=30)
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=NORMAL")
+            connection.executescript(SCHEMA)
+            self._connection = connection
+        return self._connection
+
+
+    def _run(self, function, *args):
+        def locked():
+            with self._db_lock:
+                return function(self._db(), *args)
+        return asyncio.to_thread(locked)
+
+
+    def _cache_put(self, key: SessionKey, entry: _CachedSession):
+        self._cache[key] = entry
+        self._cache.move_to_end(key)
+        while len(self._cache) > self.cache_entries:
+            self._cache.popitem(last=False)
+
+
+    @staticmethod
+    def _shared_states(db: sqlite3.Connection, app_name: str, user_id: str) -> tuple[dict, dict]:
+        row = db.execute("SELECT state FROM app_states WHERE app_name = ?", (app_name,)).fetchone()
+        app_state = json.loads(row[0]) if row else {}
+        row = db.execute(
+            "SELECT state FROM user_states WHERE app_name = ? AND user_id = ?", (app_name, user_id)
+        ).fetchone()
+        user_state = json.loads(row[0]) if row else {}
+        return app_state, user_state
+
+
+    async def create_session(
+        self,
+        *,
+        app_name: str,
+        user_id: str,
+        state: Optional[dict[str, Any]] = None,
+        session_id: Optional[str] = None,
+    ) -> Session:
+        session_id = (session_id or "").strip() or uuid.uuid4().hex
+        app_delta, user_delta, session_state = split_state(state or {})
+        now = time.time()
+
+        def create(db: sqlite3.Connection):
+            db.execute("BEGIN IMMEDIATE")
+            try:
+                try:
+                    db.execute(
+                        "INSERT INTO sessions (app_name, user_id, id, state, last_seq, update_time) VALUES (?, ?, ?, ?, 0, ?)",
+                        (app_name, user_id, session_id, json.dumps(session_state), now)
+                    )
+                except sqlite3.IntegrityError:
+                    raise ValueError(f"La sesión {session_id} ya existe")
+                self._merge_shared_states(db, app_name, user_id, app_delta, user_delta)
+                app_state, user_state = self._shared_states(db, app_name, user_id)
+                db.execute("COMMIT")
+            except BaseException:
+                db.execute("ROLLBACK")
+                raise
+            return app_state, user_state
+
+        app_state, user_state = await self._run(create)
+        session = Session(
+            id=session_id,
+            app_name=app_name,
+            user_id=user_id,
+            state=merged_state(session_state, app_state, user_state),
+            last_update_time=now,
+        )
+        self._cache_put((app_name, user_id, session_id), _CachedSession(session.model_copy(deep=True), 0))
+        return session
+
+
+    async def get_session(
+        self,
+        *,
+        app_name: str,
+        user_id: str,
+        session_id: str,
+        config: Optional[GetSessionConfig] = None,
+    ) -> Optional[Session]:
+        await self._drain()
+        self._maybe_sweep()
+        key = (app_name, user_id, session_id)
+        cached = self._cache.get(key)
+        known_seq = cached.last_seq if cached else 0
+
+        def load(db: sqlite3.Connection):
+            row = db.execute(
+                "SELECT state, last_seq, update_time FROM sessions WHERE app_name = ? AND user_id = ? AND id = ?",
+                key
+            ).fetchone()
+            if row is None:
+                return None
+            events = []
+            if row[1] != known_seq or cached is None:
+                start = known_seq if cached is not None else 0
+                events = [
+                    event for (event,) in db.execute(
+                        "SELECT event FROM events WHERE app_name = ? AND user_id = ? AND session_id = ? AND seq > ? ORDER BY seq",
+                        (*key, start)
+                    )
+                ]
+            return row, events, self._shared_states(db, app_name, user_id)
+
+        loaded = await self._run(load)
+        if loaded is None:
+            self._cache.pop(key, None)
+            return None
+
+        (state, last_seq, update_time), new_events, (app_state, user_state) = loaded
+        if cached is None or last_seq < known_seq:
+            # Sin caché (o la sesión se recreó en otro worker): construir desde cero
+            cached = _CachedSession(
+                Session(id=session_id, app_name=app_name, user_id=user_id, state={}, events=[], last_update_time=update_time),
+                0
+            )
+        cached.session.events.extend(Event.model_validate_json(event) for event in new_events)
+        cached.session.state = merged_state(json.loads(state), app_state, user_state)
+        cached.session.last_update_time = update_time
+        cached.last_seq = last_seq
+        self._cache_put(key, cached)
+
+        session = cached.session.model_copy(deep=True)
+        if config:
+            if config.num_recent_events:
+                session.events = session.events[-config.num_recent_events:]
+            if config.after_timestamp:
+                session.events = [event for event in session.events if event.timestamp >= config.after_timestamp]
+        return session
+
+
+    async def list_sessions(self, *, app_name: str, user_id: Optional[str] = None) -> ListSessionsResponse:
+        await self._drain()
+
+        def load(db: sqlite3.Connection):
+            if user_id is None:
+                return db.execute(
+                    "SELECT user_id, id, update_time FROM sessions WHERE app_name = ?", (app_name,)
+                ).fetchall()
+            return db.execute(
+                "SELECT user_id, id, update_time FROM sessions WHERE app_name = ? AND user_id = ?", (app_name, user_id)
+            ).fetchall()
+
+        rows = await self._run(load)
+        return ListSessionsResponse(sessions=[
+            Session(id=session_id, app_name=app_name, user_id=owner, state={}, events=[], last_update_time=update_time)
+            for owner, session_id, update_time in rows
+        ])
+
+
+    async def delete_session(self, *, app_name: str, user_id: str, session_id: str) -> None:
+        await self._drain()
+        key = (app_name, user_id, session_id)
+
+        def delete(db: sqlite3.Connection):
+            db.execute("BEGIN IMMEDIATE")
+            try:
+                db.execute("DELETE FROM events WHERE app_name = ? AND user_id = ? AND session_id = ?", key)
+                db.execute("DELETE FROM sessions WHERE app_name = ? AND user_id = ? AND id = ?", key)
+                db.execute("COMMIT")
+            except BaseException:
+                db.execute("ROLLBACK")
+                raise
+
+        await self._run(delete)
+        self._cache.pop(key, None)
+
+
+    async def append_event(self, session: Session, event: Event) -> Event:
+        event = await super().append_event(session, event)
+        if event.partial:
+            return event
+
+        key = (session.app_name, session.user_id, session.id)
+        cached = self._cache.get(key)
+        if cached is not None and cached.session is not session:
+            cached.session.events.append(event)
+            if event.actions and event.actions.state_delta:
+                for state_key, value in event.actions.state_delta.items():
+                    if not state_key.startswith(State.TEMP_PREFIX):
+                        cached.session.state[state_key] = value
+            cached.session.last_update_time = event.timestamp
+
+        self._pending.append((key, event))
+        if self._flush_task is None or self._flush_task.done():
+            self._flush_task = asyncio.create_task(self._flush_pending())
+        return event
+
+
+    async def _flush_pending(self):
+        # Esperar un poco para juntar los eventos que llegan casi juntos
+        await asyncio.sleep(self.flush_delay)
+        while self._pending:
+            batch, self._pending = self._pending, []
+            try:
+                written = await self._run(self._write_events, batch)
+            except Exception as e:
+                # Se reintentan en la próxima escritura o flush(); flush() informa el error una vez
+                self._pending = batch + self._pending
+                self._flush_error = e
+                logging.error(f"Error al guardar {len(batch)} eventos de sesión: {str(e)}")
+                return
+            self._flush_error = None
+
+            appended: dict[SessionKey, int] = {}
+            for key, _ in batch:
+                appended[key] = appended.get(key, 0) + 1
+            for key, last_seq in written.items():
+                cached = self._cache.get(key)
+                if cached is None:
+                    continue
+                if cached.last_seq + appended[key] == last_seq:
+                    cached.last_seq = last_seq
+                else:
+                    # Otro worker escribió en la misma sesión: la próxima lectura la reconstruye
+                    self._cache.pop(key, None)
+
+
+    def _write_events(self, db: sqlite3.Connection, batch: list[tuple[SessionKey, Event]]) -> dict[SessionKey, int]:
+        events_by_session: dict[SessionKey, list[Event]] = {}
+        for key, event in batch:
+            events_by_session.setdefault(key, []).append(event)
+
+        written = {}
+        db.execute("BEGIN IMMEDIATE")
+        try:
+            for key, events in events_by_session.items():
+                app_name, user_id, _ = key
+                row = db.execute(
+                    "SELECT state, last_seq FROM sessions WHERE app_name = ? AND user_id = ? AND id = ?", key
+                ).fetchone()
+                if row is None:
+                    logging.warning(f"Se descartaron eventos de la sesión eliminada {key}")
+                    continue
+
+                session_state, last_seq = json.loads(row[0]), row[1]
+                app_delta, user_delta = {}, {}
+                for event in events:
+                    last_seq += 1
+                    db.execute(
+                        "INSERT INTO events (app_name, user_id, session_id, seq, event) VALUES (?, ?, ?, ?, ?)",
+                        (*key, last_seq, event.model_dump_json(exclude_none=True))
+                    )
+                    if event.actions and event.actions.state_delta:
+                        app_part, user_part, session_part = split_state(event.actions.state_delta)
+                        app_delta.update(app_part)
+                        user_delta.update(user_part)
+                        session_state.update(session_part)
+
+                db.execute(
+                    "UPDATE sessions SET state = ?, last_seq = ?, update_time = ? WHERE app_name = ? AND user_id = ? AND id = ?",
+                    (json.dumps(session_state), last_seq, max(event.timestamp for event in events), *key)
+                )
+                self._merge_shared_states(db, app_name, user_id, app_delta, user_delta)
+                written[key] = last_seq
+            db.execute("COMMIT")
+        except BaseException:
+            db.execute("ROLLBACK")
+            raise
+        return written
+
+
+    @staticmethod
+    def _merge_shared_states(db: sqlite3.Connection, app_name: str, user_id: str, app_delta: dict, user_delta: dict):
+        if app_delta:
+            row = db.execute("SELECT state FROM app_states WHERE app_name = ?", (app_name,)).fetchone()
+            state = {**(json.loads(row[0]) if row else {}), **app_delta}
+            db.execute("INSERT OR REPLACE INTO app_states (app_name, state) VALUES (?, ?)", (app_name, json.dumps(state)))
+        if user_delta:
+            row = db.execute(
+                "SELECT state FROM user_states WHERE app_name = ? AND user_id = ?", (app_name, user_id)
+            ).fetchone()
+            state = {**(json.loads(row[0]) if row else {}), **user_delta}
+            db.execute(
+                "INSERT OR REPLACE INTO user_states (app_name, user_id, state) VALUES (?, ?, ?)",
+                (app_name, user_id, json.dumps(state))
+            )
+
+
+    async def _drain(self):
+        # Intentar escribir los pendientes; si falla, los eventos siguen en
+        # memoria y las lecturas de este proceso usan la sesión en caché
+        if self._pending and (self._flush_task is None or self._flush_task.done()):
+            self._flush_task = asyncio.create_task(self._flush_pending())
+        if self._flush_task is not None and not self._flush_task.done():
+            await asyncio.shield(self._flush_task)
+
+
+    async def flush(self):
+        """Esperar a que los eventos pendientes queden escritos
+
+        Si la última escritura falló se lanza el error una vez; los eventos
+        quedan pendientes y se reintentan en la próxima escritura.
+
+        Args: none
+        """
+
+        await self._drain()
+        if self._flush_error is not None:
+            error, self._flush_error = self._flush_error, None
+            raise error
+
+
+    def _maybe_sweep(self):
+        if self.ttl_seconds <= 0 or time.monotonic() - self._last_sweep < self.sweep_seconds:
+            return
+        if self._sweep_task is not None and not self._sweep_task.done():
+            return
+        self._last_sweep = time.monotonic()
+        self._sweep_task = asyncio.create_task(self.sweep_expired())
+
+
+    async def sweep_expired(self) -> int:
+        """Eliminar las sesiones que ningún worker actualizó en `ttl_seconds`
+
+        Devuelve la cantidad de sesiones eliminadas.
+
+        Args: none
+        """
+
+        cutoff = time.time() - self.ttl_seconds
+
+        def sweep(db: sqlite3.Connection) -> int:
+            db.execute("BEGIN IMMEDIATE")
+            try:
+                db.execute(
+                    "DELETE FROM events WHERE (app_name, user_id, session_id) IN "
+                    "(SELECT app_name, user_id, id FROM sessions WHERE update_time < ?)",
+                    (cutoff,)
+                )
+                deleted = db.execute("DELETE FROM sessions WHERE update_time < ?", (cutoff,)).rowcount
+                db.execute("COMMIT")
+            except BaseException:
+                db.execute("ROLLBACK")
+                raise
+            return deleted
+
+        try:
+            deleted = await self._run(sweep)
+        except Exception as e:
+            logging.error(f"Error al eliminar las sesiones vencidas: {str(e)}")
+            return 0
+        if deleted:
+            logging.info(f"Se eliminaron {deleted} sesiones sin uso en {self.ttl_seconds:g}s")
+        return deleted
+
+
+    def close(self):
+        with self._db_lock:
+            if self._connection is not None:
+                self._connection.close()
+                self._connection = None
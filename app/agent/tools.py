@@ -1,232 +1,224 @@
-import logging
-import mysql.connector
-from mysql.connector import Error
+import json
+import asyncio
+import functools
+import contextvars
+from concurrent.futures import ThreadPoolExecutor
 from dotenv import load_dotenv
 from app.agent.schemas import CharType, Data, Graphic
-from typing import List
-import os
+from app.db.query import store_sql_query
+from app.db.result_store import result_store, StoredResult
+from app.db.rollups import movement_summary
+from app.agent.calculations import calculate
+from app.agent.charts import point_budget, prepare_series
+from app.metrics import span
+from app.config import config
+from typing import List, Optional
 
 load_dotenv()
 
-# Cargar variables de entorno desde .env
-DB_HOST = os.getenv("DB_HOST", "localhost")
-DB_USER = os.getenv("DB_USER", "root")
-DB_PASSWORD = os.getenv("DB_PASSWORD", "password")
-DB_NAME = os.getenv("DB_NAME", "mi_base_de_datos")
+# Las consultas bloqueantes (mysql.connector) corren en hilos de trabajo para
+# no detener el event loop; más hilos que conexiones del pool solo esperarían
+query_executor = ThreadPoolExecutor(max_workers=max(1, config.DB_POOL_SIZE), thread_name_prefix="agent-sql")
+
+
+async def run_blocking(function, *args):
+    # Con el contexto actual para que los spans queden en la petición que los originó
+    context = contextvars.copy_context()
+    return await asyncio.get_running_loop().run_in_executor(
+        query_executor, functools.partial(context.run, function, *args)
+    )
 
-def connect_to_database(host: str, user: str, password: str, database: str):
-    """
-    Conecta a una base de datos MySQL y devuelve la conexión.
 
-    :param host: Dirección del servidor MySQL (e.g., 'localhost').
-    :param user: Nombre de usuario para la conexión.
-    :param password: Contraseña del usuario.
-    :param database: Nombre de la base de datos a la que se desea conectar.
-    :return: Objeto de conexión si la conexión es exitosa, None en caso de error.
+async def execute_sql_query(query: str) -> dict:
     """
-    try:
-        connection = mysql.connector.connect(
-            host=host, user=user, password=password, database=database
-        )
-        if connection.is_connected():
-            logging.info("Conexión a la base de datos MySQL exitosa.")
-            return connection
-    except Error as e:
-        logging.error(f"Error al conectar a la base de datos: {e}")
-        return None
+    Ejecuta una consulta SQL de lectura en la base de datos de inventario de
+    Cerámica de Altura. El resultado completo queda guardado en el servidor y
+    se devuelve su "result_id" con una vista previa de las primeras filas.
 
-    return None
+    Las tablas, columnas y relaciones (JOINs) relevantes para la pregunta se
+    indican en las instrucciones del sistema.
 
+    Para graficar o calcular sobre el resultado, pasar el "result_id" a
+    graphic_recomendation, calculate_data o format_insight en lugar de copiar
+    las filas. Si la vista previa trae "columns", "types" y "rows", cada fila
+    de "rows" es una lista de valores en el mismo orden que "columns".
 
-def execute_sql_query(query: str) -> dict:
-    """
-    Ejecuta una consulta SQL y devuelve los resultados en formato de diccionario.
-
-    Descripción de la tabla usuarios:
-    - id: Identificador único del usuario (int)
-    - nombre: Nombre del usuario (str)
-    - role_id: Identificador del rol asociado (int)
-    - created_at: Fecha de creación del usuario (datetime)
-
-    Descripción de la tabla categorias
-    - id: Identificador único de la categoría (int)
-    - description: Descripción de la categoría (str)
-    - created_at: Fecha de creación de la categoría (datetime)
-
-    Descripción de la tabla detalle_entradas
-    - id: Identificador único del detalle de entrada (int)
-    - entrada_id: Identificador de la entrada asociada (int)
-    - producto_id: Identificador del producto asociado (int)
-    - cantidad_ingresada: Cantidad ingresada del producto (decimal 10,3)
-    - created_at: Fecha de creación del detalle de entrada (datetime)
-
-    Descripción de la tabla detalle_salidas
-    - id: Identificador único del detalle de salida (int)
-    - salida_id: Identificador de la salida asociada (int)
-    - producto_id: Identificador del producto asociado (int)
-    - cantidad_salida: Cantidad salida del producto (decimal 10,3)
-    - created_at: Fecha de creación del detalle de salida (datetime)
-
-    Descripción de la tabla entradas
-    - id: Identificador único de la entrada (int)
-    - establecimiento_id: Identificador del establecimiento asociado (int)
-    - proveedor_id: Identificador del proveedor asociado (int, nullable)
-    - usuario_id: Identificador del usuario que registró la entrada (int)
-    - tipo_entrada: Tipo de entrada (str)
-    - created_at: Fecha de creación de la entrada (datetime)
-
-    Descripción de la tabla establecimientos
-    - id: Identificador único del establecimiento (int)
-    - nombre: Nombre del establecimiento (str)
-    - direccion: Dirección del establecimiento (str)
-    - created_at: Fecha de creación del establecimiento (datetime)
-
-    Descripción de la tabla productos
-    - id: Identificador único del producto (int)
-    - cod_producto: Código único del producto (str)
-    - nombre: Nombre del producto (str)
-    - formato: Formato o presentación del producto (str)
-    - categoria_id: Identificador de la categoría asociada (int)
-    - precio: Precio del producto (decimal 10,2)
-    - activado: Indica si el producto está activo (boolean)
-    - created_at: Fecha de creación del producto (datetime)
-
-    Descripción de la tabla proveedores
-    - id: Identificador único del proveedor (int)
-    - nombre: Nombre del proveedor (str)
-    - created_at: Fecha de creación del proveedor (datetime)
-
-    Descripción de la tabla roles
-    - id: Identificador único del rol (int)
-    - description: Descripción del rol (str)
-    - created_at: Fecha de creación del rol (datetime)
-
-    Descripción de la tabla salidas
-    - id: Identificador único de la salida (int)
-    - establecimiento_id: Identificador del establecimiento asociado (int)
-    - usuario_id: Identificador del usuario que registró la salida (int)
-    - tipo_salida: Tipo de salida (str)
-    - created_at: Fecha de creación de la salida (datetime)
-
-    Descripción de la tabla stock
-    - id: Identificador único del registro de stock (int)
-    - product_id: Identificador del producto asociado (int)
-    - establecimiento_id: Identificador del establecimiento asociado (int)
-    - cantidad: Cantidad disponible del producto (int)
-    - created_at: Fecha de creación del registro de stock (datetime)
+    Solo se aceptan consultas de lectura. Si la consulta se rechaza (por
+    ejemplo por examinar demasiadas filas) el error trae "reason" y "hint"
+    para corregirla.
 
     Args:
         query: Consulta SQL a ejecutar.
     Returns:
-        Diccionario con los resultados de la consulta.
+        Diccionario con result_id, row_count, columns y preview.
     """
-    try:
-        connection = connect_to_database(
-            host=DB_HOST,
-            user=DB_USER,
-            password=DB_PASSWORD,
-            database=DB_NAME,
+    with span("agent.tool", tool="execute_sql_query") as tool_span:
+        result = await run_blocking(store_sql_query, query)
+        tool_span.set(rows=result.get("row_count"))
+        return result
+
+
+def _get_result(result_id: str) -> StoredResult:
+    result = result_store.get(result_id)
+    if result is None:
+        # Los resultados son del proceso: expiró o lo creó otro worker en un turno anterior
+        raise LookupError(
+            f"El resultado '{result_id}' no está disponible (expiró o es de un turno anterior). "
+            "Vuelve a ejecutar execute_sql_query y usa el result_id nuevo."
         )
+    return result
+
+async def get_movement_summary(
+    start: str,
+    end: str,
+    granularity: str = "mes",
+    group_by: Optional[List[str]] = None,
+    producto_id: Optional[int] = None,
+    establecimiento_id: Optional[int] = None,
+    categoria_id: Optional[int] = None,
+) -> dict:
+    """
+    Reporte de entradas y salidas (cantidades) desde las tablas resumen ya
+    agregadas. Usar en lugar de sumar detalle_entradas/detalle_salidas para
+    reportes por fecha, producto, establecimiento o categoría.
 
-        if connection:
-            cursor = connection.cursor(dictionary=True)
-            cursor.execute(query)
-            results = cursor.fetchall()
-
-            cursor.close()
-            connection.close()
-
-            return {"success": True, "data": results}
-
-    except Error as e:
-        return {"success": False, "error": str(e)}
-
-    return {
-        "success": False,
-        "error": "No se pudo establecer conexión con la base de datos",
-    }
+    Args:
+        start: Fecha inicial incluida (AAAA-MM-DD).
+        end: Fecha final incluida (AAAA-MM-DD).
+        granularity: "dia" o "mes".
+        group_by: Agrupar por "fecha", "producto", "establecimiento" y/o "categoria".
+        producto_id: Filtrar por producto (opcional).
+        establecimiento_id: Filtrar por establecimiento (opcional).
+        categoria_id: Filtrar por categoría (opcional).
+    Returns:
+        Diccionario con cantidad_entrada y cantidad_salida por grupo.
+    """
+    with span("agent.tool", tool="get_movement_summary"):
+        return await run_blocking(
+            movement_summary, start, end, granularity, group_by, producto_id, establecimiento_id, categoria_id
+        )
 
-def graphic_recomendation(type_g: CharType, data: List[Data] ):
+def graphic_recomendation(
+    type_g: CharType,
+    data: Optional[List[Data]] = None,
+    result_id: Optional[str] = None,
+    label_column: Optional[str] = None,
+    value_column: Optional[str] = None,
+):
     """
     Genera una recomendación de gráfico.
-    
+
+    Preferir result_id (de execute_sql_query) en lugar de escribir los datos:
+    las etiquetas y valores se leen del resultado guardado. Las series largas
+    se reducen automáticamente (lineas por submuestreo, barras y pastel con
+    las categorías mayores y el resto en "Otros").
+
     Args:
         type_g: Tipo de gráfico (barras, lineas, pastel)
-        data: Lista de objetos {description: str, value: str/int}
-        
+        data: Lista de objetos {description: str, value: str/int} (si no hay result_id)
+        result_id: Id del resultado de execute_sql_query
+        label_column: Columna con las etiquetas (por defecto la primera no numérica)
+        value_column: Columna con los valores (por defecto la primera numérica)
+
     Returns:
-        JSON string con el gráfico completo
+        JSON string con el gráfico completo, o {"success": false, "error": ...} como JSON string
     """
-    return Graphic(type=type_g, data=data).model_dump_json()
-
-def format_insight(insight: str):
+    with span("agent.tool", tool="graphic_recomendation") as tool_span:
+        if result_id:
+            try:
+                result = _get_result(result_id)
+                label_column = label_column or result.first_column(numeric=False) or result.columns[0]
+                value_column = value_column or result.first_column(numeric=True) or result.columns[-1]
+                labels = [str(label) for label in result.column(label_column)]
+                values = result.column(value_column)
+            except (LookupError, ValueError) as e:
+                # Mismo tipo que el gráfico (JSON string) para que el cliente lo lea igual
+                return json.dumps({"success": False, "error": str(e)}, ensure_ascii=False)
+        else:
+            # El modelo puede enviar los puntos como diccionarios o como JSON
+            parsed = Graphic(type=type_g, data=data or []).data
+            labels = [item.description for item in parsed]
+            values = [item.value for item in parsed]
+        tool_span.set(rows=len(labels))
+
+        # Mantener el gráfico dentro del presupuesto de puntos sin importar el tamaño del resultado
+        chart_type = CharType(type_g).value
+        budget = point_budget(chart_type, config.CHART_MAX_LINE_POINTS, config.CHART_MAX_BARS, config.CHART_MAX_SLICES)
+        labels, values = prepare_series(chart_type, labels, values, budget)
+        data = [Data(description=label, value=value) for label, value in zip(labels, values)]
+        graphic = Graphic(type=type_g, data=data).model_dump_json()
+        tool_span.set(bytes=len(graphic.encode()))
+        return graphic
+
+def format_insight(insight: str, result_id: Optional[str] = None):
     """
     SIEMPRE que se pida un insight sobre la información de los datos
     obtenidos con el tool execute_sql_query, usar este método.
+
+    Args:
+        insight: Texto del insight
+        result_id: Id del resultado de execute_sql_query en el que se basa (opcional)
     """
-    return insight
+    if not result_id:
+        return insight
+
+    result = result_store.get(result_id)
+    if result is None:
+        return insight
+    # Referencia al resultado para que el cliente pueda mostrar los datos junto al insight
+    return {
+        "insight": insight,
+        "result": {"result_id": result.result_id, "columns": result.columns, "row_count": result.total_rows},
+    }
 
 
-def calculate_data(values: List[float], operation: str) -> dict:
+def calculate_data(
+    operations: List[str],
+    values: Optional[List[float]] = None,
+    group_keys: Optional[List[str]] = None,
+    result_id: Optional[str] = None,
+    value_column: Optional[str] = None,
+    group_column: Optional[str] = None,
+) -> dict:
     """
-    Realiza cálculos matemáticos sobre un conjunto de valores numéricos.
-    
-    Útil para procesar datos obtenidos del tool execute_sql_query.
-    
+    Calcula varias estadísticas sobre un conjunto de valores numéricos en una
+    sola llamada (pedir todas las operaciones necesarias juntas).
+
+    Útil para procesar datos obtenidos del tool execute_sql_query: preferir
+    result_id y value_column en lugar de copiar los valores.
+
     Operaciones soportadas:
-    - 'sum': Suma todos los valores
-    - 'average': Calcula el promedio
-    - 'min': Encuentra el valor mínimo
-    - 'max': Encuentra el valor máximo
-    - 'product': Multiplica todos los valores
-    - 'variance': Calcula la varianza
-    - 'std_dev': Calcula la desviación estándar
-    - 'median': Calcula la mediana
-    
-    :param values: Lista de valores numéricos a procesar
-    :param operation: Operación a realizar (sum, average, min, max, product, variance, std_dev, median)
-    :return: Diccionario con el resultado del cálculo
-    """
-    try:
-        if not values or len(values) == 0:
-            return {"success": False, "error": "La lista de valores no puede estar vacía"}
-        
-        operation = operation.lower().strip()
-        
-        if operation == 'sum':
-            result = sum(values)
-        elif operation == 'average':
-            result = sum(values) / len(values)
-        elif operation == 'min':
-            result = min(values)
-        elif operation == 'max':
-            result = max(values)
-        elif operation == 'product':
-            result = 1
-            for v in values:
-                result *= v
-        elif operation == 'variance':
-            mean = sum(values) / len(values)
-            variance = sum((x - mean) ** 2 for x in values) / len(values)
-            result = variance
-        elif operation == 'std_dev':
-            mean = sum(values) / len(values)
-            variance = sum((x - mean) ** 2 for x in values) / len(values)
-            result = variance ** 0.5
-        elif operation == 'median':
-            sorted_values = sorted(values)
-            n = len(sorted_values)
-            if n % 2 == 0:
-                result = (sorted_values[n//2 - 1] + sorted_values[n//2]) / 2
-            else:
-                result = sorted_values[n//2]
-        else:
-            return {"success": False, "error": f"Operación '{operation}' no soportada. Use: sum, average, min, max, product, variance, std_dev, median"}
-        
-        return {"success": True, "operation": operation, "result": result, "count": len(values)}
-    
-    except (ValueError, TypeError) as e:
-        return {"success": False, "error": f"Error al procesar los valores: {str(e)}"}
-    except Exception as e:
-        return {"success": False, "error": f"Error inesperado: {str(e)}"}
+    - 'count', 'sum', 'average', 'min', 'max', 'range'
+    - 'variance', 'std_dev', 'median', 'product'
+    - 'p<N>': Percentil N, por ejemplo 'p90'
+    - 'total_growth': Crecimiento entre el primer y el último valor
+    - 'cumsum': Suma acumulada (serie)
+    - 'growth_rate': Variación porcentual entre valores consecutivos (serie)
+    - 'profile': Perfil completo (todas las escalares y percentiles 25/50/75/90)
 
+    Args:
+        operations: Operaciones a realizar, por ejemplo ["sum", "average", "p90"]
+        values: Lista de valores numéricos a procesar (si no hay result_id)
+        group_keys: Clave de cada valor para agrupar los resultados (opcional,
+            misma cantidad de elementos que values)
+        result_id: Id del resultado de execute_sql_query
+        value_column: Columna del resultado con los valores (por defecto la primera numérica)
+        group_column: Columna del resultado para agrupar (opcional)
+    Returns:
+        Diccionario con el resultado de cada operación (o de cada grupo)
+    """
+    with span("agent.tool", tool="calculate_data") as tool_span:
+        try:
+            if result_id:
+                result = _get_result(result_id)
+                value_column = value_column or result.first_column(numeric=True)
+                if value_column is None:
+                    return {"success": False, "error": f"El resultado no tiene columnas numéricas: {', '.join(result.columns)}"}
+                values = result.column(value_column)
+                group_keys = result.column(group_column) if group_column else None
+            tool_span.set(rows=len(values or []))
+            return calculate(values or [], operations, keys=group_keys, max_series=config.CALC_MAX_SERIES)
+        except (LookupError, ValueError) as e:
+            return {"success": False, "error": str(e)}
+        except Exception as e:
+            return {"success": False, "error": f"Error inesperado: {str(e)}"}
@@ -1,22 +1,112 @@
 from dotenv import load_dotenv
-from fastapi.responses import StreamingResponse
-from app.mcp_custom.mcp_client import MCPClient, procesar_mensaje, procesar_mensaje_stream
-from fastapi import HTTPException, status
-from app.api.v1.agent.schemas import ChatAgentRequest, ChatAgentResponse
+from fastapi import HTTPException, Header, status
+from app.api.v1.agent.schemas import ChatAgentRequest, ChatAgentResponse, SessionsResponse
+from app.api.v1.agent.streaming import event_stream_response
 from app.logger import logger
-from app.agent.agent import init_agent, call_agent_async, USER_ID, SESSION_ID
+from app.config import config
+from app.db.pool import db_pool
+from app.db.query import query_cache
+from app.db.guard import query_guard
+from app.db.result_store import result_store
+from app.mcp_custom.plan_cache import plan_cache
+from app.metrics import span
+from app.admission import AdmissionRejected, Limiter, Ticket, chat_limiter, llm_limiter, mcp_limiter
 
 load_dotenv()
 
+
+def rejection_error(error: AdmissionRejected) -> HTTPException:
+    # 429 con la cola llena, 503 si venció el plazo de espera
+    return HTTPException(
+        status_code=error.status_code,
+        detail=str(error),
+        headers={"Retry-After": str(error.retry_after)}
+    )
+
+
+# google.adk/litellm (agente ADK) y openai/mcp (cliente MCP) se importan en el
+# primer uso de cada camino o en el warm-up del lifespan, no al importar la app
+
 class AgetController:
     def __init__(self):
-        self.client_mcp = MCPClient()
-        self.runner = None
+        self._session_store = None
+        self._runner_pool = None
+
+    @property
+    def session_store(self):
+        if self._session_store is None:
+            from app.agent.agent import APP_NAME
+            from app.agent.session_store import SessionStore
+            if config.ADK_SESSION_BACKEND == "sqlite":
+                from app.agent.sqlite_session_service import SQLiteSessionService
+                session_service = SQLiteSessionService(
+                    config.ADK_SESSION_DB_PATH,
+                    cache_entries=config.ADK_SESSION_CACHE_ENTRIES,
+                    flush_delay=config.ADK_SESSION_FLUSH_MS / 1000,
+                    ttl_seconds=config.ADK_SESSION_TTL,
+                    sweep_seconds=config.ADK_SESSION_SWEEP_SECONDS
+                )
+            else:
+                from google.adk.sessions import InMemorySessionService
+                session_service = InMemorySessionService()
+            self._session_store = SessionStore(
+                session_service,
+                app_name=APP_NAME,
+                max_sessions=config.ADK_MAX_SESSIONS,
+                ttl_seconds=config.ADK_SESSION_TTL,
+                shared_storage=config.ADK_SESSION_BACKEND != "memory"
+            )
+        return self._session_store
+
+    @property
+    def runner_pool(self):
+        if self._runner_pool is None:
+            from app.agent.agent import init_agent
+            from app.agent.runner_pool import RunnerPool
+            self._runner_pool = RunnerPool(
+                lambda: init_agent(self.session_store.session_service),
+                size=config.ADK_RUNNER_POOL_SIZE
+            )
+        return self._runner_pool
 
-    async def get_runner(self):
-        if self.runner is None:
-            self.runner = await init_agent()
-        return self.runner
+    async def warm_up(self):
+        """Cargar el agente ADK y el cliente MCP antes de la primera petición
+
+        Args: none
+        """
+
+        from app.mcp_custom.llm import get_llm_client
+        from app.agent.agent import warm_up_model
+        await self.runner_pool.start()
+        if config.ADK_WARMUP_MODEL:
+            await warm_up_model()
+        import app.mcp_custom.mcp_client # Carga openai/mcp antes del primer MCPClient
+        get_llm_client()
+
+    async def close(self):
+        """Guardar los eventos de sesión pendientes y cerrar el servicio de sesiones
+
+        Args: none
+        """
+
+        if self._session_store is None:
+            return
+        session_service = self._session_store.session_service
+        if hasattr(session_service, "flush"):
+            await session_service.flush()
+            session_service.close()
+
+    async def admit(self, limiter: Limiter = chat_limiter) -> Ticket:
+        """Tomar un cupo o rechazar la petición con 429/503 y Retry-After
+
+        Args:
+            limiter: Limitador del que se toma el cupo (por defecto el de chat)
+        """
+
+        try:
+            return await limiter.acquire()
+        except AdmissionRejected as e:
+            raise rejection_error(e)
 
     async def chat_agent_controller(self, consulta: ChatAgentRequest) -> ChatAgentResponse:
         """Controlador para manejar la consulta del Chat Agent
@@ -25,51 +115,123 @@ class AgetController:
             consulta: Consulta del usuario
         """
 
+        from app.mcp_custom.mcp_client import MCPClient, procesar_mensaje
+        from app.mcp_custom.mcp_pool import mcp_pool
+
+        ticket = await self.admit()
         client = MCPClient()
 
         try:
             logger.info(f"Procesando consulta del Chat Agent... {consulta.mensaje}")
-            respuesta = await procesar_mensaje(client, consulta.mensaje, './app/mcp/servers/mcp_server_sql.py')
+            with span("chat.process"):
+                respuesta = await procesar_mensaje(client, consulta.mensaje, mcp_pool)
             return ChatAgentResponse(
                 respuesta=respuesta
             )
+        except AdmissionRejected as e:
+            raise rejection_error(e)
         except Exception as e:
             raise HTTPException(
                 status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
                 detail=f"Error al procesar la consulta: {str(e)}"
             )
+        finally:
+            ticket.release()
 
-    async def chat_agent_stream_controller(self, consulta: ChatAgentRequest):
+    async def chat_agent_stream_controller(self, consulta: ChatAgentRequest, accept: str | None = Header(default=None)):
         """Controlador para manejar la consulta del Chat Agent en forma stream
 
         Args:
             consulta: Consulta del usuario
+            accept: text/event-stream (SSE), application/x-ndjson o texto plano con prefijos [[...]]
         """
 
+        from app.mcp_custom.mcp_client import MCPClient, DEFAULT_USER_ID, conversation_store, procesar_mensaje_stream
+        from app.mcp_custom.mcp_pool import mcp_pool
+
+        # Los cupos los libera la respuesta al terminar de enviarse (o si el cliente se
+        # desconecta). El de MCP se toma aquí para rechazar con 429/503 antes de los headers
+        ticket = await self.admit()
+        try:
+            mcp_ticket = await self.admit(mcp_limiter)
+        except HTTPException:
+            ticket.release()
+            raise
         try:
             logger.info(f"Procesando consulta del Chat Agent en forma stream... {consulta.mensaje}")
-            return StreamingResponse(procesar_mensaje_stream(self.client_mcp, consulta.mensaje, './app/mcp/servers/mcp_server_sql.py'), media_type="text/plain")
+            # Un cliente por petición (la sesión MCP del pool no se comparte) que
+            # continúa el historial de la conversación del usuario
+            conversation = conversation_store.get(consulta.user_id or DEFAULT_USER_ID, consulta.session_id)
+            client = MCPClient(history=conversation.history)
+            return event_stream_response(
+                procesar_mensaje_stream(client, consulta.mensaje, mcp_pool, lock=conversation.lock),
+                accept,
+                headers={"X-User-Id": conversation.user_id, "X-Session-Id": conversation.session_id},
+                tickets=[ticket, mcp_ticket]
+            )
         except Exception as e:
+            mcp_ticket.release()
+            ticket.release()
             raise HTTPException(
                 status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
                 detail=f"Error al procesar la consulta en forma stream: {str(e)}"
             )
 
-    async def chat_agent_controller_v2(self, consulta: ChatAgentRequest):
+    async def chat_agent_controller_v2(self, consulta: ChatAgentRequest, accept: str | None = Header(default=None)):
         """Controlador para manejar la consulta del Chat Agent en forma stream
 
         Args:
             consulta: Consulta del usuario
+            accept: text/event-stream (SSE), application/x-ndjson o texto plano con prefijos [[...]]
         """
 
+        from app.agent.agent import call_agent_async, USER_ID
+
+        ticket = await self.admit()
         try:
             logger.info(f"Procesando consulta del Chat Agent ADK... {consulta.mensaje}")
 
-            runner = await self.get_runner() 
+            await self.runner_pool.start()
 
-            return StreamingResponse(call_agent_async(consulta.mensaje, runner=runner, user_id=USER_ID, session_id=SESSION_ID), media_type="text/plain")
+            user_id = consulta.user_id or USER_ID
+            with span("session.ensure"):
+                session = await self.session_store.ensure_session(user_id, consulta.session_id)
+
+            events = self.runner_pool.run(
+                lambda runner: call_agent_async(consulta.mensaje, runner=runner, user_id=user_id, session_id=session.id)
+            )
+            return event_stream_response(
+                events,
+                accept,
+                headers={"X-User-Id": user_id, "X-Session-Id": session.id},
+                tickets=[ticket]
+            )
         except Exception as e:
+            ticket.release()
             raise HTTPException(
                 status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
                 detail=f"Error al procesar la consulta: {str(e)}"
             )
+
+    async def sessions_controller(self) -> SessionsResponse:
+        """Controlador para consultar el tamaño total de las sesiones ADK residentes (sin ids)
+
+        Args: none
+        """
+
+        return SessionsResponse(**await self.session_store.stats())
+
+    async def db_stats_controller(self) -> dict:
+        """Controlador para consultar los contadores del pool, las cachés, el almacén de resultados, el guard SQL y la admisión
+
+        Args: none
+        """
+
+        return {
+            "pool": db_pool.stats(),
+            "cache": query_cache.stats(),
+            "plans": plan_cache.stats(),
+            "results": result_store.stats(),
+            "guard": query_guard.stats(),
+            "admission": {limiter.name: limiter.stats() for limiter in (chat_limiter, llm_limiter, mcp_limiter)},
+        }
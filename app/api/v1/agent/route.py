@@ -1,5 +1,5 @@
 from fastapi import APIRouter
-from app.api.v1.agent.schemas import ChatAgentResponse, ChatAgentStreamResponse
+from app.api.v1.agent.schemas import ChatAgentResponse, ChatAgentStreamResponse, SessionsResponse
 from app.api.v1.agent.controller import AgetController
 
 # Crear una instancia del router de FastAPI 
@@ -12,3 +12,5 @@ agent_controller = AgetController()
 router_agent_chat.post("/chat-agent", response_model=ChatAgentResponse)(agent_controller.chat_agent_controller)
 router_agent_chat.post("/chat-agent-stream", response_model=ChatAgentStreamResponse)(agent_controller.chat_agent_stream_controller)
 router_agent_chat.post("/chat-agent-v2", response_model=ChatAgentStreamResponse)(agent_controller.chat_agent_controller_v2)
+router_agent_chat.get("/chat-agent-v2/sessions", response_model=SessionsResponse)(agent_controller.sessions_controller)
+router_agent_chat.get("/db/stats")(agent_controller.db_stats_controller)
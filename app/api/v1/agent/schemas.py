@@ -3,9 +3,21 @@ from app.mcp_custom.schemas import ChatResponse
 
 class ChatAgentRequest(BaseModel):
     mensaje: str
+    user_id: str | None = None
+    session_id: str | None = None
 
 class ChatAgentResponse(BaseModel):
     respuesta: str | ChatResponse
 
 class ChatAgentStreamResponse(BaseModel):
     message: str
+
+class SessionsResponse(BaseModel):
+    max_sessions: int
+    ttl_seconds: float
+    evicted: int
+    sessions: int
+    events: int
+    size_bytes: int
+    largest_session_bytes: int
+    oldest_idle_seconds: float
@@ -0,0 +1,237 @@
+import time
+import asyncio
+from typing import Any, AsyncIterator
+
+from fastapi.responses import StreamingResponse
+
+from app.config import config
+from app.db.encoding import dumps_compact
+from app.metrics import record
+from app.admission import AdmissionRejected, Ticket
+
+# Formatos de stream soportados y su media type
+STREAM_MEDIA_TYPES = {
+    "text": "text/plain",
+    "sse": "text/event-stream",
+    "ndjson": "application/x-ndjson",
+}
+
+# Prefijos del formato de texto original ([[...]]), se mantiene por compatibilidad
+LEGACY_PREFIXES = {
+    "tool": "[[TOOL]]",
+    "tool_graphic": "[[TOOL-GRAPHIC]]",
+    "insight": "[[INSIGHT]]",
+    "message": "[[MENSAJE]]",
+    "graphic": "[[GRAPHIC]]",
+}
+
+# Fin del stream del agente en la cola de coalesce_tokens
+_END = object()
+
+
+def negotiate_format(accept: str | None) -> str:
+    """Elegir el formato del stream según el header Accept
+
+    Args:
+        accept: Valor del header Accept de la petición
+    """
+
+    accept = (accept or "").lower()
+    if "text/event-stream" in accept:
+        return "sse"
+    if "application/x-ndjson" in accept or "application/jsonl" in accept:
+        return "ndjson"
+    return "text"
+
+
+def format_event(stream_format: str, event_type: str, data: Any) -> str:
+    """Serializar un evento en el formato del stream
+
+    Args:
+        stream_format: "text", "sse" o "ndjson"
+        event_type: Tipo del evento (token, tool, tool_graphic, insight, message, graphic, error, done)
+        data: Datos del evento
+    """
+
+    if stream_format == "sse":
+        return f"event: {event_type}\ndata: {dumps_compact(data)}\n\n"
+    if stream_format == "ndjson":
+        return dumps_compact({"type": event_type, "data": data}) + "\n"
+
+    # Formato de texto original
+    if event_type == "token":
+        return data
+    if event_type == "error":
+        return str(data)
+    prefix = LEGACY_PREFIXES.get(event_type, "")
+    return prefix + (data if isinstance(data, str) else dumps_compact(data))
+
+
+async def coalesce_tokens(events: AsyncIterator[tuple[str, Any]], min_chars: int, max_delay: float):
+    """Agrupar fragmentos de texto pequeños en frames más grandes
+
+    Los tokens se acumulan hasta juntar `min_chars` caracteres o hasta que
+    pasen `max_delay` segundos desde el primero acumulado, aunque no llegue
+    otro evento (por ejemplo mientras el agente espera una herramienta).
+    Cualquier otro evento vacía el buffer antes de emitirse.
+
+    Args:
+        events: Eventos (tipo, datos) del agente
+        min_chars: Caracteres mínimos por frame (0 desactiva la agrupación)
+        max_delay: Segundos máximos que un token puede esperar en el buffer
+    """
+
+    if min_chars <= 0:
+        try:
+            async for event in events:
+                yield event
+        finally:
+            await events.aclose()
+        return
+
+    # El agente se consume en una sola tarea (sus cancel scopes de anyio deben
+    # abrirse y cerrarse en la misma tarea) y aquí se espera la cola con timeout
+    queue: asyncio.Queue = asyncio.Queue(maxsize=1)
+
+    async def produce():
+        try:
+            async for event in events:
+                await queue.put(event)
+            await queue.put(_END)
+        except Exception as e:
+            await queue.put(e)
+        finally:
+            await events.aclose()
+
+    producer = asyncio.create_task(produce())
+    buffer: list[str] = []
+    buffered_chars = 0
+    first_at = 0.0
+    try:
+        while True:
+            timeout = max(first_at + max_delay - time.monotonic(), 0) if buffer else None
+            try:
+                item = await asyncio.wait_for(queue.get(), timeout)
+            except asyncio.TimeoutError:
+                yield "token", "".join(buffer)
+                buffer, buffered_chars = [], 0
+                continue
+
+            if item is _END or isinstance(item, Exception):
+                if buffer:
+                    yield "token", "".join(buffer)
+                if item is _END:
+                    return
+                raise item
+
+            event_type, data = item
+            if event_type != "token":
+                if buffer:
+                    yield "token", "".join(buffer)
+                    buffer, buffered_chars = [], 0
+                yield event_type, data
+                continue
+
+            if not buffer:
+                first_at = time.monotonic()
+            buffer.append(data)
+            buffered_chars += len(data)
+            if buffered_chars >= min_chars:
+                yield "token", "".join(buffer)
+                buffer, buffered_chars = [], 0
+    finally:
+        producer.cancel()
+        await asyncio.gather(producer, return_exceptions=True)
+
+
+async def encode_stream(events: AsyncIterator[tuple[str, Any]], stream_format: str):
+    """Convertir los eventos del agente en los chunks de la respuesta
+
+    Args:
+        events: Eventos (tipo, datos) del agente
+        stream_format: "text", "sse" o "ndjson"
+    """
+
+    coalesced = coalesce_tokens(
+        events,
+        min_chars=config.STREAM_COALESCE_CHARS,
+        max_delay=config.STREAM_COALESCE_MS / 1000
+    )
+
+    # Tiempo total de serialización y bytes enviados en todo el stream
+    serialize_seconds = 0.0
+    sent_bytes = 0
+    try:
+        async for event_type, data in coalesced:
+            start = time.perf_counter()
+            chunk = format_event(stream_format, event_type, data)
+            serialize_seconds += time.perf_counter() - start
+            sent_bytes += len(chunk.encode())
+            yield chunk
+
+        if stream_format != "text":
+            yield format_event(stream_format, "done", None)
+    except AdmissionRejected as e:
+        # Un límite interno (LLM, MCP) rechazó la consulta después de enviar los headers
+        yield format_event(stream_format, "error", str(e))
+    finally:
+        # Cerrar la cadena de generadores aquí y no en el recolector de basura
+        await coalesced.aclose()
+        record("stream.serialize", serialize_seconds, bytes=sent_bytes)
+
+
+class AdmittedStreamingResponse(StreamingResponse):
+    """StreamingResponse que libera los cupos tomados cuando termina de enviarse
+
+    Los cupos (chat y, en el camino MCP, el de sesión MCP) se toman antes de
+    crear la respuesta, así un rechazo todavía sale como 429/503. Se liberan en
+    un finally alrededor de toda la respuesta: también si el cliente se
+    desconecta a mitad del stream, caso en que Starlette no ejecuta la tarea
+    `background`. El stream de eventos se cierra ahí mismo
+    para devolver en el momento la sesión MCP o el runner que tenía tomados.
+    """
+
+    def __init__(self, *args, tickets: list[Ticket] | None = None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.tickets = list(tickets or [])
+
+
+    async def __call__(self, scope, receive, send):
+        try:
+            await super().__call__(scope, receive, send)
+        finally:
+            try:
+                aclose = getattr(self.body_iterator, "aclose", None)
+                if aclose is not None:
+                    await aclose()
+            finally:
+                for ticket in self.tickets:
+                    ticket.release()
+
+
+def event_stream_response(
+    events: AsyncIterator[tuple[str, Any]],
+    accept: str | None,
+    headers: dict | None = None,
+    tickets: list[Ticket] | None = None,
+) -> StreamingResponse:
+    """Crear la respuesta de streaming en el formato pedido por el cliente
+
+    Args:
+        events: Eventos (tipo, datos) del agente
+        accept: Valor del header Accept de la petición
+        headers: Headers adicionales de la respuesta
+        tickets: Cupos a liberar cuando termina la respuesta
+    """
+
+    stream_format = negotiate_format(accept)
+    response_headers = dict(headers or {})
+    if stream_format == "sse":
+        response_headers.update({"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+    return AdmittedStreamingResponse(
+        encode_stream(events, stream_format),
+        media_type=STREAM_MEDIA_TYPES[stream_format],
+        headers=response_headers,
+        tickets=tickets
+    )
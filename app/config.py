@@ -9,7 +9,155 @@ class Config:
     DB_USER = os.getenv("DB_USER", "root")
     DB_PASSWORD = os.getenv("DB_PASSWORD", "password")
     DB_NAME = os.getenv("DB_NAME", "mi_base_de_datos")
+    DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", 5))
+    DB_POOL_MIN_SIZE = int(os.getenv("DB_POOL_MIN_SIZE", 2))
+    DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", 5))
+    # Hilos que pueden esperar una conexión; con la cola llena se rechaza de inmediato
+    DB_POOL_MAX_WAITERS = int(os.getenv("DB_POOL_MAX_WAITERS", 32))
+
+    # Límite de filas/bytes devueltos por execute_sql_query antes de resumir
+    SQL_MAX_ROWS = int(os.getenv("SQL_MAX_ROWS", 500))
+    SQL_MAX_BYTES = int(os.getenv("SQL_MAX_BYTES", 256 * 1024))
+    SQL_FETCH_BATCH_SIZE = int(os.getenv("SQL_FETCH_BATCH_SIZE", 500))
+    SQL_SUMMARY_SAMPLE_SIZE = int(os.getenv("SQL_SUMMARY_SAMPLE_SIZE", 10))
+    SQL_SUMMARY_TOP_VALUES = int(os.getenv("SQL_SUMMARY_TOP_VALUES", 5))
+    # Formato del resultado: "rows" (lista de objetos) o "columnar"
+    SQL_RESULT_FORMAT = os.getenv("SQL_RESULT_FORMAT", "rows")
+
+    # Guard de las consultas del modelo: solo lectura, EXPLAIN, LIMIT y MAX_EXECUTION_TIME
+    SQL_GUARD_ENABLED = os.getenv("SQL_GUARD_ENABLED", "true").lower() == "true"
+    SQL_GUARD_MAX_ROWS_EXAMINED = int(os.getenv("SQL_GUARD_MAX_ROWS_EXAMINED", 5_000_000))
+    # LIMIT agregado a las consultas sin LIMIT: unas veces SQL_MAX_ROWS, lo que el modelo puede usar
+    SQL_GUARD_DEFAULT_LIMIT = int(os.getenv("SQL_GUARD_DEFAULT_LIMIT", SQL_MAX_ROWS * 4))
+    SQL_GUARD_MAX_EXECUTION_MS = int(os.getenv("SQL_GUARD_MAX_EXECUTION_MS", 15000))
+
+    # Caché de resultados de execute_sql_query (TTL en segundos por tabla)
+    SQL_CACHE_ENABLED = os.getenv("SQL_CACHE_ENABLED", "true").lower() == "true"
+    SQL_CACHE_TABLE_TTLS = os.getenv(
+        "SQL_CACHE_TABLE_TTLS",
+        "roles:3600,categorias:3600,establecimientos:3600,proveedores:3600,usuarios:600,productos:300,"
+        "stock:15,entradas:15,salidas:15,detalle_entradas:15,detalle_salidas:15,"
+        "resumen_movimientos_diario:60,resumen_movimientos_mensual:60,resumen_categorias_mensual:60"
+    )
+    SQL_CACHE_DEFAULT_TTL = float(os.getenv("SQL_CACHE_DEFAULT_TTL", 30))
+    # La huella de cada tabla es MAX(id): detecta INSERTs pero no UPDATEs ni DELETEs.
+    # Ningún TTL supera este valor, que es lo máximo que un resultado puede quedar
+    # desactualizado tras un UPDATE o DELETE (stock y movimientos usan 15s)
+    SQL_CACHE_MAX_TTL = float(os.getenv("SQL_CACHE_MAX_TTL", 60))
+    SQL_CACHE_MAX_ENTRIES = int(os.getenv("SQL_CACHE_MAX_ENTRIES", 256))
+    SQL_CACHE_MAX_BYTES = int(os.getenv("SQL_CACHE_MAX_BYTES", 32 * 1024 * 1024))
+    SQL_CACHE_FINGERPRINT_INTERVAL = float(os.getenv("SQL_CACHE_FINGERPRINT_INTERVAL", 2))
+
+    # Resultados completos guardados por id para las herramientas del agente
+    RESULT_STORE_TTL = float(os.getenv("RESULT_STORE_TTL", 900))
+    RESULT_STORE_MAX_ENTRIES = int(os.getenv("RESULT_STORE_MAX_ENTRIES", 128))
+    RESULT_STORE_MAX_BYTES = int(os.getenv("RESULT_STORE_MAX_BYTES", 64 * 1024 * 1024))
+    # Máximo por resultado (filas y bytes), aparte del total del almacén
+    RESULT_STORE_MAX_ROWS = int(os.getenv("RESULT_STORE_MAX_ROWS", 20000))
+    RESULT_STORE_MAX_RESULT_BYTES = int(os.getenv("RESULT_STORE_MAX_RESULT_BYTES", 8 * 1024 * 1024))
+    RESULT_PREVIEW_ROWS = int(os.getenv("RESULT_PREVIEW_ROWS", 20))
+
+    # Segundos entre cada actualización del catálogo de esquema
+    SCHEMA_REFRESH_SECONDS = float(os.getenv("SCHEMA_REFRESH_SECONDS", 600))
+
+    # Tablas resumen de entradas/salidas (resumen_movimientos_*). Desactivado por
+    # defecto: la API crea y actualiza esas tablas, y el usuario de DB_USER necesita
+    # CREATE, SELECT, INSERT y UPDATE sobre resumen_movimientos_diario,
+    # resumen_movimientos_mensual, resumen_categorias_mensual y resumen_marcas
+    # (DROP y DELETE solo para rebuild, que usa TRUNCATE), además de SELECT sobre
+    # entradas, salidas, sus detalles y productos
+    ROLLUPS_ENABLED = os.getenv("ROLLUPS_ENABLED", "false").lower() == "true"
+    ROLLUP_REFRESH_SECONDS = float(os.getenv("ROLLUP_REFRESH_SECONDS", 60))
+    # Segundos de margen para no agregar transacciones que aún no confirmaron
+    ROLLUP_LAG_SECONDS = float(os.getenv("ROLLUP_LAG_SECONDS", 60))
+    # Días de movimientos agregados por transacción al ponerse al día
+    ROLLUP_BATCH_DAYS = int(os.getenv("ROLLUP_BATCH_DAYS", 31))
+
     PORT = int(os.getenv("PORT", 4002))
+
+    # Warm-up en el arranque (pool, servidores MCP y agente) antes de marcar la API como lista
+    STARTUP_WARMUP = os.getenv("STARTUP_WARMUP", "true").lower() == "true"
+    STARTUP_RETRY_SECONDS = float(os.getenv("STARTUP_RETRY_SECONDS", 10))
     ENVIRONMENT = os.getenv("ENVIRONMENT", "development")
 
+    # Pool de sesiones del servidor MCP
+    MCP_SERVER_MODULE = os.getenv("MCP_SERVER_MODULE", "app.mcp_custom.servers.mcp_server_sql")
+    MCP_POOL_SIZE = int(os.getenv("MCP_POOL_SIZE", 2))
+    MCP_POOL_MAX_USES = int(os.getenv("MCP_POOL_MAX_USES", 100))
+    MCP_START_TIMEOUT = float(os.getenv("MCP_START_TIMEOUT", 20))
+    MCP_HEALTHCHECK_TIMEOUT = float(os.getenv("MCP_HEALTHCHECK_TIMEOUT", 2))
+    # Consultas en curso dentro de cada servidor MCP SQL (hilos de trabajo), cola y plazos
+    MCP_SQL_MAX_IN_FLIGHT = int(os.getenv("MCP_SQL_MAX_IN_FLIGHT", DB_POOL_SIZE))
+    MCP_SQL_QUEUE = int(os.getenv("MCP_SQL_QUEUE", 32))
+    MCP_SQL_QUEUE_TIMEOUT = float(os.getenv("MCP_SQL_QUEUE_TIMEOUT", 10))
+    MCP_SQL_TIMEOUT = float(os.getenv("MCP_SQL_TIMEOUT", 30))
+
+    # Modelo de LiteLlm del agente ADK (vacío usa el definido en app.agent.agent)
+    AGENT_MODEL = os.getenv("AGENT_MODEL", "")
+
+    # Sesiones del agente ADK
+    ADK_MAX_SESSIONS = int(os.getenv("ADK_MAX_SESSIONS", 200))
+    ADK_SESSION_TTL = float(os.getenv("ADK_SESSION_TTL", 1800))
+    # memory: sesiones en el proceso (un solo worker); sqlite: archivo compartido entre workers del host
+    ADK_SESSION_BACKEND = os.getenv("ADK_SESSION_BACKEND", "memory").lower()
+    ADK_SESSION_DB_PATH = os.getenv("ADK_SESSION_DB_PATH", ".data/sessions.sqlite")
+    ADK_SESSION_CACHE_ENTRIES = int(os.getenv("ADK_SESSION_CACHE_ENTRIES", 256))
+    # Espera antes de escribir los eventos pendientes para guardarlos en una sola transacción
+    ADK_SESSION_FLUSH_MS = float(os.getenv("ADK_SESSION_FLUSH_MS", 10))
+    # Cada cuántos segundos se eliminan del archivo las sesiones sin uso en ADK_SESSION_TTL
+    ADK_SESSION_SWEEP_SECONDS = float(os.getenv("ADK_SESSION_SWEEP_SECONDS", 300))
+    # Runners ADK pre-construidos entre los que se reparten las conversaciones
+    ADK_RUNNER_POOL_SIZE = int(os.getenv("ADK_RUNNER_POOL_SIZE", 2))
+    # Completion de 1 token en el warm-up para dejar abierta la conexión con el modelo
+    ADK_WARMUP_MODEL = os.getenv("ADK_WARMUP_MODEL", "false").lower() == "true"
+
+    # Presupuesto del historial de conversación de MCPClient
+    HISTORY_MAX_TOKENS = int(os.getenv("HISTORY_MAX_TOKENS", 12000))
+    HISTORY_KEEP_TURNS = int(os.getenv("HISTORY_KEEP_TURNS", 2))
+    HISTORY_TOOL_OUTPUT_TOKENS = int(os.getenv("HISTORY_TOOL_OUTPUT_TOKENS", 400))
+    # Conversaciones de /chat-agent-stream residentes por proceso y segundos sin uso antes de eliminarlas
+    HISTORY_MAX_CONVERSATIONS = int(os.getenv("HISTORY_MAX_CONVERSATIONS", 200))
+    HISTORY_TTL = float(os.getenv("HISTORY_TTL", 1800))
+
+    # Presupuesto de puntos por gráfico (lineas se submuestrea, barras/pastel agrupan en "Otros")
+    CHART_MAX_LINE_POINTS = int(os.getenv("CHART_MAX_LINE_POINTS", 120))
+    CHART_MAX_BARS = int(os.getenv("CHART_MAX_BARS", 15))
+    CHART_MAX_SLICES = int(os.getenv("CHART_MAX_SLICES", 8))
+
+    # Máximo de elementos devueltos en las series de calculate_data (cumsum, growth_rate)
+    CALC_MAX_SERIES = int(os.getenv("CALC_MAX_SERIES", 1000))
+
+    # Control de admisión: cupos, cola de espera y plazo (segundos) por recurso
+    ADMISSION_CHAT_CONCURRENCY = int(os.getenv("ADMISSION_CHAT_CONCURRENCY", 16))
+    ADMISSION_CHAT_QUEUE = int(os.getenv("ADMISSION_CHAT_QUEUE", 32))
+    ADMISSION_CHAT_TIMEOUT = float(os.getenv("ADMISSION_CHAT_TIMEOUT", 10))
+    ADMISSION_LLM_CONCURRENCY = int(os.getenv("ADMISSION_LLM_CONCURRENCY", 16))
+    ADMISSION_LLM_QUEUE = int(os.getenv("ADMISSION_LLM_QUEUE", 64))
+    ADMISSION_LLM_TIMEOUT = float(os.getenv("ADMISSION_LLM_TIMEOUT", 30))
+    ADMISSION_MCP_QUEUE = int(os.getenv("ADMISSION_MCP_QUEUE", 32))
+    ADMISSION_MCP_TIMEOUT = float(os.getenv("ADMISSION_MCP_TIMEOUT", 10))
+
+    # Máximo de llamadas a herramientas simultáneas por petición
+    TOOL_CONCURRENCY = int(os.getenv("TOOL_CONCURRENCY", 4))
+
+    # Agrupación de tokens en los endpoints de streaming (0 la desactiva)
+    STREAM_COALESCE_CHARS = int(os.getenv("STREAM_COALESCE_CHARS", 24))
+    STREAM_COALESCE_MS = float(os.getenv("STREAM_COALESCE_MS", 40))
+
+    # Cliente HTTP compartido hacia el proveedor LLM
+    LLM_MAX_CONNECTIONS = int(os.getenv("LLM_MAX_CONNECTIONS", 100))
+    LLM_MAX_KEEPALIVE_CONNECTIONS = int(os.getenv("LLM_MAX_KEEPALIVE_CONNECTIONS", 20))
+    LLM_KEEPALIVE_EXPIRY = float(os.getenv("LLM_KEEPALIVE_EXPIRY", 60))
+    LLM_TIMEOUT = float(os.getenv("LLM_TIMEOUT", 60))
+
+    # Caché de planes pregunta -> SQL de MCPClient
+    PLAN_CACHE_ENABLED = os.getenv("PLAN_CACHE_ENABLED", "true").lower() == "true"
+    PLAN_CACHE_MAX_ENTRIES = int(os.getenv("PLAN_CACHE_MAX_ENTRIES", 512))
+    PLAN_CACHE_MAX_FAILURES = int(os.getenv("PLAN_CACHE_MAX_FAILURES", 2))
+    PLAN_CACHE_ENTITY_TTL = float(os.getenv("PLAN_CACHE_ENTITY_TTL", 600))
+
+    # Métricas por etapa (/metrics) y header Server-Timing opcional por petición
+    METRICS_ENABLED = os.getenv("METRICS_ENABLED", "true").lower() == "true"
+    METRICS_TIMING_HEADER = os.getenv("METRICS_TIMING_HEADER", "false").lower() == "true"
+
 config = Config()
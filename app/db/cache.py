@@ -0,0 +1,367 @@
+import re
+import json
+import time
+import logging
+import threading
+from collections import OrderedDict
+from typing import Callable
+
+# Funciones que hacen que el resultado cambie en cada ejecución
+_NON_DETERMINISTIC = re.compile(r"\b(rand|uuid|uuid_short|sleep|last_insert_id|connection_id)\s*\(")
+_TABLE_ITEM = r"`?[a-z0-9_$.]+`?(?:\s+(?:as\s+)?[a-z0-9_]+)?"
+_FROM_CLAUSE = re.compile(rf"\bfrom\s+({_TABLE_ITEM}(?:\s*,\s*{_TABLE_ITEM})*)")
+_JOIN_TABLE = re.compile(r"\bjoin\s+`?([a-z0-9_$.]+)`?")
+# Funciones cuyo FROM no es de tablas: EXTRACT(YEAR FROM ...), TRIM('x' FROM ...), SUBSTRING(x FROM 2)
+_FROM_FUNCTIONS = {"extract", "trim", "substring", "substr", "overlay"}
+_FUNCTION_NAME = re.compile(r"([a-z_]+)\s*$")
+_LITERAL = re.compile(r"'(?:[^'\\]|\\.)*'|\"(?:[^\"\\]|\\.)*\"")
+
+
+def normalize_sql(query: str) -> str:
+    """Normalizar una consulta para usarla como llave de caché
+
+    Pasa a minúsculas y colapsa espacios fuera de los literales, y quita el
+    punto y coma final. Los literales entre comillas se conservan intactos.
+
+    Args:
+        query: Consulta SQL original
+    """
+
+    result = []
+    quote = None
+    pending_space = False
+    i = 0
+    while i < len(query):
+        char = query[i]
+        if quote:
+            result.append(char)
+            if char == "\\" and i + 1 < len(query):
+                result.append(query[i + 1])
+                i += 1
+            elif char == quote:
+                quote = None
+        elif char in ("'", '"', "`"):
+            if pending_space and result:
+                result.append(" ")
+            pending_space = False
+            quote = char
+            result.append(char)
+        elif char.isspace():
+            pending_space = True
+        else:
+            if pending_space and result:
+                result.append(" ")
+            pending_space = False
+            result.append(char.lower())
+        i += 1
+
+    return "".join(result).strip().rstrip(";").strip()
+
+
+def referenced_tables(normalized_query: str) -> set[str]:
+    """Tablas que aparecen en FROM y JOIN de una consulta normalizada
+
+    Args:
+        normalized_query: Consulta ya pasada por normalize_sql
+    """
+
+    # Sin el contenido de los literales, así 'x from y' no parece una tabla
+    code = _LITERAL.sub(lambda literal: "'" + " " * (len(literal.group()) - 2) + "'", normalized_query)
+    tables = {name.split(".")[-1] for name in _JOIN_TABLE.findall(code)}
+    for match in _FROM_CLAUSE.finditer(code):
+        if _inside_function_from(code, match.start()):
+            continue
+        for item in match.group(1).split(","):
+            name = item.strip().split(" ")[0].strip("`")
+            tables.add(name.split(".")[-1])
+    return tables
+
+
+def _inside_function_from(code: str, position: int) -> bool:
+    # Buscar el paréntesis abierto que contiene la posición y la función que lo abre
+    depth = 0
+    for i in range(position - 1, -1, -1):
+        if code[i] == ")":
+            depth += 1
+        elif code[i] == "(":
+            if depth == 0:
+                name = _FUNCTION_NAME.search(code, 0, i)
+                return name is not None and name.group(1) in _FROM_FUNCTIONS
+            depth -= 1
+    return False
+
+
+def is_cacheable(normalized_query: str) -> bool:
+    return normalized_query.startswith(("select", "with")) and not _NON_DETERMINISTIC.search(normalized_query)
+
+
+def copy_result(value):
+    """Copiar diccionarios y listas de un resultado guardado
+
+    Tuplas, textos, números y fechas son inmutables y se comparten, así copiar
+    las filas de un resultado grande (tuplas) no cuesta más que la lista.
+
+    Args:
+        value: Resultado o parte de él
+    """
+
+    if isinstance(value, dict):
+        return {key: copy_result(item) for key, item in value.items()}
+    if isinstance(value, list):
+        return [copy_result(item) for item in value]
+    return value
+
+
+class QueryCache:
+    """Caché LRU de resultados de consultas SQL
+
+    Cada entrada vive lo que indique el TTL más corto de sus tablas (largo para
+    tablas de dimensiones, corto para stock y movimientos). Además, al leer una
+    entrada se compara la huella de cada tabla (máximo `id`, una lectura del
+    índice primario) con la que tenía al guardarse: si cambió, la entrada se
+    invalida. Las huellas las actualiza un hilo en segundo plano cada
+    `fingerprint_interval` segundos, así el camino de la petición nunca consulta
+    la base para obtenerlas. La huella no detecta UPDATEs ni DELETEs, por eso
+    ningún TTL supera `max_ttl`: es lo máximo que un resultado puede quedar
+    desactualizado después de un UPDATE o DELETE.
+
+    Los resultados devueltos son copias: modificarlos no altera la caché.
+    """
+
+    def __init__(
+        self,
+        fingerprint: Callable[[str], tuple],
+        table_ttls: dict[str, float],
+        default_ttl: float,
+        max_entries: int,
+        max_bytes: int,
+        fingerprint_interval: float,
+        max_ttl: float | None = None,
+    ):
+        self.fingerprint = fingerprint
+        self.table_ttls = table_ttls
+        self.default_ttl = default_ttl
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.fingerprint_interval = fingerprint_interval
+        self.max_ttl = max_ttl
+        self._entries: OrderedDict[str, dict] = OrderedDict()
+        self._fingerprints: dict[str, tuple] = {}
+        self._watched: set[str] = set()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._refresher: threading.Thread | None = None
+
+        self._hits = 0
+        self._misses = 0
+        self._evictions = 0
+        self._expirations = 0
+        self._invalidations = 0
+
+
+    def _ttl(self, tables: set[str]) -> float:
+        ttl = min((self.table_ttls.get(table, self.default_ttl) for table in tables), default=self.default_ttl)
+        return ttl if self.max_ttl is None else min(ttl, self.max_ttl)
+
+
+    def table_fingerprints(self, tables: set[str]) -> dict[str, tuple] | None:
+        """Últimas huellas conocidas de las tablas, sin consultar la base
+
+        Las tablas nuevas quedan registradas para el hilo de actualización y
+        devuelven None hasta que tengan su primera huella (la consulta no se
+        guarda en caché mientras tanto).
+
+        Args:
+            tables: Tablas a consultar
+        """
+
+        with self._lock:
+            missing = tables - self._watched
+            self._watched |= tables
+            fingerprints = {table: self._fingerprints[table] for table in tables if table in self._fingerprints}
+        if missing:
+            self._start_refresher()
+            self._wake.set()
+        if len(fingerprints) != len(tables):
+            return None
+        return fingerprints
+
+
+    def _start_refresher(self):
+        with self._lock:
+            if self._refresher is not None:
+                return
+            self._refresher = threading.Thread(target=self._refresh_loop, name="query-cache-fingerprints", daemon=True)
+        self._refresher.start()
+
+
+    def _refresh_loop(self):
+        while True:
+            self.refresh_fingerprints()
+            self._wake.wait(self.fingerprint_interval)
+            self._wake.clear()
+
+
+    def refresh_fingerprints(self):
+        """Actualizar las huellas de las tablas usadas por la caché
+
+        Args: none
+        """
+
+        with self._lock:
+            tables = set(self._watched)
+
+        values = {}
+        for table in tables:
+            try:
+                values[table] = self.fingerprint(table)
+            except Exception as e:
+                logging.warning(f"No se pudo obtener la huella de la tabla {table}: {e}")
+
+        with self._lock:
+            for table in tables - values.keys():
+                # Se vuelve a registrar si otra consulta la usa
+                self._fingerprints.pop(table, None)
+                self._watched.discard(table)
+            self._fingerprints.update(values)
+
+
+    def get(self, query: str, variant: str = "") -> dict | None:
+        """Obtener el resultado guardado de una consulta si sigue vigente
+
+        Args:
+            query: Consulta SQL original
+            variant: Forma del resultado guardado ("" para run_sql_query, "store" para store_sql_query)
+        """
+
+        key = normalize_sql(query)
+        if not is_cacheable(key):
+            return None
+        key = f"{variant}:{key}" if variant else key
+
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self._misses += 1
+                return None
+            if time.monotonic() >= entry["expires_at"]:
+                self._remove(key)
+                self._expirations += 1
+                self._misses += 1
+                return None
+
+        current = self.table_fingerprints(entry["tables"])
+        with self._lock:
+            if current != entry["fingerprints"]:
+                if key in self._entries:
+                    self._remove(key)
+                self._invalidations += 1
+                self._misses += 1
+                return None
+
+            if key in self._entries:
+                self._entries.move_to_end(key)
+            self._hits += 1
+            return copy_result(entry["result"])
+
+
+    def prepare(self, query: str, variant: str = "") -> dict | None:
+        """Datos necesarios para guardar la consulta, tomados ANTES de ejecutarla
+
+        Las huellas se toman antes de la consulta: si los datos cambian mientras
+        se ejecuta, la siguiente lectura detecta la diferencia y la invalida.
+
+        Args:
+            query: Consulta SQL original
+            variant: Forma del resultado guardado, igual que en get()
+        """
+
+        key = normalize_sql(query)
+        if not is_cacheable(key):
+            return None
+        tables = referenced_tables(key)
+        if not tables:
+            # Sin tablas reconocidas no hay huella que invalide la entrada
+            return None
+        fingerprints = self.table_fingerprints(tables)
+        if fingerprints is None:
+            return None
+        return {"key": f"{variant}:{key}" if variant else key, "tables": tables, "fingerprints": fingerprints}
+
+
+    def put(self, prepared: dict, result: dict, size: int | None = None):
+        """Guardar el resultado de una consulta preparada con prepare()
+
+        Args:
+            prepared: Valor devuelto por prepare()
+            result: Resultado exitoso de la consulta
+            size: Tamaño ya estimado del resultado (se calcula si no se envía)
+        """
+
+        size = len(json.dumps(result, default=str)) if size is None else size
+        if size > self.max_bytes // 4:
+            return
+
+        with self._lock:
+            key = prepared["key"]
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = {
+                **prepared,
+                "result": result,
+                "size": size,
+                "expires_at": time.monotonic() + self._ttl(prepared["tables"]),
+            }
+            self._bytes += size
+
+            while self._entries and (len(self._entries) > self.max_entries or self._bytes > self.max_bytes):
+                oldest = next(iter(self._entries))
+                self._remove(oldest)
+                self._evictions += 1
+
+
+    def _remove(self, key: str):
+        entry = self._entries.pop(key)
+        self._bytes -= entry["size"]
+
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+
+    def stats(self) -> dict:
+        """Aciertos, fallos y ocupación de la caché
+
+        Args: none
+        """
+
+        with self._lock:
+            lookups = self._hits + self._misses
+            return {
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "hits": self._hits,
+                "misses": self._misses,
+                "hit_rate": self._hits / lookups if lookups else 0.0,
+                "evictions": self._evictions,
+                "expirations": self._expirations,
+                "invalidations": self._invalidations,
+            }
+
+
+def parse_table_ttls(value: str) -> dict[str, float]:
+    """Convertir "tabla:segundos,tabla:segundos" en un diccionario
+
+    Args:
+        value: Texto de configuración
+    """
+
+    ttls = {}
+    for item in value.split(","):
+        if ":" in item:
+            table, seconds = item.split(":", 1)
+            ttls[table.strip().lower()] = float(seconds)
+    return ttls
@@ -0,0 +1,91 @@
+import json
+from datetime import date, datetime, time, timedelta
+from decimal import Decimal
+
+from mysql.connector import FieldType
+
+# Tipos de MySQL agrupados en los tipos que ve el modelo
+_TYPE_NAMES = {
+    "TINY": "int", "SHORT": "int", "LONG": "int", "LONGLONG": "int", "INT24": "int", "YEAR": "int",
+    "DECIMAL": "decimal", "NEWDECIMAL": "decimal",
+    "FLOAT": "float", "DOUBLE": "float",
+    "DATE": "date", "NEWDATE": "date",
+    "DATETIME": "datetime", "TIMESTAMP": "datetime",
+    "TIME": "time",
+    "BIT": "bool",
+    "JSON": "json",
+    "TINY_BLOB": "bytes", "MEDIUM_BLOB": "bytes", "LONG_BLOB": "bytes", "BLOB": "bytes",
+}
+
+
+def column_types(description) -> list[str]:
+    """Tipo simplificado de cada columna a partir de cursor.description
+
+    Args:
+        description: Descripción del cursor de mysql.connector
+    """
+
+    types = []
+    for column in description:
+        try:
+            name = FieldType.get_info(column[1])
+        except Exception:
+            name = None
+        types.append(_TYPE_NAMES.get(name, "str"))
+    return types
+
+
+def to_native(value):
+    """Convertir un valor de MySQL a un tipo que JSON serializa directamente
+
+    Las cantidades decimal(10,3) se devuelven como int si no tienen parte
+    fraccionaria y como float en caso contrario.
+
+    Args:
+        value: Valor devuelto por el cursor
+    """
+
+    if value is None or isinstance(value, (bool, int, float, str)):
+        return value
+    if isinstance(value, Decimal):
+        return int(value) if value == value.to_integral_value() else float(value)
+    if isinstance(value, (datetime, date, time)):
+        return value.isoformat()
+    if isinstance(value, timedelta):
+        return str(value)
+    if isinstance(value, (bytes, bytearray)):
+        return value.decode("utf-8", errors="replace")
+    if isinstance(value, set):
+        return sorted(value)
+    return str(value)
+
+
+def encode_columnar(columns: list[str], types: list[str], rows: list[tuple]) -> dict:
+    """Resultado en formato columnar: nombres y tipos una sola vez, filas como listas
+
+    Args:
+        columns: Nombres de las columnas
+        types: Tipos simplificados de las columnas
+        rows: Filas como tuplas
+    """
+
+    return {
+        "columns": columns,
+        "types": types,
+        "rows": [[to_native(value) for value in row] for row in rows],
+    }
+
+
+def json_default(value):
+    # Respaldo de json.dumps para los tipos que no son nativos de JSON
+    return to_native(value)
+
+
+def dumps_compact(value) -> str:
+    """Serializar un resultado a JSON sin espacios ni indentación
+
+    Args:
+        value: Objeto a serializar
+    """
+
+    return json.dumps(value, default=json_default, separators=(",", ":"), ensure_ascii=False)
@@ -0,0 +1,191 @@
+import random
+from collections import Counter
+from datetime import date, datetime, time, timedelta
+from decimal import Decimal
+
+from app.db.encoding import column_types, encode_columnar
+
+
+class ColumnSummary:
+    """Estadísticas incrementales de una columna con memoria acotada"""
+
+    def __init__(self, name: str, top_values: int):
+        self.name = name
+        self.top_values = top_values
+        self.count = 0
+        self.nulls = 0
+        self.numeric = 0
+        self.min = None
+        self.max = None
+        self.sum = 0.0
+        self.texts: Counter = Counter()
+        self.distinct_overflow = False
+
+
+    def add(self, value):
+        self.count += 1
+        if value is None:
+            self.nulls += 1
+            return
+
+        if isinstance(value, (int, float, Decimal)) and not isinstance(value, bool):
+            self.numeric += 1
+            number = float(value)
+            self.sum += number
+            self.min = number if self.min is None else min(self.min, number)
+            self.max = number if self.max is None else max(self.max, number)
+        elif isinstance(value, (datetime, date, time, timedelta)):
+            self.min = value if self.min is None else min(self.min, value)
+            self.max = value if self.max is None else max(self.max, value)
+        else:
+            self.texts[str(value)] += 1
+            # Poda aproximada para no guardar todos los valores distintos
+            if len(self.texts) > self.top_values * 200:
+                self.texts = Counter(dict(self.texts.most_common(self.top_values * 100)))
+                self.distinct_overflow = True
+
+
+    def to_dict(self) -> dict:
+        summary: dict = {"count": self.count, "nulls": self.nulls}
+        if self.numeric:
+            summary.update({"min": self.min, "max": self.max, "sum": self.sum, "avg": self.sum / self.numeric})
+        elif self.min is not None:
+            summary.update({"min": self.min, "max": self.max})
+        if self.texts:
+            summary["top_values"] = [
+                {"value": value, "count": count}
+                for value, count in self.texts.most_common(self.top_values)
+            ]
+            summary["distinct"] = f">{len(self.texts)}" if self.distinct_overflow else len(self.texts)
+        return summary
+
+
+class ResultSummary:
+    """Resumen estadístico de un resultado demasiado grande para devolver completo"""
+
+    def __init__(self, columns: list[str], sample_size: int, top_values: int):
+        self.columns = columns
+        self.sample_size = sample_size
+        self.row_count = 0
+        self.column_summaries = [ColumnSummary(name, top_values) for name in columns]
+        self.sample: list[tuple] = []
+        self._random = random.Random(0)
+
+
+    def add(self, row: tuple):
+        self.row_count += 1
+        for column_summary, value in zip(self.column_summaries, row):
+            column_summary.add(value)
+
+        # Muestreo de reservorio: muestra uniforme sin guardar todas las filas
+        if len(self.sample) < self.sample_size:
+            self.sample.append(row)
+        else:
+            index = self._random.randrange(self.row_count)
+            if index < self.sample_size:
+                self.sample[index] = row
+
+
+    def to_dict(self) -> dict:
+        return {
+            "row_count": self.row_count,
+            "columns": {summary.name: summary.to_dict() for summary in self.column_summaries},
+            "sample": [dict(zip(self.columns, row)) for row in self.sample],
+        }
+
+
+def _row_bytes(columns: list[str], row: tuple) -> int:
+    # Estimación del tamaño de la fila serializada como objeto JSON
+    return sum(len(column) + len(str(value)) + 6 for column, value in zip(columns, row))
+
+
+def fetch_bounded(
+    cursor,
+    max_rows: int,
+    max_bytes: int,
+    batch_size: int,
+    sample_size: int,
+    top_values: int,
+    result_format: str = "rows",
+) -> dict:
+    """Leer el resultado de un cursor por lotes sin superar un presupuesto
+
+    Mientras el resultado cabe en `max_rows` filas y `max_bytes` bytes se
+    devuelven las filas completas. Al superarlo, el resto del resultado se
+    sigue leyendo por lotes pero solo alimenta un resumen estadístico
+    (conteo, min/max/suma por columna numérica, valores más frecuentes por
+    columna de texto y una muestra), por lo que la memoria queda acotada.
+
+    Args:
+        cursor: Cursor ya ejecutado (sin buffer, con filas como tuplas)
+        max_rows: Máximo de filas a devolver completas
+        max_bytes: Máximo de bytes estimados a devolver completos
+        batch_size: Filas por lectura con fetchmany
+        sample_size: Filas de muestra en el resumen
+        top_values: Valores más frecuentes por columna de texto
+        result_format: "rows" (lista de objetos) o "columnar" (columns/types/rows)
+    """
+
+    if cursor.description is None:
+        return {"success": True, "data": [], "rowcount": cursor.rowcount}
+
+    columns = [column[0] for column in cursor.description]
+    rows: list[tuple] = []
+    size = 0
+    summary: ResultSummary | None = None
+
+    while True:
+        batch = cursor.fetchmany(batch_size)
+        if not batch:
+            break
+
+        for row in batch:
+            if summary is not None:
+                summary.add(row)
+                continue
+
+            row_size = _row_bytes(columns, row)
+            if len(rows) >= max_rows or size + row_size > max_bytes:
+                summary = ResultSummary(columns, sample_size, top_values)
+                for previous in rows:
+                    summary.add(previous)
+                summary.add(row)
+                rows = []
+                continue
+
+            rows.append(row)
+            size += row_size
+
+    if summary is None:
+        if result_format == "columnar":
+            return {"success": True, **encode_columnar(columns, column_types(cursor.description), rows)}
+        return {"success": True, "data": [dict(zip(columns, row)) for row in rows]}
+
+    message = (
+        f"El resultado tiene {summary.row_count} filas y supera el límite de {max_rows} filas "
+        f"o {max_bytes} bytes. Se devuelve un resumen estadístico en lugar de las filas. "
+        "Usa agregaciones (GROUP BY, SUM, COUNT) o LIMIT para obtener filas concretas."
+    )
+    return summary_result(summary, column_types(cursor.description), message, result_format)
+
+
+def summary_result(summary: ResultSummary, types: list[str], message: str, result_format: str = "rows") -> dict:
+    """Respuesta con el resumen estadístico de un resultado que no se devuelve completo
+
+    Args:
+        summary: Resumen con todas las filas leídas
+        types: Tipos simplificados de las columnas
+        message: Explicación para el modelo
+        result_format: "rows" (lista de objetos) o "columnar" (columns/types/rows)
+    """
+
+    summary_dict = summary.to_dict()
+    if result_format == "columnar":
+        summary_dict["sample"] = encode_columnar(summary.columns, types, summary.sample)
+
+    return {
+        "success": True,
+        "truncated": True,
+        "message": message,
+        "summary": summary_dict,
+    }
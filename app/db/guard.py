@@ -0,0 +1,266 @@
+import re
+import logging
+import threading
+
+from app.config import config
+from app.metrics import registry
+
+# Con una sola sentencia que empieza con SELECT/WITH solo puede escribir un
+# WITH ... UPDATE/DELETE/INSERT; REPLACE( e INSERT( son funciones de texto
+_WRITE_KEYWORDS = re.compile(r"\b(insert|update|delete|replace)\b(?!\s*\()")
+_FORBIDDEN_CLAUSES = (
+    (re.compile(r"\binto\s+(outfile|dumpfile|@)"), "SELECT ... INTO no está permitido"),
+    (re.compile(r"\bfor\s+(update|share)\b"), "FOR UPDATE/FOR SHARE no está permitido"),
+    (re.compile(r"\block\s+in\s+share\s+mode\b"), "LOCK IN SHARE MODE no está permitido"),
+    (re.compile(r"\b(sleep|benchmark|get_lock|load_file)\s*\("), "La función {}() no está permitida"),
+)
+_LIMIT = re.compile(r"\blimit\b")
+_SELECT = re.compile(r"\bselect\b")
+# Código de error de MySQL cuando se supera MAX_EXECUTION_TIME
+MAX_EXECUTION_TIME_EXCEEDED = 3024
+
+guard_rejected = registry.counter(
+    "agent_sql_guard_rejected_total", "Consultas rechazadas por el guard SQL antes de ejecutarse", ("reason",)
+)
+
+
+class QueryRejected(Exception):
+    """La consulta no pasó el guard; to_dict() es el error que recibe el modelo"""
+
+    def __init__(self, reason: str, message: str, hint: str | None = None, **details):
+        super().__init__(message)
+        self.reason = reason
+        self.hint = hint
+        self.details = details
+
+
+    def to_dict(self) -> dict:
+        error = {"success": False, "error": str(self), "reason": self.reason}
+        if self.hint:
+            error["hint"] = self.hint
+        error.update(self.details)
+        return error
+
+
+def mask_sql(query: str) -> str:
+    """Reemplazar el contenido de literales y comentarios por espacios
+
+    El resultado tiene el mismo largo que la consulta, así las posiciones
+    encontradas en él sirven para editar la consulta original, y las palabras
+    dentro de literales ('update') no se confunden con palabras clave.
+
+    Args:
+        query: Consulta SQL original
+    """
+
+    masked = list(query)
+    i = 0
+    while i < len(query):
+        char = query[i]
+        if char in ("'", '"', "`"):
+            end = i + 1
+            while end < len(query) and query[end] != char:
+                end += 2 if query[end] == "\\" else 1
+            for j in range(i + 1, min(end, len(query))):
+                masked[j] = " "
+            i = end + 1
+        elif query.startswith("/*", i):
+            if query.startswith("/*!", i):
+                raise QueryRejected("not_read_only", "Los comentarios ejecutables /*! */ no están permitidos")
+            end = query.find("*/", i + 2)
+            end = len(query) if end < 0 else end + 2
+            for j in range(i, end):
+                masked[j] = " "
+            i = end
+        elif char == "#" or (query.startswith("--", i) and (i + 2 == len(query) or query[i + 2].isspace())):
+            end = query.find("\n", i)
+            end = len(query) if end < 0 else end
+            for j in range(i, end):
+                masked[j] = " "
+            i = end
+        else:
+            i += 1
+    return "".join(masked)
+
+
+def _depths(code: str) -> list[int]:
+    # Nivel de paréntesis de cada posición
+    depths, depth = [], 0
+    for char in code:
+        if char == ")":
+            depth -= 1
+        depths.append(depth)
+        if char == "(":
+            depth += 1
+    return depths
+
+
+def estimate_rows_examined(plan: list[dict]) -> int | None:
+    """Filas que MySQL estima examinar según el resultado de EXPLAIN
+
+    Dentro de cada SELECT las tablas se recorren en orden como loops anidados:
+    cada tabla se lee una vez por cada fila que dejan pasar las anteriores
+    (rows * filtered). Devuelve None si el plan no trae la columna rows (otro
+    motor, como el SQLite de los benchmarks).
+
+    Args:
+        plan: Filas de EXPLAIN como diccionarios
+    """
+
+    if not plan or "rows" not in plan[0]:
+        return None
+
+    total = 0
+    fanout: dict = {}
+    for step in plan:
+        rows = float(step.get("rows") or 0)
+        filtered = float(step.get("filtered") or 100) / 100
+        select_id = step.get("id")
+        current = fanout.get(select_id, 1.0)
+        total += current * rows
+        fanout[select_id] = current * max(rows * filtered, 1.0)
+    return int(total)
+
+
+class QueryGuard:
+    """Control de las consultas que escribe el modelo antes de ejecutarlas
+
+    - Solo se aceptan consultas de lectura (SELECT/WITH) de una sentencia.
+    - Sin LIMIT en la consulta principal se agrega `default_limit`.
+    - Se agrega el hint MAX_EXECUTION_TIME para que MySQL corte la consulta.
+    - EXPLAIN estima las filas examinadas; sobre `max_rows_examined` la
+      consulta se rechaza con una pista de las tablas que se recorren completas.
+
+    Los rechazos se devuelven como QueryRejected para que el modelo corrija la
+    consulta.
+    """
+
+    def __init__(self, enabled: bool, max_rows_examined: int, default_limit: int, max_execution_ms: int):
+        self.enabled = enabled
+        self.max_rows_examined = max_rows_examined
+        self.default_limit = default_limit
+        self.max_execution_ms = max_execution_ms
+        self._lock = threading.Lock()
+        self._checked = 0
+        self._limited = 0
+        self._rejected: dict[str, int] = {}
+
+
+    def _reject(self, reason: str, message: str, hint: str | None = None, **details) -> QueryRejected:
+        with self._lock:
+            self._rejected[reason] = self._rejected.get(reason, 0) + 1
+        guard_rejected.inc(reason=reason)
+        return QueryRejected(reason, message, hint, **details)
+
+
+    def rewrite(self, query: str) -> tuple[str, int | None]:
+        """Validar que la consulta sea de lectura y agregarle LIMIT y el hint de tiempo
+
+        Devuelve la consulta a ejecutar y el LIMIT agregado (None si ya tenía).
+
+        Args:
+            query: Consulta SQL escrita por el modelo
+        """
+
+        with self._lock:
+            self._checked += 1
+        try:
+            code = mask_sql(query)
+        except QueryRejected as e:
+            raise self._reject(e.reason, str(e))
+
+        # Quitar el punto y coma final (y lo que venga después si son solo espacios)
+        end = len(code.rstrip().rstrip(";").rstrip())
+        query, code = query[:end], code[:end]
+        lowered = code.lower()
+
+        if ";" in code:
+            raise self._reject("multiple_statements", "Solo se permite una sentencia por consulta", "Envía una sola consulta SELECT sin ';' intermedios")
+        if not lowered.lstrip(" (\n\t").startswith(("select", "with")):
+            raise self._reject("not_read_only", "Solo se permiten consultas de lectura (SELECT o WITH)")
+        for pattern, message in _FORBIDDEN_CLAUSES:
+            match = pattern.search(lowered)
+            if match:
+                raise self._reject("not_read_only", message.format(*(group.upper() for group in match.groups())))
+        keyword = _WRITE_KEYWORDS.search(lowered)
+        if keyword:
+            raise self._reject("not_read_only", f"La consulta contiene '{keyword.group(1).upper()}' y solo se permiten consultas de lectura")
+
+        depths = _depths(lowered)
+        limit = None
+        if not any(depths[match.start()] == 0 for match in _LIMIT.finditer(lowered)):
+            limit = self.default_limit
+            query = f"{query} LIMIT {limit}"
+            with self._lock:
+                self._limited += 1
+
+        if self.max_execution_ms > 0 and "max_execution_time" not in query.lower():
+            # El hint va justo después del SELECT de la consulta principal
+            select = next((match for match in _SELECT.finditer(lowered) if depths[match.start()] == 0), None)
+            if select is not None:
+                query = f"{query[:select.end()]} /*+ MAX_EXECUTION_TIME({self.max_execution_ms}) */{query[select.end():]}"
+
+        return query, limit
+
+
+    def check_cost(self, cursor, query: str):
+        """Estimar con EXPLAIN las filas examinadas y rechazar las consultas muy caras
+
+        Args:
+            cursor: Cursor de la conexión que ejecutará la consulta
+            query: Consulta ya reescrita por rewrite()
+        """
+
+        cursor.execute(f"EXPLAIN {query}")
+        columns = [column[0] for column in cursor.description or []]
+        plan = [dict(zip(columns, row)) for row in cursor.fetchall()]
+        estimate = estimate_rows_examined(plan)
+        if estimate is None or estimate <= self.max_rows_examined:
+            return
+
+        full_scans = [
+            f"{step.get('table')} (~{int(step.get('rows') or 0)} filas)"
+            for step in plan if step.get("type") == "ALL" and step.get("table")
+        ]
+        hint = "Agrega filtros (por ejemplo por fecha o id) o condiciones de JOIN que usen índices"
+        if full_scans:
+            hint += f"; se recorren completas: {', '.join(full_scans)}"
+        hint += ". Para totales por fecha, producto, establecimiento o categoría usa get_movement_summary."
+        logging.warning(f"Consulta rechazada por costo ({estimate} filas estimadas): {query}")
+        raise self._reject(
+            "too_expensive",
+            f"La consulta examinaría unas {estimate} filas (máximo {self.max_rows_examined})",
+            hint,
+            estimated_rows=estimate,
+        )
+
+
+    def timeout_error(self) -> dict:
+        # MySQL cortó la consulta por el hint MAX_EXECUTION_TIME
+        return self._reject(
+            "timeout",
+            f"La consulta superó el tiempo máximo de {self.max_execution_ms} ms",
+            "Acota la consulta con filtros o agregaciones sobre menos filas",
+        ).to_dict()
+
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "enabled": self.enabled,
+                "max_rows_examined": self.max_rows_examined,
+                "default_limit": self.default_limit,
+                "max_execution_ms": self.max_execution_ms,
+                "checked": self._checked,
+                "limited": self._limited,
+                "rejected": dict(self._rejected),
+            }
+
+
+# Guard compartido por el proceso (API o servidor MCP)
+query_guard = QueryGuard(
+    enabled=config.SQL_GUARD_ENABLED,
+    max_rows_examined=config.SQL_GUARD_MAX_ROWS_EXAMINED,
+    default_limit=config.SQL_GUARD_DEFAULT_LIMIT,
+    max_execution_ms=config.SQL_GUARD_MAX_EXECUTION_MS,
+)
@@ -0,0 +1,296 @@
+import time
+import logging
+import threading
+from collections import deque
+from contextlib import contextmanager
+
+import mysql.connector
+
+from app.config import config
+from app.metrics import admission_queue_depth, admission_wait, admission_rejected
+
+
+class PoolExhaustedError(Exception):
+    """No se liberó ninguna conexión dentro del tiempo de espera del pool"""
+
+
+class DatabasePool:
+    """Pool de conexiones MySQL compartido por las herramientas SQL
+
+    Las conexiones se crean bajo demanda hasta `size`, se validan con un ping al
+    momento de entregarlas y se reutilizan entre llamadas. Las conexiones usan
+    autocommit para que cada consulta lea datos frescos y no un snapshot viejo
+    de una transacción abierta.
+
+    Si no hay conexión libre, hasta `max_waiters` hilos esperan `timeout`
+    segundos; con la cola llena la consulta se rechaza de inmediato.
+
+    Las conexiones tomadas dentro de track(owner) quedan registradas con su
+    CONNECTION_ID() para que kill_queries(owner) pueda cortar en el servidor
+    una consulta cuyo plazo venció.
+    """
+
+    def __init__(self, connect_kwargs: dict, size: int, min_size: int, timeout: float, max_waiters: int = 32):
+        self.connect_kwargs = connect_kwargs
+        self.size = max(1, size)
+        self.min_size = min(max(0, min_size), self.size)
+        self.timeout = timeout
+        self.max_waiters = max(0, max_waiters)
+        self._idle: deque = deque()
+        self._created = 0
+        self._waiting = 0
+        self._cond = threading.Condition()
+        self._local = threading.local()
+        self._owned: dict[object, list[int]] = {}
+
+        # Contadores del pool
+        self._checkouts = 0
+        self._waits = 0
+        self._wait_time_total = 0.0
+        self._wait_time_max = 0.0
+        self._exhausted = 0
+        self._rejected = 0
+        self._discarded = 0
+
+
+    @classmethod
+    def from_config(cls) -> "DatabasePool":
+        return cls(
+            connect_kwargs={
+                "host": config.DB_HOST,
+                "user": config.DB_USER,
+                "password": config.DB_PASSWORD,
+                "database": config.DB_NAME,
+                "autocommit": True,
+            },
+            size=config.DB_POOL_SIZE,
+            min_size=config.DB_POOL_MIN_SIZE,
+            timeout=config.DB_POOL_TIMEOUT,
+            max_waiters=config.DB_POOL_MAX_WAITERS,
+        )
+
+
+    def _connect(self):
+        return mysql.connector.connect(**self.connect_kwargs)
+
+
+    def warmup(self):
+        """Abrir `min_size` conexiones por adelantado
+
+        Los errores solo se registran: el pool vuelve a intentar conectar
+        cuando llegue la primera consulta.
+        """
+
+        with self._cond:
+            missing = self.min_size - self._created
+            self._created += max(0, missing)
+
+        opened = 0
+        for _ in range(max(0, missing)):
+            try:
+                connection = self._connect()
+            except Exception as e:
+                logging.error(f"Error al pre-calentar el pool de base de datos: {e}")
+                with self._cond:
+                    self._created -= 1
+                    self._cond.notify()
+                continue
+            opened += 1
+            with self._cond:
+                self._idle.append(connection)
+                self._cond.notify()
+
+        logging.info(f"Pool de base de datos pre-calentado con {opened} conexiones")
+
+
+    def _is_valid(self, connection) -> bool:
+        try:
+            connection.ping(reconnect=False)
+            return True
+        except Exception:
+            return False
+
+
+    def _discard(self, connection):
+        try:
+            connection.close()
+        except Exception:
+            pass
+        with self._cond:
+            self._created -= 1
+            self._discarded += 1
+            self._cond.notify()
+
+
+    def _checkout(self):
+        start = time.monotonic()
+        deadline = start + self.timeout
+        waited = False
+
+        while True:
+            with self._cond:
+                if not self._idle and self._created >= self.size and self._waiting >= self.max_waiters:
+                    self._rejected += 1
+                    admission_rejected.inc(limiter="db", reason="queue_full")
+                    raise PoolExhaustedError(
+                        f"Demasiadas consultas esperando una conexión de base de datos ({self._waiting} en cola)"
+                    )
+                while not self._idle and self._created >= self.size:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        self._exhausted += 1
+                        admission_rejected.inc(limiter="db", reason="timeout")
+                        raise PoolExhaustedError(
+                            f"No hay conexiones disponibles en el pool de base de datos ({self.size} en uso)"
+                        )
+                    waited = True
+                    self._waiting += 1
+                    admission_queue_depth.set(self._waiting, limiter="db")
+                    try:
+                        self._cond.wait(remaining)
+                    finally:
+                        self._waiting -= 1
+                        admission_queue_depth.set(self._waiting, limiter="db")
+
+                connection = self._idle.popleft() if self._idle else None
+                if connection is None:
+                    self._created += 1
+
+                elapsed = time.monotonic() - start
+                self._checkouts += 1
+                if waited:
+                    self._waits += 1
+                    self._wait_time_total += elapsed
+                    self._wait_time_max = max(self._wait_time_max, elapsed)
+                    admission_wait.observe(elapsed, limiter="db")
+
+            # Conectar o validar fuera del lock para no bloquear a los demás hilos
+            if connection is None:
+                try:
+                    return self._connect()
+                except Exception:
+                    with self._cond:
+                        self._created -= 1
+                        self._cond.notify()
+                    raise
+
+            if self._is_valid(connection):
+                return connection
+
+            logging.warning("Se descartó una conexión inválida del pool de base de datos")
+            self._discard(connection)
+
+
+    def _checkin(self, connection):
+        with self._cond:
+            self._idle.append(connection)
+            self._cond.notify()
+
+
+    @contextmanager
+    def connection(self):
+        """Tomar una conexión del pool y devolverla al terminar
+
+        Uso:
+            with db_pool.connection() as connection:
+                cursor = connection.cursor()
+        """
+
+        # Si la conexión quedó en un estado inconsistente, la validación
+        # del próximo checkout la descarta
+        connection = self._checkout()
+        owner = getattr(self._local, "owner", None)
+        connection_id = getattr(connection, "connection_id", None)
+        if owner is not None and connection_id is not None:
+            with self._cond:
+                self._owned.setdefault(owner, []).append(connection_id)
+        try:
+            yield connection
+        finally:
+            if owner is not None and connection_id is not None:
+                with self._cond:
+                    self._owned[owner].remove(connection_id)
+            self._checkin(connection)
+
+
+    @contextmanager
+    def track(self, owner: object):
+        """Registrar a nombre de `owner` las conexiones que tome este hilo
+
+        Args:
+            owner: Identificador único del trabajo (por ejemplo una llamada de herramienta)
+        """
+
+        previous = getattr(self._local, "owner", None)
+        self._local.owner = owner
+        try:
+            yield
+        finally:
+            self._local.owner = previous
+            with self._cond:
+                self._owned.pop(owner, None)
+
+
+    def kill_queries(self, owner: object) -> int:
+        """Cortar con KILL QUERY las consultas en curso de las conexiones de `owner`
+
+        Usa una conexión aparte y no una del pool: cuando una consulta no
+        termina a tiempo, el pool suele estar ocupado. Devuelve la cantidad de
+        consultas cortadas.
+
+        Args:
+            owner: Identificador pasado a track()
+        """
+
+        with self._cond:
+            connection_ids = list(self._owned.get(owner, ()))
+        if not connection_ids:
+            return 0
+
+        connection = self._connect()
+        try:
+            cursor = connection.cursor()
+            for connection_id in connection_ids:
+                cursor.execute(f"KILL QUERY {int(connection_id)}")
+            cursor.close()
+        finally:
+            connection.close()
+        return len(connection_ids)
+
+
+    def stats(self) -> dict:
+        """Contadores del pool (tiempos de espera en segundos)
+
+        Args: none
+        """
+
+        with self._cond:
+            return {
+                "size": self.size,
+                "open": self._created,
+                "idle": len(self._idle),
+                "in_use": self._created - len(self._idle),
+                "waiting": self._waiting,
+                "checkouts": self._checkouts,
+                "waits": self._waits,
+                "wait_time_total": self._wait_time_total,
+                "wait_time_max": self._wait_time_max,
+                "exhausted": self._exhausted,
+                "rejected": self._rejected,
+                "discarded": self._discarded,
+            }
+
+
+    def close(self):
+        with self._cond:
+            idle, self._idle = list(self._idle), deque()
+            self._created -= len(idle)
+        for connection in idle:
+            try:
+                connection.close()
+            except Exception:
+                pass
+
+
+# Pool compartido por el proceso (API o servidor MCP)
+db_pool = DatabasePool.from_config()
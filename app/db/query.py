@@ -0,0 +1,249 @@
+import re
+
+from mysql.connector import Error
+
+from app.config import config
+from app.db.cache import QueryCache, parse_table_ttls
+from app.db.encoding import column_types, encode_columnar
+from app.db.fetch import ResultSummary, fetch_bounded, summary_result
+from app.db.guard import query_guard, QueryRejected, MAX_EXECUTION_TIME_EXCEEDED
+from app.db.pool import db_pool, PoolExhaustedError
+from app.db.result_store import result_store, estimate_row_size, estimate_size
+from app.metrics import span
+
+_IDENTIFIER = re.compile(r"^[a-z0-9_$]+$")
+
+
+def table_fingerprint(table: str) -> tuple:
+    """
+    Huella de una tabla: máximo id, una sola lectura del índice primario.
+    Cambia con los INSERTs; los UPDATEs y DELETEs solo se reflejan al vencer
+    el TTL (ver SQL_CACHE_MAX_TTL).
+
+    :param table: Nombre de la tabla.
+    :return: Tupla (max_id,); vacía si la tabla no tiene columna id (solo TTL).
+    """
+    if not _IDENTIFIER.match(table):
+        raise ValueError(f"Nombre de tabla inválido: {table}")
+
+    with db_pool.connection() as connection:
+        cursor = connection.cursor()
+        try:
+            try:
+                cursor.execute(f"SELECT MAX(id) FROM `{table}`")
+            except Error:
+                return ()
+            return tuple(cursor.fetchall()[0])
+        finally:
+            cursor.close()
+
+
+# Caché compartida por el proceso (API o servidor MCP)
+query_cache = QueryCache(
+    fingerprint=table_fingerprint,
+    table_ttls=parse_table_ttls(config.SQL_CACHE_TABLE_TTLS),
+    default_ttl=config.SQL_CACHE_DEFAULT_TTL,
+    max_entries=config.SQL_CACHE_MAX_ENTRIES,
+    max_bytes=config.SQL_CACHE_MAX_BYTES,
+    fingerprint_interval=config.SQL_CACHE_FINGERPRINT_INTERVAL,
+    max_ttl=config.SQL_CACHE_MAX_TTL,
+)
+
+
+def guard_sql_query(query: str) -> tuple[str, int | None]:
+    """
+    Valida una consulta con el guard y devuelve la consulta a ejecutar.
+
+    :param query: Consulta SQL escrita por el modelo.
+    :return: Tupla (consulta con LIMIT y MAX_EXECUTION_TIME, LIMIT agregado o None).
+    """
+    if not query_guard.enabled:
+        return query, None
+    return query_guard.rewrite(query)
+
+
+def sql_error(error: Error) -> dict:
+    if getattr(error, "errno", None) == MAX_EXECUTION_TIME_EXCEEDED:
+        return query_guard.timeout_error()
+    return {"success": False, "error": str(error)}
+
+
+def run_sql_query(query: str, use_cache: bool = config.SQL_CACHE_ENABLED) -> dict:
+    """
+    Ejecuta una consulta SQL con una conexión del pool compartido.
+
+    Las consultas de lectura se sirven desde la caché mientras sigan vigentes.
+    Los resultados que superan SQL_MAX_ROWS/SQL_MAX_BYTES se devuelven como un
+    resumen estadístico con "truncated": True. Con SQL_RESULT_FORMAT="columnar"
+    el resultado es {"columns": [...], "types": [...], "rows": [[...]]}.
+
+    :param query: Consulta SQL a ejecutar.
+    :param use_cache: Si se debe leer y guardar en la caché de resultados.
+    :return: Diccionario con los resultados de la consulta o el error.
+    """
+    try:
+        sql, limit = guard_sql_query(query)
+    except QueryRejected as e:
+        return e.to_dict()
+
+    prepared = None
+    if use_cache:
+        cached = query_cache.get(query)
+        if cached is not None:
+            return cached
+        prepared = query_cache.prepare(query)
+
+    try:
+        with span("sql.execute") as sql_span, db_pool.connection() as connection:
+            cursor = connection.cursor()
+            try:
+                if query_guard.enabled:
+                    query_guard.check_cost(cursor, sql)
+                cursor.execute(sql)
+                result = fetch_bounded(
+                    cursor,
+                    max_rows=config.SQL_MAX_ROWS,
+                    max_bytes=config.SQL_MAX_BYTES,
+                    batch_size=config.SQL_FETCH_BATCH_SIZE,
+                    sample_size=config.SQL_SUMMARY_SAMPLE_SIZE,
+                    top_values=config.SQL_SUMMARY_TOP_VALUES,
+                    result_format=config.SQL_RESULT_FORMAT,
+                )
+                if cursor.rowcount >= 0:
+                    sql_span.set(rows=cursor.rowcount)
+                if limit is not None and cursor.rowcount >= limit:
+                    result["row_limit"] = limit
+            finally:
+                cursor.close()
+
+    except QueryRejected as e:
+        return e.to_dict()
+    except PoolExhaustedError as e:
+        return {"success": False, "error": str(e)}
+    except Error as e:
+        return sql_error(e)
+
+    if prepared is not None:
+        query_cache.put(prepared, result)
+    return result
+
+
+def store_sql_query(query: str, use_cache: bool = config.SQL_CACHE_ENABLED) -> dict:
+    """
+    Ejecuta una consulta SQL y guarda el resultado completo en el almacén de
+    resultados, devolviendo su id y una vista previa.
+
+    Las herramientas que reciben `result_id` leen las filas del almacén, así
+    las filas no pasan por el modelo. Se guardan hasta RESULT_STORE_MAX_ROWS
+    filas. El tamaño se estima mientras se leen las filas: si el resultado
+    supera RESULT_STORE_MAX_RESULT_BYTES, las filas leídas y las restantes
+    alimentan un resumen estadístico (como run_sql_query) y la consulta no se
+    vuelve a ejecutar.
+    Los resultados completos se guardan también en la caché de consultas.
+
+    :param query: Consulta SQL a ejecutar.
+    :param use_cache: Si se debe leer y guardar en la caché de resultados.
+    :return: Diccionario con result_id, columnas, cantidad de filas y vista previa.
+    """
+    try:
+        sql, limit = guard_sql_query(query)
+    except QueryRejected as e:
+        return e.to_dict()
+
+    prepared = None
+    if use_cache:
+        cached = query_cache.get(query, variant="store")
+        if cached is not None:
+            return _store_rows(query, limit, **cached)
+        prepared = query_cache.prepare(query, variant="store")
+
+    max_rows = config.RESULT_STORE_MAX_ROWS
+    max_bytes = result_store.max_result_bytes
+    try:
+        with span("sql.execute") as sql_span, db_pool.connection() as connection:
+            cursor = connection.cursor()
+            try:
+                if query_guard.enabled:
+                    query_guard.check_cost(cursor, sql)
+                cursor.execute(sql)
+                if cursor.description is None:
+                    return {"success": True, "data": [], "rowcount": cursor.rowcount}
+
+                columns = [column[0] for column in cursor.description]
+                types = column_types(cursor.description)
+                rows: list[tuple] = []
+                size = estimate_size(columns, rows)
+                total_rows = 0
+                summary: ResultSummary | None = None
+                while True:
+                    batch = cursor.fetchmany(config.SQL_FETCH_BATCH_SIZE)
+                    if not batch:
+                        break
+                    for row in batch:
+                        total_rows += 1
+                        if summary is not None:
+                            summary.add(row)
+                            continue
+                        # Lo que supera el máximo de filas se lee igual (cursor sin buffer) pero no se guarda
+                        if len(rows) >= max_rows:
+                            continue
+                        row_size = estimate_row_size(row)
+                        if size + row_size > max_bytes:
+                            summary = ResultSummary(columns, config.SQL_SUMMARY_SAMPLE_SIZE, config.SQL_SUMMARY_TOP_VALUES)
+                            for previous in rows:
+                                summary.add(previous)
+                            summary.add(row)
+                            rows = []
+                            continue
+                        rows.append(row)
+                        size += row_size
+                sql_span.set(rows=total_rows)
+            finally:
+                cursor.close()
+
+    except QueryRejected as e:
+        return e.to_dict()
+    except PoolExhaustedError as e:
+        return {"success": False, "error": str(e)}
+    except Error as e:
+        return sql_error(e)
+
+    if summary is not None:
+        message = (
+            f"El resultado tiene {total_rows} filas y no cabe en el almacén de resultados ({max_bytes} bytes). "
+            "Se devuelve un resumen estadístico en lugar de un result_id. "
+            "Usa agregaciones (GROUP BY, SUM, COUNT) o filtros para obtener menos filas."
+        )
+        return summary_result(summary, types, message, config.SQL_RESULT_FORMAT)
+
+    payload = {"columns": columns, "types": types, "rows": tuple(rows), "total_rows": total_rows, "size": size}
+    if prepared is not None:
+        query_cache.put(prepared, payload, size=size)
+    return _store_rows(query, limit, **payload)
+
+
+def _store_rows(query: str, limit: int | None, columns: list[str], types: list[str], rows: tuple, total_rows: int, size: int) -> dict:
+    # Guardar las filas leídas (o tomadas de la caché) y armar la respuesta con la vista previa
+    stored = result_store.put(query, columns, types, rows, total_rows=total_rows, size_bytes=size)
+    if stored is None:
+        return {"success": False, "error": f"El resultado no cabe en el almacén de resultados ({result_store.max_result_bytes} bytes)."}
+
+    preview_rows = rows[:config.RESULT_PREVIEW_ROWS]
+    if config.SQL_RESULT_FORMAT == "columnar":
+        preview = encode_columnar(columns, types, preview_rows)
+    else:
+        preview = {"data": [dict(zip(columns, row)) for row in preview_rows]}
+
+    result = {
+        "success": True,
+        "result_id": stored.result_id,
+        "row_count": total_rows,
+        "columns": columns,
+        "types": types,
+        "preview": preview,
+    }
+    if stored.truncated:
+        result["message"] = f"Solo se guardaron las primeras {len(rows)} de {total_rows} filas."
+    elif limit is not None and total_rows >= limit:
+        result["message"] = f"El resultado se cortó en {limit} filas (LIMIT agregado automáticamente)."
+    return result
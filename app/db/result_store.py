@@ -0,0 +1,208 @@
+import time
+import uuid
+import threading
+from collections import OrderedDict
+
+from app.config import config
+
+
+class StoredResult:
+    """Resultado completo de una consulta guardado en el proceso"""
+
+    def __init__(
+        self,
+        result_id: str,
+        query: str,
+        columns: list[str],
+        types: list[str],
+        rows: list[tuple],
+        size_bytes: int,
+        expires_at: float,
+        total_rows: int,
+    ):
+        self.result_id = result_id
+        self.query = query
+        self.columns = columns
+        self.types = types
+        self.rows = rows
+        self.size_bytes = size_bytes
+        self.expires_at = expires_at
+        self.total_rows = total_rows
+        self.truncated = total_rows > len(rows)
+
+
+    def column(self, name: str) -> list:
+        """Valores de una columna
+
+        Args:
+            name: Nombre de la columna
+        """
+
+        if name not in self.columns:
+            raise ValueError(f"La columna '{name}' no existe en el resultado {self.result_id}. Columnas: {', '.join(self.columns)}")
+        index = self.columns.index(name)
+        return [row[index] for row in self.rows]
+
+
+    def first_column(self, numeric: bool) -> str | None:
+        """Primera columna numérica (o no numérica) del resultado
+
+        Args:
+            numeric: Buscar una columna numérica
+        """
+
+        numeric_types = {"int", "decimal", "float"}
+        return next((c for c, t in zip(self.columns, self.types) if (t in numeric_types) == numeric), None)
+
+
+def estimate_row_size(row: tuple) -> int:
+    # Estimación del tamaño en memoria: largo de los textos, 8 bytes por otros valores y un costo fijo por celda y fila
+    return sum((len(value) if isinstance(value, (str, bytes)) else 8) + 16 for value in row) + 64
+
+
+def estimate_size(columns: list[str], rows: list[tuple]) -> int:
+    return sum(estimate_row_size(row) for row in rows) + sum(len(c) for c in columns)
+
+
+class ResultStore:
+    """Resultados de consultas guardados por id para que las herramientas los usen
+
+    En lugar de copiar filas en los argumentos de otras herramientas, el modelo
+    recibe un `result_id` y una vista previa. Los resultados expiran tras `ttl`
+    segundos y se descartan por LRU al superar `max_entries` o `max_bytes`. Un
+    resultado de más de `max_result_bytes` no se guarda.
+
+    El almacén es del proceso: con varios workers (ADK_SESSION_BACKEND=sqlite)
+    un `result_id` de un turno anterior puede no existir en el worker que
+    atiende el turno siguiente; las herramientas responden con un error que
+    pide volver a ejecutar la consulta.
+    """
+
+    def __init__(self, ttl: float, max_entries: int, max_bytes: int, max_result_bytes: int | None = None):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.max_result_bytes = min(max_bytes, max_result_bytes or max_bytes)
+        self._results: OrderedDict[str, StoredResult] = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+        self._stored = 0
+        self._hits = 0
+        self._misses = 0
+        self._evictions = 0
+        self._expirations = 0
+        self._rejected = 0
+
+
+    def put(
+        self,
+        query: str,
+        columns: list[str],
+        types: list[str],
+        rows: list[tuple],
+        total_rows: int | None = None,
+        size_bytes: int | None = None,
+    ) -> StoredResult | None:
+        """Guardar un resultado y devolverlo con su id
+
+        Devuelve None si el resultado supera `max_result_bytes`.
+
+        Args:
+            query: Consulta que generó el resultado
+            columns: Nombres de las columnas
+            types: Tipos simplificados de las columnas
+            rows: Filas como tuplas
+            total_rows: Filas totales si `rows` quedó recortado
+            size_bytes: Tamaño ya estimado al leer las filas (se calcula si no se envía)
+        """
+
+        size = estimate_size(columns, rows) if size_bytes is None else size_bytes
+        if size > self.max_result_bytes:
+            with self._lock:
+                self._rejected += 1
+            return None
+
+        total_rows = len(rows) if total_rows is None else total_rows
+        result = StoredResult(
+            result_id=uuid.uuid4().hex[:12],
+            query=query,
+            columns=columns,
+            types=types,
+            rows=rows,
+            size_bytes=size,
+            expires_at=time.monotonic() + self.ttl,
+            total_rows=total_rows,
+        )
+
+        with self._lock:
+            self._purge_expired()
+            self._results[result.result_id] = result
+            self._bytes += size
+            self._stored += 1
+            while self._results and (len(self._results) > self.max_entries or self._bytes > self.max_bytes):
+                _, evicted = self._results.popitem(last=False)
+                self._bytes -= evicted.size_bytes
+                self._evictions += 1
+        return result
+
+
+    def get(self, result_id: str) -> StoredResult | None:
+        """Obtener un resultado guardado si no expiró
+
+        Args:
+            result_id: Id devuelto por put()
+        """
+
+        with self._lock:
+            result = self._results.get(result_id)
+            if result is None:
+                self._misses += 1
+                return None
+            if result.expires_at <= time.monotonic():
+                del self._results[result_id]
+                self._bytes -= result.size_bytes
+                self._expirations += 1
+                self._misses += 1
+                return None
+            self._results.move_to_end(result_id)
+            self._hits += 1
+            return result
+
+
+    def _purge_expired(self):
+        now = time.monotonic()
+        expired = [result_id for result_id, result in self._results.items() if result.expires_at <= now]
+        for result_id in expired:
+            self._bytes -= self._results.pop(result_id).size_bytes
+            self._expirations += 1
+
+
+    def stats(self) -> dict:
+        """Ocupación y contadores del almacén de resultados
+
+        Args: none
+        """
+
+        with self._lock:
+            return {
+                "entries": len(self._results),
+                "bytes": self._bytes,
+                "max_bytes": self.max_bytes,
+                "max_result_bytes": self.max_result_bytes,
+                "stored": self._stored,
+                "hits": self._hits,
+                "misses": self._misses,
+                "evictions": self._evictions,
+                "expirations": self._expirations,
+                "rejected": self._rejected,
+            }
+
+
+# Almacén compartido por el proceso (herramientas del agente ADK)
+result_store = ResultStore(
+    ttl=config.RESULT_STORE_TTL,
+    max_entries=config.RESULT_STORE_MAX_ENTRIES,
+    max_bytes=config.RESULT_STORE_MAX_BYTES,
+    max_result_bytes=config.RESULT_STORE_MAX_RESULT_BYTES,
+)
@@ -0,0 +1,408 @@
+import asyncio
+import logging
+from contextlib import contextmanager
+from datetime import date, datetime, timedelta
+
+from app.config import config
+from app.db.pool import DatabasePool, db_pool
+from app.db.query import run_sql_query
+
+DAILY_TABLE = "resumen_movimientos_diario"
+MONTHLY_TABLE = "resumen_movimientos_mensual"
+CATEGORY_TABLE = "resumen_categorias_mensual"
+WATERMARK_TABLE = "resumen_marcas"
+WATERMARK_NAME = "movimientos"
+# Lock de MySQL para que un solo worker actualice las tablas resumen a la vez
+LOCK_NAME = "resumen_movimientos"
+REBUILD_LOCK_WAIT = 60
+
+ROLLUP_TABLES = [DAILY_TABLE, MONTHLY_TABLE, CATEGORY_TABLE]
+
+DDL = [
+    f"""
+    CREATE TABLE IF NOT EXISTS {DAILY_TABLE} (
+        fecha DATE NOT NULL,
+        producto_id INT NOT NULL,
+        establecimiento_id INT NOT NULL,
+        cantidad_entrada DECIMAL(16,3) NOT NULL DEFAULT 0,
+        cantidad_salida DECIMAL(16,3) NOT NULL DEFAULT 0,
+        PRIMARY KEY (fecha, producto_id, establecimiento_id),
+        KEY idx_producto_fecha (producto_id, fecha),
+        KEY idx_establecimiento_fecha (establecimiento_id, fecha)
+    ) COMMENT='Entradas y salidas por día, producto y establecimiento (usar en lugar de detalle_entradas/detalle_salidas)'
+    """,
+    f"""
+    CREATE TABLE IF NOT EXISTS {MONTHLY_TABLE} (
+        mes DATE NOT NULL COMMENT 'Primer día del mes',
+        producto_id INT NOT NULL,
+        establecimiento_id INT NOT NULL,
+        cantidad_entrada DECIMAL(16,3) NOT NULL DEFAULT 0,
+        cantidad_salida DECIMAL(16,3) NOT NULL DEFAULT 0,
+        PRIMARY KEY (mes, producto_id, establecimiento_id),
+        KEY idx_producto_mes (producto_id, mes),
+        KEY idx_establecimiento_mes (establecimiento_id, mes)
+    ) COMMENT='Entradas y salidas por mes, producto y establecimiento (usar en lugar de detalle_entradas/detalle_salidas)'
+    """,
+    f"""
+    CREATE TABLE IF NOT EXISTS {CATEGORY_TABLE} (
+        mes DATE NOT NULL COMMENT 'Primer día del mes',
+        categoria_id INT NOT NULL,
+        establecimiento_id INT NOT NULL,
+        cantidad_entrada DECIMAL(16,3) NOT NULL DEFAULT 0,
+        cantidad_salida DECIMAL(16,3) NOT NULL DEFAULT 0,
+        PRIMARY KEY (mes, categoria_id, establecimiento_id),
+        KEY idx_categoria_mes (categoria_id, mes)
+    ) COMMENT='Entradas y salidas por mes, categoría y establecimiento'
+    """,
+    f"""
+    CREATE TABLE IF NOT EXISTS {WATERMARK_TABLE} (
+        nombre VARCHAR(64) NOT NULL PRIMARY KEY,
+        marca DATETIME NOT NULL,
+        actualizado_at DATETIME NOT NULL
+    ) COMMENT='Hasta qué created_at se agregaron los movimientos'
+    """,
+]
+
+# Movimientos de detalle en la ventana (marca, hasta]. La fecha del movimiento
+# es la del encabezado (entradas/salidas); la ventana usa el created_at del detalle
+_MOVEMENTS = """
+    SELECT e.created_at AS creado, d.producto_id, e.establecimiento_id,
+           d.cantidad_ingresada AS entrada, 0 AS salida
+    FROM detalle_entradas d JOIN entradas e ON e.id = d.entrada_id
+    WHERE d.created_at > %s AND d.created_at <= %s
+    UNION ALL
+    SELECT s.created_at, d.producto_id, s.establecimiento_id,
+           0, d.cantidad_salida
+    FROM detalle_salidas d JOIN salidas s ON s.id = d.salida_id
+    WHERE d.created_at > %s AND d.created_at <= %s
+"""
+
+_ADD_TOTALS = (
+    "ON DUPLICATE KEY UPDATE "
+    "cantidad_entrada = cantidad_entrada + VALUES(cantidad_entrada), "
+    "cantidad_salida = cantidad_salida + VALUES(cantidad_salida)"
+)
+
+_MONTH = "DATE_SUB(DATE(m.creado), INTERVAL DAY(m.creado) - 1 DAY)"
+
+UPSERTS = [
+    f"""
+    INSERT INTO {DAILY_TABLE} (fecha, producto_id, establecimiento_id, cantidad_entrada, cantidad_salida)
+    SELECT DATE(m.creado), m.producto_id, m.establecimiento_id, SUM(m.entrada), SUM(m.salida)
+    FROM ({_MOVEMENTS}) m
+    GROUP BY DATE(m.creado), m.producto_id, m.establecimiento_id
+    {_ADD_TOTALS}
+    """,
+    f"""
+    INSERT INTO {MONTHLY_TABLE} (mes, producto_id, establecimiento_id, cantidad_entrada, cantidad_salida)
+    SELECT {_MONTH}, m.producto_id, m.establecimiento_id, SUM(m.entrada), SUM(m.salida)
+    FROM ({_MOVEMENTS}) m
+    GROUP BY {_MONTH}, m.producto_id, m.establecimiento_id
+    {_ADD_TOTALS}
+    """,
+    f"""
+    INSERT INTO {CATEGORY_TABLE} (mes, categoria_id, establecimiento_id, cantidad_entrada, cantidad_salida)
+    SELECT {_MONTH}, p.categoria_id, m.establecimiento_id, SUM(m.entrada), SUM(m.salida)
+    FROM ({_MOVEMENTS}) m JOIN productos p ON p.id = m.producto_id
+    GROUP BY {_MONTH}, p.categoria_id, m.establecimiento_id
+    {_ADD_TOTALS}
+    """,
+]
+
+
+class RollupMaintainer:
+    """Tablas resumen de entradas/salidas mantenidas de forma incremental
+
+    Cada actualización agrega solo los detalles con created_at posterior a la
+    marca guardada en `resumen_marcas`, hasta `lag_seconds` antes de ahora
+    (para no perder transacciones que aún no confirmaron). Las tres tablas y la
+    marca se actualizan en la misma transacción y la actualización toma un lock
+    de MySQL (GET_LOCK), así una ventana nunca se suma dos veces aunque varios
+    workers corran la actualización periódica. Ediciones o borrados de
+    movimientos ya agregados no se reflejan hasta llamar a rebuild().
+
+    Solo corre con ROLLUPS_ENABLED=true, con un usuario de MySQL con permisos
+    de escritura sobre las tablas resumen (ver config.ROLLUPS_ENABLED).
+    """
+
+    def __init__(self, pool: DatabasePool, lag_seconds: float, batch_days: int):
+        self.pool = pool
+        self.lag_seconds = lag_seconds
+        self.batch_days = max(1, batch_days)
+        self.refreshed_at: datetime | None = None
+        self.watermark: datetime | None = None
+
+
+    def ensure_tables(self):
+        """Crear las tablas resumen si no existen
+
+        Args: none
+        """
+
+        with self.pool.connection() as connection:
+            cursor = connection.cursor()
+            try:
+                for statement in DDL:
+                    cursor.execute(statement)
+            finally:
+                cursor.close()
+
+
+    def _read_watermark(self, cursor) -> datetime | None:
+        cursor.execute(f"SELECT marca FROM {WATERMARK_TABLE} WHERE nombre = %s", (WATERMARK_NAME,))
+        row = cursor.fetchone()
+        if row:
+            return row[0]
+
+        # Primera vez: empezar justo antes del movimiento más antiguo
+        cursor.execute(
+            "SELECT MIN(creado) FROM ("
+            "SELECT MIN(created_at) AS creado FROM detalle_entradas "
+            "UNION ALL SELECT MIN(created_at) FROM detalle_salidas) t"
+        )
+        first = cursor.fetchone()[0]
+        return first - timedelta(seconds=1) if first else None
+
+
+    @contextmanager
+    def _named_lock(self, cursor, wait: int):
+        # GET_LOCK es por conexión y MySQL lo libera solo si la conexión se cae
+        cursor.execute("SELECT GET_LOCK(%s, %s)", (LOCK_NAME, wait))
+        acquired = cursor.fetchone()[0] == 1
+        try:
+            yield acquired
+        finally:
+            if acquired:
+                cursor.execute("SELECT RELEASE_LOCK(%s)", (LOCK_NAME,))
+                cursor.fetchone()
+
+
+    def refresh(self) -> int:
+        """Agregar los movimientos nuevos desde la última marca
+
+        Solo un proceso actualiza a la vez (GET_LOCK): si otro worker ya está
+        actualizando, esta llamada no hace nada. Devuelve la cantidad de
+        ventanas procesadas.
+
+        Args: none
+        """
+
+        with self.pool.connection() as connection:
+            cursor = connection.cursor(buffered=True)
+            try:
+                with self._named_lock(cursor, 0) as acquired:
+                    if not acquired:
+                        logging.debug("Otro proceso está actualizando las tablas resumen")
+                        return 0
+                    return self._refresh_windows(connection, cursor)
+            finally:
+                cursor.close()
+
+
+    def _refresh_windows(self, connection, cursor) -> int:
+        # Se llama con el lock tomado: la marca leída no cambia mientras tanto
+        windows = 0
+        cursor.execute("SELECT NOW()")
+        until = cursor.fetchone()[0] - timedelta(seconds=self.lag_seconds)
+        watermark = self._read_watermark(cursor)
+
+        if watermark is None:
+            # Sin movimientos todavía
+            watermark = until
+
+        while watermark < until:
+            upper = min(until, watermark + timedelta(days=self.batch_days))
+            params = (watermark, upper) * 2
+            connection.start_transaction()
+            try:
+                for statement in UPSERTS:
+                    cursor.execute(statement, params)
+                cursor.execute(
+                    f"INSERT INTO {WATERMARK_TABLE} (nombre, marca, actualizado_at) VALUES (%s, %s, NOW()) "
+                    "ON DUPLICATE KEY UPDATE marca = VALUES(marca), actualizado_at = VALUES(actualizado_at)",
+                    (WATERMARK_NAME, upper)
+                )
+                connection.commit()
+            except BaseException:
+                connection.rollback()
+                raise
+            watermark = upper
+            windows += 1
+
+        self.watermark = watermark
+        self.refreshed_at = datetime.now()
+        if windows:
+            logging.info(f"Tablas resumen actualizadas hasta {watermark} ({windows} ventanas)")
+        return windows
+
+
+    def rebuild(self):
+        """Vaciar las tablas resumen y volver a agregar todo el historial
+
+        Espera hasta `REBUILD_LOCK_WAIT` segundos a que termine la
+        actualización de otro proceso.
+
+        Args: none
+        """
+
+        with self.pool.connection() as connection:
+            cursor = connection.cursor(buffered=True)
+            try:
+                with self._named_lock(cursor, REBUILD_LOCK_WAIT) as acquired:
+                    if not acquired:
+                        raise RuntimeError("Otro proceso está actualizando las tablas resumen, intenta más tarde")
+                    for table in ROLLUP_TABLES:
+                        cursor.execute(f"TRUNCATE TABLE {table}")
+                    cursor.execute(f"DELETE FROM {WATERMARK_TABLE} WHERE nombre = %s", (WATERMARK_NAME,))
+                    self._refresh_windows(connection, cursor)
+            finally:
+                cursor.close()
+
+
+# Tablas resumen del proceso, se actualizan en el lifespan de FastAPI
+rollups = RollupMaintainer(db_pool, lag_seconds=config.ROLLUP_LAG_SECONDS, batch_days=config.ROLLUP_BATCH_DAYS)
+
+
+async def refresh_rollups_periodically(maintainer: RollupMaintainer, interval: float):
+    """Crear las tablas resumen y actualizarlas cada `interval` segundos
+
+    Args:
+        maintainer: Tablas resumen a mantener
+        interval: Segundos entre cada actualización
+    """
+
+    try:
+        await asyncio.to_thread(maintainer.ensure_tables)
+    except Exception as e:
+        logging.error(f"No se pudieron crear las tablas resumen: {str(e)}")
+        return
+
+    while True:
+        try:
+            await asyncio.to_thread(maintainer.refresh)
+        except Exception as e:
+            logging.error(f"Error al actualizar las tablas resumen: {str(e)}")
+        await asyncio.sleep(interval)
+
+
+def _parse_date(value: str, name: str) -> date:
+    try:
+        return date.fromisoformat(value)
+    except (TypeError, ValueError):
+        raise ValueError(f"{name} debe tener el formato AAAA-MM-DD: {value}")
+
+
+def movement_summary(
+    start: str,
+    end: str,
+    granularity: str = "mes",
+    group_by: list[str] | None = None,
+    producto_id: int | None = None,
+    establecimiento_id: int | None = None,
+    categoria_id: int | None = None,
+    limit: int = 100,
+) -> dict:
+    """Ejecutar un reporte de entradas/salidas sobre las tablas resumen
+
+    Mismos argumentos que movement_summary_sql(). Los errores de validación se
+    devuelven como {"success": False, "error": ...} igual que run_sql_query.
+    """
+
+    try:
+        sql = movement_summary_sql(start, end, granularity, group_by, producto_id, establecimiento_id, categoria_id, limit)
+    except ValueError as e:
+        return {"success": False, "error": str(e)}
+    return run_sql_query(sql)
+
+
+def movement_summary_sql(
+    start: str,
+    end: str,
+    granularity: str = "mes",
+    group_by: list[str] | None = None,
+    producto_id: int | None = None,
+    establecimiento_id: int | None = None,
+    categoria_id: int | None = None,
+    limit: int = 100,
+) -> str:
+    """SQL sobre las tablas resumen para un reporte de entradas/salidas
+
+    Todos los valores se validan (fechas ISO, ids enteros, columnas de una
+    lista cerrada) antes de armar el SQL. Con granularidad "mes" se incluyen
+    los meses completos de `start` y `end`.
+
+    Args:
+        start: Fecha inicial (incluida) AAAA-MM-DD
+        end: Fecha final (incluida) AAAA-MM-DD
+        granularity: "dia" o "mes"
+        group_by: Columnas de agrupación: "fecha", "producto", "establecimiento", "categoria"
+        producto_id: Filtrar por producto
+        establecimiento_id: Filtrar por establecimiento
+        categoria_id: Filtrar por categoría
+        limit: Máximo de filas
+    """
+
+    start_date = _parse_date(start, "start")
+    end_date = _parse_date(end, "end")
+    if granularity not in ("dia", "mes"):
+        raise ValueError("granularity debe ser 'dia' o 'mes'")
+    group_by = group_by or ["fecha"]
+    allowed = {"fecha", "producto", "establecimiento", "categoria"}
+    if not set(group_by) <= allowed:
+        raise ValueError(f"group_by solo admite: {', '.join(sorted(allowed))}")
+
+    # La tabla por categoría es mensual y sin producto; en otro caso se usa la
+    # tabla por producto unida a productos
+    by_category = (
+        granularity == "mes"
+        and ("categoria" in group_by or categoria_id is not None)
+        and "producto" not in group_by and producto_id is None
+    )
+
+    if granularity == "dia":
+        table, date_column = DAILY_TABLE, "fecha"
+        start_value, end_value = start_date, end_date
+    else:
+        table, date_column = (CATEGORY_TABLE if by_category else MONTHLY_TABLE), "mes"
+        start_value, end_value = start_date.replace(day=1), end_date.replace(day=1)
+
+    join_products = not by_category and ("categoria" in group_by or categoria_id is not None or "producto" in group_by)
+    category_column = "r.categoria_id" if by_category else "p.categoria_id"
+
+    columns = {
+        "fecha": f"r.{date_column}",
+        "producto": "r.producto_id, p.nombre AS producto",
+        "establecimiento": "r.establecimiento_id, e.nombre AS establecimiento",
+        "categoria": f"{category_column} AS categoria_id, c.description AS categoria",
+    }
+    group_columns = {
+        "fecha": f"r.{date_column}",
+        "producto": "r.producto_id, p.nombre",
+        "establecimiento": "r.establecimiento_id, e.nombre",
+        "categoria": f"{category_column}, c.description",
+    }
+
+    joins = []
+    if join_products:
+        joins.append("JOIN productos p ON p.id = r.producto_id")
+    if "establecimiento" in group_by:
+        joins.append("JOIN establecimientos e ON e.id = r.establecimiento_id")
+    if "categoria" in group_by:
+        joins.append(f"JOIN categorias c ON c.id = {category_column}")
+
+    where = [f"r.{date_column} BETWEEN '{start_value.isoformat()}' AND '{end_value.isoformat()}'"]
+    if producto_id is not None:
+        where.append(f"r.producto_id = {int(producto_id)}")
+    if establecimiento_id is not None:
+        where.append(f"r.establecimiento_id = {int(establecimiento_id)}")
+    if categoria_id is not None:
+        where.append(f"{category_column} = {int(categoria_id)}")
+
+    select = ", ".join(columns[column] for column in group_by)
+    group = ", ".join(group_columns[column] for column in group_by)
+    order = f"r.{date_column}" if "fecha" in group_by else "cantidad_salida DESC"
+    return (
+        f"SELECT {select}, SUM(r.cantidad_entrada) AS cantidad_entrada, SUM(r.cantidad_salida) AS cantidad_salida "
+        f"FROM {table} r {' '.join(joins)} WHERE {' AND '.join(where)} "
+        f"GROUP BY {group} ORDER BY {order} LIMIT {max(1, min(int(limit), 1000))}"
+    )
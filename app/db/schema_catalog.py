@@ -0,0 +1,282 @@
+import re
+import time
+import asyncio
+import logging
+import unicodedata
+from collections import deque
+
+from app.db.pool import DatabasePool, db_pool
+
+# Esquema de respaldo cuando no se pudo leer INFORMATION_SCHEMA
+FALLBACK_SCHEMA = """
+Tabla usuarios: id int, nombre str, role_id int (roles.id), created_at datetime
+Tabla categorias: id int, description str, created_at datetime
+Tabla detalle_entradas: id int, entrada_id int (entradas.id), producto_id int (productos.id), cantidad_ingresada decimal(10,3), created_at datetime
+Tabla detalle_salidas: id int, salida_id int (salidas.id), producto_id int (productos.id), cantidad_salida decimal(10,3), created_at datetime
+Tabla entradas: id int, establecimiento_id int (establecimientos.id), proveedor_id int nullable (proveedores.id), usuario_id int (usuarios.id), tipo_entrada str, created_at datetime
+Tabla establecimientos: id int, nombre str, direccion str, created_at datetime
+Tabla productos: id int, cod_producto str, nombre str, formato str, categoria_id int (categorias.id), precio decimal(10,2), activado boolean, created_at datetime
+Tabla proveedores: id int, nombre str, created_at datetime
+Tabla roles: id int, description str, created_at datetime
+Tabla salidas: id int, establecimiento_id int (establecimientos.id), usuario_id int (usuarios.id), tipo_salida str, created_at datetime
+Tabla stock: id int, product_id int (productos.id), establecimiento_id int (establecimientos.id), cantidad int, created_at datetime
+""".strip()
+
+# Prefijos de palabras de las preguntas (sin tildes) que apuntan a cada tabla
+TABLE_KEYWORDS = {
+    "usuarios": ["usuario", "empleado", "trabajador"],
+    "roles": ["rol", "permiso", "cargo"],
+    "categorias": ["categor", "familia"],
+    "productos": ["producto", "articulo", "item", "precio", "codigo", "formato", "catalogo"],
+    "proveedores": ["proveedor", "compra"],
+    "establecimientos": ["establecimiento", "tienda", "sucursal", "local", "almacen", "sede"],
+    "stock": ["stock", "inventario", "existencia", "disponib", "quedan"],
+    "entradas": ["entrada", "ingres", "compra", "recib", "abastec", "reposic"],
+    "detalle_entradas": ["entrada", "ingres", "compra", "recib", "abastec", "reposic"],
+    "salidas": ["salida", "venta", "vend", "despach", "egreso", "retir"],
+    "detalle_salidas": ["salida", "venta", "vend", "despach", "egreso", "retir"],
+    "resumen_movimientos_diario": ["movimiento", "diari", "resumen", "reporte", "salida", "venta", "vend", "entrada", "ingres"],
+    "resumen_movimientos_mensual": ["movimiento", "mensual", "mes", "resumen", "reporte", "salida", "venta", "vend", "entrada", "ingres"],
+    "resumen_categorias_mensual": ["categor", "familia", "mensual", "resumen", "reporte"],
+}
+
+_IDENTIFIER = re.compile(r"[a-z0-9_]+")
+
+# Columnas demasiado comunes para decidir por sí solas qué tabla usar
+_COMMON_COLUMNS = {"id", "created_at", "updated_at", "nombre", "description", "cantidad"}
+
+
+def _normalize_text(text: str) -> str:
+    text = unicodedata.normalize("NFKD", text.lower())
+    return "".join(char for char in text if not unicodedata.combining(char))
+
+
+class SchemaCatalog:
+    """Catálogo del esquema leído de INFORMATION_SCHEMA
+
+    Guarda columnas y tipos, llaves foráneas (declaradas o inferidas por el
+    nombre `<tabla>_id`), índices y filas aproximadas de cada tabla. Para cada
+    pregunta selecciona solo las tablas relevantes y las rutas de JOIN entre
+    ellas, y lo devuelve como texto compacto para el prompt.
+    """
+
+    def __init__(self, pool: DatabasePool):
+        self.pool = pool
+        self.tables: dict[str, dict] = {}
+        self.foreign_keys: list[dict] = []
+        self.refreshed_at: float | None = None
+
+
+    def refresh(self):
+        """Volver a leer el esquema desde INFORMATION_SCHEMA
+
+        Args: none
+        """
+
+        with self.pool.connection() as connection:
+            cursor = connection.cursor()
+            try:
+                cursor.execute(
+                    "SELECT table_name, table_rows, table_comment FROM information_schema.tables "
+                    "WHERE table_schema = DATABASE() AND table_type = 'BASE TABLE'"
+                )
+                table_rows = cursor.fetchall()
+                cursor.execute(
+                    "SELECT table_name, column_name, column_type, is_nullable, column_key, column_comment "
+                    "FROM information_schema.columns WHERE table_schema = DATABASE() "
+                    "ORDER BY table_name, ordinal_position"
+                )
+                column_rows = cursor.fetchall()
+                cursor.execute(
+                    "SELECT table_name, column_name, referenced_table_name, referenced_column_name "
+                    "FROM information_schema.key_column_usage "
+                    "WHERE table_schema = DATABASE() AND referenced_table_name IS NOT NULL"
+                )
+                fk_rows = cursor.fetchall()
+                cursor.execute(
+                    "SELECT table_name, index_name, column_name, non_unique FROM information_schema.statistics "
+                    "WHERE table_schema = DATABASE() ORDER BY table_name, index_name, seq_in_index"
+                )
+                index_rows = cursor.fetchall()
+            finally:
+                cursor.close()
+
+        tables: dict[str, dict] = {}
+        for name, rows, comment in table_rows:
+            tables[name] = {"rows": rows or 0, "comment": comment or "", "columns": [], "indexes": {}}
+
+        for table, column, column_type, nullable, key, comment in column_rows:
+            if table in tables:
+                tables[table]["columns"].append({
+                    "name": column,
+                    "type": column_type,
+                    "nullable": nullable == "YES",
+                    "key": key,
+                    "comment": comment or "",
+                })
+
+        for table, index, column, non_unique in index_rows:
+            if table in tables:
+                index_info = tables[table]["indexes"].setdefault(index, {"columns": [], "unique": not non_unique})
+                index_info["columns"].append(column)
+
+        foreign_keys = [
+            {"table": table, "column": column, "ref_table": ref_table, "ref_column": ref_column, "inferred": False}
+            for table, column, ref_table, ref_column in fk_rows
+            if table in tables and ref_table in tables
+        ]
+        foreign_keys += self._infer_foreign_keys(tables, foreign_keys)
+
+        # Se reemplaza todo de una vez para que los lectores nunca vean un estado a medias
+        self.tables, self.foreign_keys = tables, foreign_keys
+        self.refreshed_at = time.time()
+        logging.info(f"Catálogo de esquema actualizado: {len(tables)} tablas, {len(foreign_keys)} relaciones")
+
+
+    def _infer_foreign_keys(self, tables: dict[str, dict], declared: list[dict]) -> list[dict]:
+        # Columnas <nombre>_id sin FK declarada: se relacionan con la tabla <nombre>s / <nombre>es
+        known = {(fk["table"], fk["column"]) for fk in declared}
+        inferred = []
+        for table, info in tables.items():
+            for column in info["columns"]:
+                name = column["name"]
+                if not name.endswith("_id") or (table, name) in known:
+                    continue
+                base = name[:-3]
+                candidates = [base + "s", base + "es", base] + [t for t in tables if t.startswith(base)]
+                ref_table = next((t for t in candidates if t in tables and t != table), None)
+                if ref_table:
+                    inferred.append({"table": table, "column": name, "ref_table": ref_table, "ref_column": "id", "inferred": True})
+        return inferred
+
+
+    def select_tables(self, question: str) -> list[str]:
+        """Tablas relevantes para una pregunta, incluyendo las intermedias de los JOIN
+
+        Args:
+            question: Pregunta del usuario
+        """
+
+        text = _normalize_text(question)
+        words = set(_IDENTIFIER.findall(text))
+        selected = []
+        for table, info in self.tables.items():
+            keywords = TABLE_KEYWORDS.get(table, [])
+            singular = table[:-2] if table.endswith("es") else table[:-1] if table.endswith("s") else table
+            if (
+                table in words
+                or any(word.startswith(singular) for word in words)
+                or any(word.startswith(keyword) for word in words for keyword in keywords)
+                or any(column["name"] in words for column in info["columns"] if column["name"] not in _COMMON_COLUMNS)
+            ):
+                selected.append(table)
+
+        if not selected:
+            return sorted(self.tables)
+
+        # Agregar las tablas intermedias de la ruta más corta entre cada par
+        result = set(selected)
+        for i, source in enumerate(selected):
+            for target in selected[i + 1:]:
+                result.update(self._join_path(source, target))
+        return sorted(result)
+
+
+    def _graph(self) -> dict[str, set[str]]:
+        graph: dict[str, set[str]] = {table: set() for table in self.tables}
+        for fk in self.foreign_keys:
+            graph[fk["table"]].add(fk["ref_table"])
+            graph[fk["ref_table"]].add(fk["table"])
+        return graph
+
+
+    def _join_path(self, source: str, target: str) -> list[str]:
+        graph = self._graph()
+        previous = {source: None}
+        queue = deque([source])
+        while queue:
+            current = queue.popleft()
+            if current == target:
+                path = []
+                while current is not None:
+                    path.append(current)
+                    current = previous[current]
+                return path
+            for neighbor in graph.get(current, ()):
+                if neighbor not in previous:
+                    previous[neighbor] = current
+                    queue.append(neighbor)
+        return []
+
+
+    def render(self, tables: list[str]) -> str:
+        """Texto compacto con las tablas, sus columnas, índices y relaciones
+
+        Args:
+            tables: Tablas a incluir
+        """
+
+        lines = []
+        for table in tables:
+            info = self.tables[table]
+            columns = ", ".join(
+                f"{column['name']} {column['type']}"
+                + (" PK" if column["key"] == "PRI" else "")
+                + (" null" if column["nullable"] else "")
+                + (f" ({column['comment']})" if column["comment"] else "")
+                for column in info["columns"]
+            )
+            header = f"Tabla {table} (~{info['rows']} filas)"
+            if info["comment"]:
+                header += f" - {info['comment']}"
+            lines.append(f"{header}: {columns}")
+
+            indexes = [
+                f"{name}({', '.join(index['columns'])})"
+                for name, index in info["indexes"].items() if name != "PRIMARY"
+            ]
+            if indexes:
+                lines.append(f"  Índices: {'; '.join(indexes)}")
+
+        selected = set(tables)
+        joins = [
+            f"{fk['table']}.{fk['column']} = {fk['ref_table']}.{fk['ref_column']}"
+            for fk in self.foreign_keys
+            if fk["table"] in selected and fk["ref_table"] in selected
+        ]
+        if joins:
+            lines.append("JOINs: " + "; ".join(joins))
+
+        return "\n".join(lines)
+
+
+    def context_for(self, question: str) -> str:
+        """Esquema a incluir en el prompt para una pregunta
+
+        Args:
+            question: Pregunta del usuario
+        """
+
+        if not self.tables:
+            return FALLBACK_SCHEMA
+        return self.render(self.select_tables(question))
+
+
+# Catálogo compartido por el proceso, se carga en el lifespan de FastAPI
+schema_catalog = SchemaCatalog(db_pool)
+
+
+async def refresh_schema_periodically(catalog: SchemaCatalog, interval: float):
+    """Refrescar el catálogo cada `interval` segundos
+
+    Args:
+        catalog: Catálogo a refrescar
+        interval: Segundos entre cada actualización
+    """
+
+    while True:
+        try:
+            await asyncio.to_thread(catalog.refresh)
+        except Exception as e:
+            logging.error(f"Error al actualizar el catálogo de esquema: {str(e)}")
+        await asyncio.sleep(interval)
@@ -1,27 +1,122 @@
+import sys
+import asyncio
+from contextlib import asynccontextmanager
+
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse, PlainTextResponse
 
-from app.api.v1.agent.route import router_agent_chat
+from app.api.v1.agent.route import router_agent_chat, agent_controller
+from app.db.pool import db_pool
+from app.db.schema_catalog import schema_catalog, refresh_schema_periodically
+from app.db.rollups import rollups, refresh_rollups_periodically
+from app.metrics import registry, MetricsMiddleware
+from app.startup import readiness
 from app.config import config
 
+
+async def warm_up_database():
+    await asyncio.to_thread(db_pool.warmup)
+
+    # El pool valida la conexión con un ping al entregarla
+    def check():
+        with db_pool.connection():
+            pass
+
+    await asyncio.to_thread(check)
+
+
+async def warm_up_mcp():
+    from app.mcp_custom.mcp_pool import mcp_pool
+
+    await mcp_pool.start()
+    # Tomar un servidor del pool lo reinicia si no arrancó y deja su catálogo cargado
+    async with mcp_pool.lease() as server:
+        await server.catalog.get(server.session)
+
+
+# Ciclo de vida de la aplicación: recursos compartidos entre peticiones
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # El warm-up corre en segundo plano: /health/live responde de inmediato y
+    # /health/ready recién cuando el pool, los servidores MCP y el agente están listos
+    warmup_task = None
+    if config.STARTUP_WARMUP:
+        warmup_task = asyncio.create_task(readiness.warm_up(
+            {
+                "database": warm_up_database,
+                "mcp": warm_up_mcp,
+                "agent": agent_controller.warm_up,
+            },
+            retry_seconds=config.STARTUP_RETRY_SECONDS
+        ))
+    else:
+        readiness.mark_ready()
+
+    schema_task = asyncio.create_task(refresh_schema_periodically(schema_catalog, config.SCHEMA_REFRESH_SECONDS))
+    rollup_task = (
+        asyncio.create_task(refresh_rollups_periodically(rollups, config.ROLLUP_REFRESH_SECONDS))
+        if config.ROLLUPS_ENABLED else None
+    )
+    yield
+    if warmup_task:
+        warmup_task.cancel()
+    schema_task.cancel()
+    if rollup_task:
+        rollup_task.cancel()
+
+    await agent_controller.close()
+    # Solo se cierran los clientes que llegaron a cargarse
+    mcp_pool_module = sys.modules.get("app.mcp_custom.mcp_pool")
+    if mcp_pool_module:
+        await mcp_pool_module.mcp_pool.close()
+    llm_module = sys.modules.get("app.mcp_custom.llm")
+    if llm_module:
+        await llm_module.close_llm_client()
+    db_pool.close()
+
+
 # Crear una instancia de la aplicación FastAPI 
 app = FastAPI(
     title="Cerámica de Altura - Agent API",
     description="API para el agente de Cerámica de Altura utilizando FastMCP y MySQL.",
-    version="1.0.0"
+    version="1.0.0",
+    lifespan=lifespan
 )
 
 # Configurar CORS
 app.add_middleware(
     CORSMiddleware,
     allow_origins=["*"], # Solo para desarrollo
-    allow_methods=["POST"],
+    allow_methods=["GET", "POST"],
     allow_headers=["Content-Type"],
+    expose_headers=["X-User-Id", "X-Session-Id", "Server-Timing"],
 )
 
+# Medir cada petición y, si está activado, enviar el header Server-Timing
+app.add_middleware(MetricsMiddleware, timing_header=config.METRICS_TIMING_HEADER)
+
 # Incluir el router del agente
 app.include_router(router_agent_chat, prefix="/api/v1")
 
+
+# Liveness: el proceso responde
+@app.get("/health/live", include_in_schema=False)
+async def health_live():
+    return {"status": "ok"}
+
+
+# Readiness: 503 hasta que termine el warm-up del arranque
+@app.get("/health/ready", include_in_schema=False)
+async def health_ready():
+    return JSONResponse(readiness.status(), status_code=200 if readiness.ready else 503)
+
+
+# Métricas en formato de texto de Prometheus
+@app.get("/metrics", include_in_schema=False)
+async def metrics():
+    return PlainTextResponse(registry.render(), media_type="text/plain; version=0.0.4")
+
 # Iniciar la aplicación
 if __name__ == "__main__":
     import uvicorn
@@ -0,0 +1,239 @@
+import json
+import time
+import uuid
+import asyncio
+import logging
+from collections import OrderedDict
+from typing import Callable
+
+try:
+    import tiktoken
+    _encoding = tiktoken.get_encoding("o200k_base")
+except Exception: # tiktoken es opcional, se estima por caracteres
+    _encoding = None
+
+
+def count_tokens(text: str) -> int:
+    """Contar (o estimar) los tokens de un texto
+
+    Args:
+        text: Texto a medir
+    """
+
+    if _encoding is not None:
+        return len(_encoding.encode(text, disallowed_special=()))
+    return len(text) // 4 + 1
+
+
+def message_text(message: dict) -> str:
+    """Obtener el texto de un mensaje de chat para medirlo
+
+    Args:
+        message: Mensaje en formato de OpenAI
+    """
+
+    content = message.get("content")
+    if isinstance(content, str):
+        text = content
+    elif isinstance(content, list):
+        # Contenido de MCP (TextContent) o partes de OpenAI
+        parts = []
+        for part in content:
+            part_text = part.get("text") if isinstance(part, dict) else getattr(part, "text", None)
+            parts.append(part_text if part_text is not None else str(part))
+        text = "\n".join(parts)
+    else:
+        text = ""
+
+    if message.get("tool_calls"):
+        text += json.dumps(message["tool_calls"], default=str)
+    return text
+
+
+class ConversationHistory:
+    """Historial de chat de MCPClient acotado a un presupuesto de tokens
+
+    El historial es solo de agregado mientras cabe en el presupuesto, así el
+    prefijo enviado al proveedor no cambia entre peticiones y el prompt caching
+    sigue acertando. Al superar `max_tokens` se compacta una sola vez hasta
+    dejarlo en el 75% del presupuesto:
+
+    1. Se eliminan las instrucciones de sistema repetidas (queda la última).
+    2. Se recortan las salidas de herramientas fuera de los últimos `keep_turns` turnos.
+    3. Se eliminan los turnos más antiguos completos (esquema, usuario, herramientas y respuestas).
+
+    El prompt de sistema inicial nunca se modifica.
+    """
+
+    def __init__(self, system_prompt: str, max_tokens: int, keep_turns: int, tool_output_tokens: int):
+        self.max_tokens = max_tokens
+        self.keep_turns = max(1, keep_turns)
+        self.tool_output_tokens = tool_output_tokens
+        self._prefix = {"role": "system", "content": system_prompt}
+        self._prefix_tokens = count_tokens(system_prompt)
+        self._entries: list[list] = [] # [mensaje, tokens]
+
+
+    @property
+    def total_tokens(self) -> int:
+        return self._prefix_tokens + sum(tokens for _, tokens in self._entries)
+
+
+    def append(self, message: dict):
+        """Agregar un mensaje y compactar si se superó el presupuesto
+
+        Args:
+            message: Mensaje en formato de OpenAI
+        """
+
+        self._entries.append([message, count_tokens(message_text(message))])
+        if self.total_tokens > self.max_tokens:
+            self._compact()
+
+
+    def window(self) -> list:
+        """Mensajes a enviar al modelo
+
+        Args: none
+        """
+
+        return [self._prefix] + [message for message, _ in self._entries]
+
+
+    def __len__(self) -> int:
+        return len(self._entries) + 1
+
+
+    def _turn_starts(self) -> list[int]:
+        # Un turno empieza en el mensaje del usuario o en los mensajes de sistema
+        # que lo preceden (el esquema de la consulta se agrega antes de la pregunta)
+        starts = []
+        for i, (message, _) in enumerate(self._entries):
+            if message.get("role") != "user":
+                continue
+            start = i
+            while start > 0 and self._entries[start - 1][0].get("role") == "system":
+                start -= 1
+            starts.append(start)
+        return starts
+
+
+    def _compact(self):
+        before = self.total_tokens
+        target = int(self.max_tokens * 0.75)
+
+        # 1. Instrucciones de sistema repetidas: conservar solo la última aparición
+        seen = set()
+        deduped = []
+        for entry in reversed(self._entries):
+            message = entry[0]
+            if message.get("role") == "system" and isinstance(message.get("content"), str):
+                if message["content"] in seen:
+                    continue
+                seen.add(message["content"])
+            deduped.append(entry)
+        self._entries = list(reversed(deduped))
+
+        # 2. Salidas de herramientas de turnos antiguos: dejar solo un extracto
+        starts = self._turn_starts()
+        recent_start = starts[-self.keep_turns] if len(starts) >= self.keep_turns else 0
+        if self.total_tokens > target:
+            for entry in self._entries[:recent_start]:
+                message, tokens = entry
+                if message.get("role") == "tool" and tokens > self.tool_output_tokens:
+                    excerpt = message_text(message)[: self.tool_output_tokens * 2]
+                    entry[0] = {
+                        **message,
+                        "content": f"{excerpt}\n[Resultado de herramienta recortado, ~{tokens} tokens originales]"
+                    }
+                    entry[1] = count_tokens(entry[0]["content"])
+
+        # 3. Turnos completos más antiguos, sin tocar el turno en curso
+        while self.total_tokens > target:
+            starts = self._turn_starts()
+            if len(starts) < 2:
+                break
+            self._entries = self._entries[starts[1]:]
+
+        logging.info(f"Historial compactado de {before} a {self.total_tokens} tokens")
+
+
+class Conversation:
+    """Historial de una conversación y el lock que ordena sus turnos"""
+
+    def __init__(self, user_id: str, session_id: str, history: ConversationHistory):
+        self.user_id = user_id
+        self.session_id = session_id
+        self.history = history
+        self.lock = asyncio.Lock()
+
+
+class ConversationStore:
+    """Historiales de chat por usuario y sesión con un máximo residente
+
+    Cada petición con el mismo user_id y session_id continúa el mismo
+    ConversationHistory. Las conversaciones sin uso durante `ttl_seconds` se
+    eliminan en el siguiente acceso y al superar `max_conversations` se
+    elimina la menos usada recientemente (LRU).
+
+    Los historiales son del proceso: con varios workers la conversación
+    continúa solo en el worker que la tiene.
+    """
+
+    def __init__(self, factory: Callable[[], ConversationHistory], max_conversations: int, ttl_seconds: float):
+        self.factory = factory
+        self.max_conversations = max(1, max_conversations)
+        self.ttl_seconds = ttl_seconds
+        self._conversations: OrderedDict[tuple[str, str], tuple[Conversation, float]] = OrderedDict()
+        self._created = 0
+        self._evicted = 0
+
+
+    def get(self, user_id: str, session_id: str | None = None) -> Conversation:
+        """Obtener la conversación del usuario o crearla si no existe
+
+        Args:
+            user_id: Identificador del usuario
+            session_id: Identificador de la sesión (se genera uno si no se envía)
+        """
+
+        session_id = session_id or uuid.uuid4().hex
+        key = (user_id, session_id)
+        now = time.monotonic()
+
+        # Ordenado por último acceso: las vencidas están al inicio
+        while self._conversations:
+            _, (_, last_access) = next(iter(self._conversations.items()))
+            if now - last_access < self.ttl_seconds:
+                break
+            self._conversations.popitem(last=False)
+            self._evicted += 1
+
+        entry = self._conversations.get(key)
+        if entry is None:
+            conversation = Conversation(user_id, session_id, self.factory())
+            self._created += 1
+        else:
+            conversation = entry[0]
+        self._conversations[key] = (conversation, now)
+        self._conversations.move_to_end(key)
+
+        while len(self._conversations) > self.max_conversations:
+            self._conversations.popitem(last=False)
+            self._evicted += 1
+        return conversation
+
+
+    def stats(self) -> dict:
+        """Conversaciones residentes y contadores
+
+        Args: none
+        """
+
+        return {
+            "conversations": len(self._conversations),
+            "max_conversations": self.max_conversations,
+            "ttl_seconds": self.ttl_seconds,
+            "created": self._created,
+            "evicted": self._evicted,
+        }
@@ -0,0 +1,41 @@
+import httpx
+from openai import AsyncOpenAI, DefaultAsyncHttpxClient
+
+from app.config import config
+
+# Cliente compartido por todo el proceso (se crea en el primer uso)
+_client: AsyncOpenAI | None = None
+
+
+def get_llm_client() -> AsyncOpenAI:
+    """Obtener el cliente asíncrono de OpenAI compartido por el proceso
+
+    Todas las instancias de MCPClient reutilizan el mismo pool de conexiones
+    HTTP keep-alive en lugar de abrir uno por petición.
+    """
+
+    global _client
+    if _client is None:
+        _client = AsyncOpenAI(
+            http_client=DefaultAsyncHttpxClient(
+                limits=httpx.Limits(
+                    max_connections=config.LLM_MAX_CONNECTIONS,
+                    max_keepalive_connections=config.LLM_MAX_KEEPALIVE_CONNECTIONS,
+                    keepalive_expiry=config.LLM_KEEPALIVE_EXPIRY,
+                ),
+                timeout=httpx.Timeout(config.LLM_TIMEOUT, connect=10.0),
+            )
+        )
+    return _client
+
+
+async def close_llm_client():
+    """Cerrar el cliente compartido y sus conexiones
+
+    Args: none
+    """
+
+    global _client
+    if _client is not None:
+        await _client.close()
+        _client = None
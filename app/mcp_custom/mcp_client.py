@@ -1,14 +1,25 @@
 import json
+import time
 import asyncio
-from contextlib import AsyncExitStack
+from contextlib import AsyncExitStack, nullcontext
 
 from mcp import ClientSession, StdioServerParameters
 from mcp.client.stdio import stdio_client
 
-from openai import OpenAI
 from openai.types.chat import ChatCompletionMessageParam, ChatCompletionToolParam
 
-from app.mcp_custom.schemas import ChatResponse, ChatResponseGraphicOnly
+from app.mcp_custom.schemas import ChatResponse, ChatResponseGraphicOnly, Data
+from app.mcp_custom.mcp_pool import MCPSessionPool, MCPServerWorker
+from app.mcp_custom.tool_catalog import ToolCatalog
+from app.mcp_custom.llm import get_llm_client
+from app.mcp_custom.history import ConversationHistory, ConversationStore
+from app.mcp_custom.plan_cache import plan_cache, tool_result_succeeded
+from app.db.schema_catalog import schema_catalog
+from app.agent.charts import point_budget, prepare_series
+from app.db.encoding import dumps_compact
+from app.metrics import span, record, record_spans
+from app.admission import llm_limiter, mcp_limiter, read_ahead
+from app.config import config
 
 import logging
 
@@ -37,17 +48,123 @@ SYSTEM_PROMPT = """
 """
 
 
+def schema_message(query: str) -> ChatCompletionMessageParam:
+    """Mensaje de sistema con las tablas y JOINs relevantes para la consulta
+
+    Args:
+        query: La consulta del usuario
+    """
+
+    return {
+        "role": "system",
+        "content": "Esquema de la base de datos relevante para la consulta:\n" + schema_catalog.context_for(query)
+    }
+
+
+def downsample_graphics(response: ChatResponse | ChatResponseGraphicOnly):
+    """Ajustar cada gráfico de la respuesta a su presupuesto de puntos
+
+    Args:
+        response: Respuesta parseada del modelo
+    """
+
+    for graphic in response.list_graphics:
+        budget = point_budget(graphic.type.value, config.CHART_MAX_LINE_POINTS, config.CHART_MAX_BARS, config.CHART_MAX_SLICES)
+        labels, values = prepare_series(
+            graphic.type.value,
+            [item.description for item in graphic.data],
+            [item.value for item in graphic.data],
+            budget
+        )
+        graphic.data = [Data(description=label, value=value) for label, value in zip(labels, values)]
+
+
+def usage_attributes(usage) -> dict:
+    """Tokens de una respuesta del modelo como atributos de un span
+
+    Args:
+        usage: Campo usage de la respuesta (puede ser None)
+    """
+
+    if usage is None:
+        return {}
+    return {"prompt_tokens": usage.prompt_tokens, "completion_tokens": usage.completion_tokens}
+
+
+def content_bytes(content) -> int:
+    """Tamaño en bytes del resultado de una herramienta MCP
+
+    Args:
+        content: Lista de contenidos del resultado o texto
+    """
+
+    if isinstance(content, str):
+        return len(content.encode())
+    return sum(len((getattr(item, "text", None) or "").encode()) for item in content or [])
+
+
+def take_server_spans(content):
+    """Registrar los spans medidos en el servidor MCP y quitarlos del resultado
+
+    El servidor agrega "_spans" al JSON de la herramienta (ver run_query en
+    mcp_server_sql); se registran en las métricas de este proceso y el
+    resultado que ve el modelo queda sin ellos.
+
+    Args:
+        content: Lista de contenidos del resultado de la herramienta
+    """
+
+    if not isinstance(content, list):
+        return content
+    items = []
+    for item in content:
+        text = getattr(item, "text", None)
+        if text and '"_spans":' in text:
+            try:
+                payload = json.loads(text)
+            except json.JSONDecodeError:
+                payload = None
+            if isinstance(payload, dict) and "_spans" in payload:
+                record_spans(payload.pop("_spans"))
+                item = item.model_copy(update={"text": dumps_compact(payload)})
+        items.append(item)
+    return items
+
+
+INSIGHTS_PROMPT = "Genera insights basados en los datos obtenidos. Response al usuario con esto."
+
+# Herramienta cuyos planes (pregunta -> SQL) se guardan en el caché de planes
+PLAN_TOOL = "execute_sql_query"
+
+
+def new_history() -> ConversationHistory:
+    return ConversationHistory(
+        SYSTEM_PROMPT,
+        max_tokens=config.HISTORY_MAX_TOKENS,
+        keep_turns=config.HISTORY_KEEP_TURNS,
+        tool_output_tokens=config.HISTORY_TOOL_OUTPUT_TOKENS
+    )
+
+
+# Usuario por defecto cuando la petición no envía uno (el mismo que el agente ADK)
+DEFAULT_USER_ID = "user_1"
+
+# Historiales de /chat-agent-stream por usuario y sesión
+conversation_store = ConversationStore(
+    new_history,
+    max_conversations=config.HISTORY_MAX_CONVERSATIONS,
+    ttl_seconds=config.HISTORY_TTL,
+)
+
+
 class MCPClient:
-    def __init__(self):
+    def __init__(self, history: ConversationHistory | None = None):
         self.session: ClientSession
+        self.tool_catalog = ToolCatalog()
         self.exit_stack = AsyncExitStack()
-        self.client = OpenAI()
-        self.messages: list[ChatCompletionMessageParam] = [
-            {
-                "role": "system",
-                "content": SYSTEM_PROMPT
-            },
-        ]
+        self.client = get_llm_client()
+        # Con un historial de conversation_store el cliente continúa esa conversación
+        self.messages = history if history is not None else new_history()
 
 
     async def connect_to_server(self, server_script_path: str):
@@ -76,13 +193,26 @@ class MCPClient:
         # Iniciar el transporte stdio y la sesión del cliente
         stdio_transport = await self.exit_stack.enter_async_context(stdio_client(server_params)) # Comunicación stdio con el servidor
         self.stdio, self.write = stdio_transport
-        self.session = await self.exit_stack.enter_async_context(ClientSession(self.stdio, self.write)) # Sesión MCP
+        self.tool_catalog = ToolCatalog()
+        self.session = await self.exit_stack.enter_async_context(
+            ClientSession(self.stdio, self.write, message_handler=self.tool_catalog.handle_message)
+        ) # Sesión MCP
         await self.session.initialize()
 
         # Listar herramientas disponibles 
-        response = await self.session.list_tools()
-        tools = response.tools
-        logging.info(f"Conectado al servidor MCP en {server_script_path} con herramientas: {[tool.name for tool in tools]}")
+        tools = await self.tool_catalog.get(self.session)
+        logging.info(f"Conectado al servidor MCP en {server_script_path} con herramientas: {[tool['function']['name'] for tool in tools]}")
+
+
+    def use_server(self, server: MCPServerWorker):
+        """Usar la sesión y el catálogo de herramientas de un servidor del pool
+
+        Args:
+            server: Servidor MCP tomado del pool
+        """
+
+        self.session = server.session # type: ignore[assignment]
+        self.tool_catalog = server.catalog
 
 
     async def process_query_stream(self, query: str):
@@ -92,7 +222,8 @@ class MCPClient:
             query: La consulta del usuario
         """
         
-        # Preparar el mensaje inicial del chat
+        # Preparar el mensaje inicial del chat con el esquema relevante para la consulta
+        self.messages.append(schema_message(query))
         self.messages.append(
             {
                 "role": "user",
@@ -100,39 +231,28 @@ class MCPClient:
             }
         )
 
-        # Obtener la lista de herramientas disponibles desde el servidor MCP
-        response = await self.session.list_tools()
-        available_tools: list[ChatCompletionToolParam] = [
-            ChatCompletionToolParam(
-                type="function",
-                function={
-                    "name": tool.name,
-                    "description": str(tool.description),
-                    "parameters": tool.inputSchema,
-                }
-            )
-            for tool in response.tools
-        ]
+        # Si ya hay un plan para esta pregunta, ejecutar el SQL sin pedirle al
+        # modelo que lo genere y usarlo solo para redactar la respuesta
+        plan_messages = await self.run_cached_plan(query)
+        if plan_messages:
+            for message in plan_messages:
+                self.messages.append(message)
+            self.messages.append({"role": "system", "content": INSIGHTS_PROMPT})
+            async for content in self._stream_completion():
+                yield content
+            return
 
-        # Enviar la consulta al modelo GPT-4o con las herramientas disponibles
-        stream = self.client.chat.completions.create(
-            model="gpt-4o",
-            messages=self.messages,
-            tools=available_tools,
-            max_tokens=1000,
-            stream=True
-        )
+        # Obtener la lista de herramientas disponibles (en caché por servidor MCP)
+        available_tools: list[ChatCompletionToolParam] = await self.tool_catalog.get(self.session)
 
+        # Enviar la consulta al modelo GPT-4o con las herramientas disponibles
         tool_dict = {}
-        for event in stream:
-            # print(event.to_json())
-            content = event.choices[0].delta.content
-            tool_calls = event.choices[0].delta.tool_calls
-            if content:
-                yield content
+        async for delta in read_ahead(self._completion_deltas("llm.completion", tools=available_tools)):
+            if delta.content:
+                yield delta.content
 
-            if tool_calls:
-                for tool_call in tool_calls:
+            if delta.tool_calls:
+                for tool_call in delta.tool_calls:
                     index = str(tool_call.index)
                     args = tool_call.function.arguments # type: ignore[attr-defined]
                     name = tool_call.function.name # type: ignore[attr-defined]
@@ -141,47 +261,187 @@ class MCPClient:
                     # Si la herramienta ya existe, concatenar los argumentos y nombres
                     # Si no, crear una nueva entrada
                     if index not in tool_dict:
-                        tool_dict[index] = { "type": "function", "id": index, "function": {} }
+                        tool_dict[index] = { "type": "function", "id": tool_call.id or index, "function": {} }
                     if args:
                         tool_dict[index]["function"]["arguments"] = tool_dict[index]["function"].get("arguments", "") +  args
                     if name:
                         tool_dict[index]["function"]["name"] = tool_dict[index]["function"].get("name", "") + name
 
         if tool_dict:
-            for key in tool_dict:
-                tool_name = tool_dict[key]["function"]["name"] 
-                tool_args = json.loads(tool_dict[key]["function"]["arguments"])
-
-                # Llamar a la herramienta en el servidor MCP
-                result = await self.session.call_tool(tool_name, tool_args)
-                logging.info(f"Llamada a herramienta {tool_name} con los argumentos {tool_args}")
-
-                # Actualizar el contexto del chat con la llamada a la herramienta y su resultado
-                self.messages.append({
-                    "role": "assistant",
-                    "tool_calls": [tool_dict[key]], # type: ignore[attr-defined]
-                })
+            tool_calls = list(tool_dict.values())
+            results = await self.call_tools(tool_calls)
+            self.record_plan(query, tool_calls, results)
+
+            # Actualizar el contexto del chat con todas las llamadas y sus resultados
+            self.messages.append({
+                "role": "assistant",
+                "tool_calls": tool_calls, # type: ignore[attr-defined]
+            })
+            for tool_call, content in zip(tool_calls, results):
                 self.messages.append({
                     "role": "tool",
-                    "content": result.content,
-                    "tool_call_id": key  # type: ignore[attr-defined]
-                })
-                self.messages.append({
-                    "role": "system",
-                    "content": "Genera insights basados en los datos obtenidos. Response al usuario con esto."
+                    "content": content,
+                    "tool_call_id": tool_call["id"]  # type: ignore[attr-defined]
                 })
+            self.messages.append({
+                "role": "system",
+                "content": INSIGHTS_PROMPT
+            })
 
-                stream = self.client.chat.completions.create(
-                    model="gpt-4o",
-                    messages=self.messages,
-                    max_tokens=1000,
-                    stream=True
-                )
+            # Una sola respuesta del modelo con los resultados de todas las herramientas
+            async for content in self._stream_completion():
+                yield content
+
+
+    async def _stream_completion(self):
+        # Respuesta en stream del modelo, sin herramientas, sobre el historial actual
+        async for delta in read_ahead(self._completion_deltas("llm.answer")):
+            if delta.content:
+                yield delta.content
+
+
+    async def _completion_deltas(self, metric: str, **kwargs):
+        # Stream del modelo sobre el historial actual con un cupo del proveedor
+        # LLM; se consume con read_ahead para liberar el cupo apenas termina el
+        # stream del proveedor y no cuando el cliente termina de leer
+        async with llm_limiter.slot():
+            start = time.perf_counter()
+            first_chunk = True
+            usage = None
+            stream = await self.client.chat.completions.create(
+                model="gpt-4o",
+                messages=self.messages.window(),
+                max_tokens=1000,
+                stream=True,
+                stream_options={"include_usage": True},
+                **kwargs
+            )
+
+            async for event in stream:
+                # print(event.to_json())
+                if event.usage:
+                    usage = event.usage
+                if not event.choices:
+                    continue
+                if first_chunk:
+                    record("llm.ttft", time.perf_counter() - start)
+                    first_chunk = False
+                yield event.choices[0].delta
+            record(metric, time.perf_counter() - start, **usage_attributes(usage))
+
+
+    async def run_cached_plan(self, query: str) -> list[ChatCompletionMessageParam] | None:
+        """Ejecutar el SQL del caché de planes para la consulta, si existe
+
+        Devuelve la llamada a la herramienta y su resultado como mensajes del
+        chat, o None si no hay plan o el SQL falló (en ese caso la consulta
+        sigue el camino normal con el modelo).
+
+        Args:
+            query: La consulta del usuario
+        """
+
+        if not config.PLAN_CACHE_ENABLED:
+            return None
+
+        with span("plan_cache.lookup") as lookup:
+            await plan_cache.refresh_entities()
+            plan = plan_cache.lookup(query)
+            lookup.set(hit=plan is not None)
+        if plan is None:
+            return None
+
+        key, sql = plan
+        with span("mcp.tool", tool=PLAN_TOOL, cached_plan=True) as tool_span:
+            try:
+                result = await self.session.call_tool(PLAN_TOOL, {"query": sql})
+                content = take_server_spans(result.content)
+                success = not result.isError and tool_result_succeeded(content)
+                tool_span.set(bytes=content_bytes(content))
+            except Exception as e:
+                logging.warning(f"Error al ejecutar el plan en caché: {str(e)}")
+                success = False
+
+        plan_cache.record_result(key, success)
+        if not success:
+            return None
+
+        logging.info(f"Plan en caché para la consulta: {key}")
+        tool_call = {
+            "type": "function",
+            "id": "plan-cache",
+            "function": {"name": PLAN_TOOL, "arguments": json.dumps({"query": sql}, ensure_ascii=False)}
+        }
+        return [
+            {"role": "assistant", "tool_calls": [tool_call]}, # type: ignore[list-item]
+            {"role": "tool", "content": content, "tool_call_id": tool_call["id"]} # type: ignore[list-item]
+        ]
+
+
+    def record_plan(self, query: str, tool_calls: list[dict], results: list):
+        """Guardar el SQL del turno en el caché de planes
+
+        Solo se guarda cuando el modelo hizo una única consulta SQL y funcionó;
+        con varias consultas no se sabe cuál responde a la pregunta.
+
+        Args:
+            query: La consulta del usuario
+            tool_calls: Llamadas a herramientas del turno
+            results: Resultados de cada llamada
+        """
+
+        if not config.PLAN_CACHE_ENABLED:
+            return
+
+        sql_calls = [
+            (tool_call, result) for tool_call, result in zip(tool_calls, results)
+            if tool_call["function"].get("name") == PLAN_TOOL
+        ]
+        if len(sql_calls) != 1 or not tool_result_succeeded(sql_calls[0][1]):
+            return
+        try:
+            sql = json.loads(sql_calls[0][0]["function"].get("arguments") or "{}").get("query")
+        except json.JSONDecodeError:
+            return
+        if sql:
+            plan_cache.record(query, sql)
+
+
+    async def call_tools(self, tool_calls: list[dict]) -> list:
+        """Ejecutar en paralelo las llamadas a herramientas de un mismo turno
+
+        Las llamadas se envían juntas al servidor MCP con un máximo de
+        TOOL_CONCURRENCY simultáneas. Un error en una llamada se devuelve como
+        su resultado para que el modelo pueda corregirla sin perder las demás.
 
-                for event in stream:
-                    content = event.choices[0].delta.content
-                    if content:
-                        yield content
+        Args:
+            tool_calls: Llamadas en formato {"id", "function": {"name", "arguments"}}
+        """
+
+        semaphore = asyncio.Semaphore(max(1, config.TOOL_CONCURRENCY))
+
+        async def call(tool_call: dict):
+            tool_name = tool_call["function"].get("name", "")
+            try:
+                tool_args = json.loads(tool_call["function"].get("arguments") or "{}")
+            except json.JSONDecodeError as e:
+                return f"Argumentos inválidos para {tool_name}: {str(e)}"
+
+            async with semaphore:
+                with span("mcp.tool", tool=tool_name) as tool_span:
+                    try:
+                        # Llamar a la herramienta en el servidor MCP
+                        result = await self.session.call_tool(tool_name, tool_args)
+                    except Exception as e:
+                        logging.error(f"Error en la herramienta {tool_name}: {str(e)}")
+                        return f"Error al ejecutar {tool_name}: {str(e)}"
+                    content = take_server_spans(result.content)
+                    tool_span.set(bytes=content_bytes(content))
+
+            logging.info(f"Llamada a herramienta {tool_name} con los argumentos {tool_args}")
+            return content
+
+        return await asyncio.gather(*(call(tool_call) for tool_call in tool_calls))
 
 
     async def get_graphic_recommendation(self) -> ChatResponseGraphicOnly:
@@ -199,20 +459,27 @@ class MCPClient:
                 Según tu recomendación anterior de gráfico, definir "barras", "líneas"
                 o "pastel".
                 Si detectas que no es necesario gráfico, no colocar nada.
+                """ + f"""
+                Máximo {config.CHART_MAX_LINE_POINTS} puntos en "lineas", {config.CHART_MAX_BARS}
+                en "barras" y {config.CHART_MAX_SLICES} en "pastel"; agrupa el resto en "Otros".
                 """
             }
         )
         
         # Enviar la consulta al modelo GPT-4o
-        response = self.client.chat.completions.parse(
-            model="gpt-4o-2024-08-06",
-            response_format=ChatResponseGraphicOnly,
-            messages=self.messages,
-        )
+        async with llm_limiter.slot():
+            with span("llm.graphic") as graphic_span:
+                response = await self.client.chat.completions.parse(
+                    model="gpt-4o-2024-08-06",
+                    response_format=ChatResponseGraphicOnly,
+                    messages=self.messages.window(),
+                )
+                graphic_span.set(**usage_attributes(response.usage))
 
 
         # Retornar la respuesta parseada
         if response.choices[0].message.parsed:
+            downsample_graphics(response.choices[0].message.parsed)
             # Guardar la respuesta del modelo
             self.messages.append(
                 {
@@ -245,33 +512,43 @@ class MCPClient:
                 "role": "system",
                 "content": SYSTEM_PROMPT
             },
+            schema_message(query),
             {
                 "role": "user",
                 "content": query
             }
         ]
 
-        # Obtener la lista de herramientas disponibles desde el servidor MCP
-        response = await self.session.list_tools()
-        available_tools: list[ChatCompletionToolParam] = [
-            ChatCompletionToolParam(
-                type="function",
-                function={
-                    "name": tool.name,
-                    "description": str(tool.description),
-                    "parameters": tool.inputSchema,
-                }
-            )
-            for tool in response.tools
-        ]
+        # Con un plan en caché se salta la generación del SQL
+        plan_messages = await self.run_cached_plan(query)
+        if plan_messages:
+            messages.extend(plan_messages)
+            async with llm_limiter.slot():
+                with span("llm.answer") as answer_span:
+                    response = await self.client.chat.completions.parse(
+                        model="gpt-4o-2024-08-06",
+                        response_format=ChatResponse,
+                        messages=messages,
+                    )
+                    answer_span.set(**usage_attributes(response.usage))
+            if response.choices[0].message.parsed:
+                downsample_graphics(response.choices[0].message.parsed)
+                return response.choices[0].message.parsed
+            return response.choices[0].message.content or ""
+
+        # Obtener la lista de herramientas disponibles (en caché por servidor MCP)
+        available_tools: list[ChatCompletionToolParam] = await self.tool_catalog.get(self.session)
 
         # Enviar la consulta al modelo GPT-4o con las herramientas disponibles
-        response = self.client.chat.completions.create(
-            model="gpt-4o",
-            messages=messages,
-            tools=available_tools,
-            max_tokens=1000 # Limitar la respuesta a 1000 tokens
-        )
+        async with llm_limiter.slot():
+            with span("llm.completion") as completion_span:
+                response = await self.client.chat.completions.create(
+                    model="gpt-4o",
+                    messages=messages,
+                    tools=available_tools,
+                    max_tokens=1000 # Limitar la respuesta a 1000 tokens
+                )
+                completion_span.set(**usage_attributes(response.usage))
 
         # Procesar la respuesta del modelo
         final_text = [] # Almacenar la respuesta final hacia el usuario
@@ -286,35 +563,36 @@ class MCPClient:
 
         # Si el mensaje contiene llamadas a herramientas, procesarlas
         if msg.tool_calls:
-            for tool_call in msg.tool_calls:
-                tool_name = tool_call.function.name # type: ignore[attr-defined]
-                tool_args = json.loads(tool_call.function.arguments) # type: ignore[attr-defined]
-
-                # Llamar a la herramienta en el servidor MCP
-                result = await self.session.call_tool(tool_name, tool_args)
-                logging.info(f"Llamada a herramienta {tool_name} con los argumentos {tool_args}")
-
-                # Actualizar el contexto del chat con la llamada a la herramienta y su resultado
-                messages.append({
-                    "role": "assistant",
-                    "tool_calls": msg.tool_calls, # type: ignore[attr-defined]
-                })
+            tool_calls = [tool_call.model_dump(exclude_none=True) for tool_call in msg.tool_calls]
+            results = await self.call_tools(tool_calls)
+            self.record_plan(query, tool_calls, results)
+
+            # Actualizar el contexto del chat con todas las llamadas y sus resultados
+            messages.append({
+                "role": "assistant",
+                "tool_calls": tool_calls, # type: ignore[attr-defined]
+            })
+            for tool_call, content in zip(tool_calls, results):
                 messages.append({
                     "role": "tool",
-                    "content": result.content,
-                    "tool_call_id": tool_call.id  # type: ignore[attr-defined]
+                    "content": content,
+                    "tool_call_id": tool_call["id"]  # type: ignore[attr-defined]
                 })
 
-                # Volver a enviar la consulta al modelo con el contexto actualizado
-                response = self.client.chat.completions.parse(
-                    model="gpt-4o-2024-08-06",
-                    response_format=ChatResponse,
-                    messages=messages,
-                )
+            # Volver a enviar la consulta al modelo una sola vez con el contexto actualizado
+            async with llm_limiter.slot():
+                with span("llm.answer") as answer_span:
+                    response = await self.client.chat.completions.parse(
+                        model="gpt-4o-2024-08-06",
+                        response_format=ChatResponse,
+                        messages=messages,
+                    )
+                    answer_span.set(**usage_attributes(response.usage))
 
-                # Agregar la nueva respuesta del modelo a la respuesta final
-                if response.choices[0].message.parsed:
-                    return response.choices[0].message.parsed
+            # Agregar la nueva respuesta del modelo a la respuesta final
+            if response.choices[0].message.parsed:
+                downsample_graphics(response.choices[0].message.parsed)
+                return response.choices[0].message.parsed
 
 
         return "\n".join(final_text)
@@ -354,41 +632,43 @@ class MCPClient:
 
 
 # Método para procesar una consulta externa desde API u otro módulo
-async def procesar_mensaje(client: MCPClient, consulta: str, mcp_path: str) -> str | ChatResponse:
+async def procesar_mensaje(client: MCPClient, consulta: str, pool: MCPSessionPool) -> str | ChatResponse:
     """Procesar una consulta utilizando el cliente MCP
 
     Args:
         client: Instancia del cliente MCP
         consulta: Consulta del usuario
+        pool: Pool de sesiones MCP del que se toma la sesión
     """
 
-    try:
-        await client.connect_to_server(mcp_path)
+    async with mcp_limiter.slot(), pool.lease() as server:
+        client.use_server(server)
         respuesta = await client.process_query(consulta)
         return respuesta
-    finally:
-        await client.cleanup()
 
 # Método para procesar una consulta externa desde API u otro módulo
-async def procesar_mensaje_stream(client: MCPClient, consulta: str, mcp_path: str):
+async def procesar_mensaje_stream(client: MCPClient, consulta: str, pool: MCPSessionPool, lock: asyncio.Lock | None = None):
     """Procesar una consulta en forma stream utilizando el cliente MCP
 
+    Genera eventos (tipo, datos): "token" por cada fragmento de texto y
+    "graphic" con la recomendación de gráficos al final. El cupo de
+    mcp_limiter lo toma quien llama antes de enviar la respuesta (ver
+    chat_agent_stream_controller), así el rechazo sale como 429/503.
+
     Args:
         client: Instancia del cliente MCP
         consulta: Consulta del usuario
+        pool: Pool de sesiones MCP del que se toma la sesión
+        lock: Lock de la conversación, para que sus turnos no se mezclen en el historial
     """
 
-    try:
-        await client.connect_to_server(mcp_path)
+    async with lock or nullcontext(), pool.lease() as server:
+        client.use_server(server)
         async for chunk in client.process_query_stream(consulta):
-            yield chunk
-            await asyncio.sleep(0)
+            yield "token", chunk
 
         graphic_recommendation = await client.get_graphic_recommendation()
-        yield "[[GRAPHIC]]" + graphic_recommendation.model_dump_json()
-
-    finally:
-        await client.cleanup()
+        yield "graphic", graphic_recommendation.model_dump(mode="json")
 
 # Método principal para ejecutar el cliente MCP de forma independiente
 async def main():
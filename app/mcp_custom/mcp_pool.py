@@ -0,0 +1,255 @@
+import sys
+import time
+import asyncio
+import logging
+from contextlib import asynccontextmanager
+
+from mcp import ClientSession, StdioServerParameters
+from mcp.client.stdio import stdio_client
+
+from app.config import config
+from app.metrics import span, record
+from app.mcp_custom.tool_catalog import ToolCatalog
+
+
+class MCPServerWorker:
+    """Servidor MCP (subproceso stdio) con su sesión de cliente ya inicializada
+
+    La sesión se abre y se cierra dentro de una tarea propia del worker, así los
+    contextos de anyio de stdio_client/ClientSession siempre se cierran en la
+    misma tarea que los abrió, sin importar qué petición usó la sesión.
+    """
+
+    def __init__(self, server_params: StdioServerParameters, worker_id: int):
+        self.server_params = server_params
+        self.worker_id = worker_id
+        self.session: ClientSession | None = None
+        self.catalog = ToolCatalog()
+        self.uses = 0
+        self._task: asyncio.Task | None = None
+        self._ready = asyncio.Event()
+        self._stop = asyncio.Event()
+        self._error: BaseException | None = None
+
+
+    @property
+    def alive(self) -> bool:
+        return self._task is not None and not self._task.done() and self.session is not None
+
+
+    async def start(self, timeout: float):
+        """Levantar el subproceso y esperar a que la sesión esté inicializada
+
+        Args:
+            timeout: Segundos máximos de espera para el handshake inicial
+        """
+
+        self.uses = 0
+        self.catalog.invalidate()
+        self._ready = asyncio.Event()
+        self._stop = asyncio.Event()
+        self._error = None
+        self._task = asyncio.create_task(self._run(), name=f"mcp-server-{self.worker_id}")
+
+        with span("mcp.start"):
+            try:
+                await asyncio.wait_for(self._ready.wait(), timeout)
+            except asyncio.TimeoutError:
+                await self.stop()
+                raise RuntimeError(f"El servidor MCP {self.worker_id} no respondió en {timeout}s")
+
+        if self.session is None:
+            raise RuntimeError(f"No se pudo iniciar el servidor MCP {self.worker_id}: {self._error}")
+
+        # Cargar el catálogo de herramientas antes de la primera petición
+        await self.catalog.get(self.session)
+        logging.info(f"Servidor MCP {self.worker_id} iniciado")
+
+
+    async def _run(self):
+        try:
+            async with stdio_client(self.server_params) as (read, write):
+                async with ClientSession(read, write, message_handler=self.catalog.handle_message) as session:
+                    await session.initialize()
+                    self.session = session
+                    self._ready.set()
+                    await self._stop.wait()
+        except Exception as e:
+            self._error = e
+            logging.error(f"El servidor MCP {self.worker_id} terminó con error: {str(e)}")
+        finally:
+            self.session = None
+            self._ready.set()
+
+
+    async def is_healthy(self, timeout: float) -> bool:
+        """Validar que el subproceso siga vivo y responda a un ping
+
+        Args:
+            timeout: Segundos máximos de espera para el ping
+        """
+
+        if not self.alive:
+            return False
+        try:
+            await asyncio.wait_for(self.session.send_ping(), timeout) # type: ignore[union-attr]
+            return True
+        except Exception as e:
+            logging.warning(f"El servidor MCP {self.worker_id} no respondió al ping: {str(e)}")
+            return False
+
+
+    async def stop(self, timeout: float = 5):
+        """Cerrar la sesión y terminar el subproceso
+
+        Args:
+            timeout: Segundos máximos de espera antes de cancelar la tarea
+        """
+
+        if self._task is None:
+            return
+
+        task, self._task = self._task, None
+        self._stop.set()
+        try:
+            await asyncio.wait_for(task, timeout)
+        except (asyncio.TimeoutError, asyncio.CancelledError):
+            task.cancel()
+        except Exception:
+            pass
+
+
+    async def restart(self, timeout: float):
+        await self.stop()
+        await self.start(timeout)
+
+
+class MCPSessionPool:
+    """Pool de servidores MCP pre-iniciados que las peticiones toman y devuelven
+
+    Cada sesión se valida con un ping antes de entregarse, se reinicia si el
+    servidor murió y se recicla (nuevo subproceso) después de `max_uses` usos.
+    """
+
+    def __init__(
+        self,
+        server_params: StdioServerParameters,
+        size: int,
+        max_uses: int,
+        start_timeout: float,
+        healthcheck_timeout: float,
+    ):
+        self.size = max(1, size)
+        self.max_uses = max_uses
+        self.start_timeout = start_timeout
+        self.healthcheck_timeout = healthcheck_timeout
+        self._workers = [MCPServerWorker(server_params, i) for i in range(self.size)]
+        self._idle: asyncio.Queue[MCPServerWorker] = asyncio.Queue()
+        self._background: set[asyncio.Task] = set()
+        self._lock = asyncio.Lock()
+        self._started = False
+
+
+    @classmethod
+    def from_config(cls) -> "MCPSessionPool":
+        # Se ejecuta como módulo (-m) para que el servidor pueda importar el paquete app
+        server_params = StdioServerParameters(
+            command=sys.executable,
+            args=["-m", config.MCP_SERVER_MODULE],
+            env=None
+        )
+        return cls(
+            server_params,
+            size=config.MCP_POOL_SIZE,
+            max_uses=config.MCP_POOL_MAX_USES,
+            start_timeout=config.MCP_START_TIMEOUT,
+            healthcheck_timeout=config.MCP_HEALTHCHECK_TIMEOUT,
+        )
+
+
+    async def start(self):
+        """Iniciar todos los servidores del pool
+
+        Los servidores que fallen al iniciar quedan en el pool y se vuelven a
+        intentar levantar la próxima vez que se pidan.
+        """
+
+        async with self._lock:
+            if self._started:
+                return
+
+            results = await asyncio.gather(
+                *(worker.start(self.start_timeout) for worker in self._workers),
+                return_exceptions=True
+            )
+            for worker, result in zip(self._workers, results):
+                if isinstance(result, BaseException):
+                    logging.error(f"Error al iniciar el servidor MCP {worker.worker_id}: {str(result)}")
+                self._idle.put_nowait(worker)
+
+            self._started = True
+            logging.info(f"Pool MCP iniciado con {self.size} servidores")
+
+
+    @asynccontextmanager
+    async def lease(self):
+        """Tomar una sesión MCP del pool y devolverla al terminar
+
+        Uso:
+            async with pool.lease() as server:
+                await server.session.call_tool(...)
+        """
+
+        if not self._started:
+            await self.start()
+
+        start = time.perf_counter()
+        worker = await self._idle.get()
+        try:
+            if not await worker.is_healthy(self.healthcheck_timeout):
+                logging.warning(f"Reiniciando el servidor MCP {worker.worker_id}")
+                await worker.restart(self.start_timeout)
+        except BaseException:
+            self._idle.put_nowait(worker)
+            raise
+
+        worker.uses += 1
+        # Espera por un servidor libre más el ping (y el reinicio si hizo falta)
+        record("mcp.lease", time.perf_counter() - start)
+        try:
+            yield worker
+        finally:
+            if worker.uses >= self.max_uses:
+                task = asyncio.create_task(self._recycle(worker))
+                self._background.add(task)
+                task.add_done_callback(self._background.discard)
+            else:
+                self._idle.put_nowait(worker)
+
+
+    async def _recycle(self, worker: MCPServerWorker):
+        logging.info(f"Reciclando el servidor MCP {worker.worker_id} tras {worker.uses} usos")
+        try:
+            await worker.restart(self.start_timeout)
+        except Exception as e:
+            logging.error(f"Error al reciclar el servidor MCP {worker.worker_id}: {str(e)}")
+        finally:
+            self._idle.put_nowait(worker)
+
+
+    async def close(self):
+        """Detener todos los servidores del pool
+
+        Args: none
+        """
+
+        for task in list(self._background):
+            task.cancel()
+        await asyncio.gather(*(worker.stop() for worker in self._workers), return_exceptions=True)
+        self._idle = asyncio.Queue()
+        self._started = False
+        logging.info("Pool MCP detenido")
+
+
+# Pool compartido por toda la aplicación, se inicia en el lifespan de FastAPI
+mcp_pool = MCPSessionPool.from_config()
@@ -0,0 +1,312 @@
+import re
+import json
+import time
+import asyncio
+import logging
+import threading
+import unicodedata
+from collections import OrderedDict
+from typing import Callable
+
+from app.config import config
+from app.db.pool import db_pool
+
+# Literales que se parametrizan en la pregunta, en orden de prioridad
+_LITERAL_PATTERNS = [
+    ("texto", re.compile(r"'([^']+)'|\"([^\"]+)\"")),
+    ("fecha", re.compile(r"\b(\d{4}-\d{2}-\d{2}|\d{1,2}/\d{1,2}/\d{4})\b")),
+    ("codigo", re.compile(r"\b([a-z]+[-_]?\d+[a-z0-9-]*)\b", re.IGNORECASE)),
+    ("numero", re.compile(r"\b(\d+(?:\.\d+)?)\b")),
+]
+_SQL_DATE = re.compile(r"'\d{4}-\d{2}-\d{2}")
+_NUMBER = re.compile(r"^\d+(?:\.\d+)?$")
+
+
+def _fold(text: str) -> str:
+    # Minúsculas y sin tildes
+    text = unicodedata.normalize("NFKD", text.lower())
+    return "".join(char for char in text if not unicodedata.combining(char))
+
+
+def parameterize_question(question: str, entities: list[str]) -> tuple[str, list[tuple[str, str]]]:
+    """Separar una pregunta en plantilla normalizada y literales
+
+    "stock del producto P-001 en la tienda Centro" con la entidad "centro"
+    queda como ("stock del producto {codigo} en la tienda {entidad}",
+    [("codigo", "P-001"), ("entidad", "Centro")]).
+
+    Args:
+        question: Pregunta del usuario
+        entities: Nombres conocidos (establecimientos) a parametrizar
+    """
+
+    literals: list[tuple[int, str, str]] = []
+    text = question.strip()
+    folded = _fold(text)
+    taken = [False] * len(text)
+
+    def take(start: int, end: int, kind: str):
+        if any(taken[start:end]):
+            return
+        for i in range(start, end):
+            taken[i] = True
+        literals.append((start, kind, text[start:end]))
+
+    # Nombres conocidos primero (los más largos antes). Solo si quitar tildes no
+    # cambió el largo del texto, para que las posiciones sigan siendo válidas
+    searchable = entities if len(folded) == len(text) else []
+    for entity in sorted(searchable, key=len, reverse=True):
+        for match in re.finditer(rf"\b{re.escape(entity)}\b", folded):
+            take(match.start(), match.end(), "entidad")
+
+    for kind, pattern in _LITERAL_PATTERNS:
+        for match in pattern.finditer(text):
+            group = next(i for i in range(1, (match.lastindex or 0) + 1) if match.group(i) is not None)
+            take(match.start(group), match.end(group), kind)
+
+    literals.sort()
+    template_parts = []
+    position = 0
+    for start, kind, value in literals:
+        template_parts.append(_fold(text[position:start]))
+        template_parts.append("{" + kind + "}")
+        position = start + len(value)
+    template_parts.append(_fold(text[position:]))
+
+    template = "".join(template_parts)
+    template = re.sub(r"[^\w{}\s]", " ", template)
+    template = re.sub(r"\s+", " ", template).strip()
+    return template, [(kind, value) for _, kind, value in literals]
+
+
+def _string_spans(sql: str) -> list[tuple[int, int]]:
+    # Posiciones del contenido de cada literal de texto '...' del SQL
+    spans = []
+    i = 0
+    while i < len(sql):
+        if sql[i] != "'":
+            i += 1
+            continue
+        end = i + 1
+        while end < len(sql):
+            if sql[end] == "\\":
+                end += 2
+            elif sql[end] == "'" and sql[end + 1:end + 2] == "'":
+                end += 2
+            elif sql[end] == "'":
+                break
+            else:
+                end += 1
+        spans.append((i + 1, end))
+        i = end + 1
+    return spans
+
+
+def parameterize_sql(sql: str, literals: list[tuple[str, str]]) -> str | None:
+    """Reemplazar en el SQL los literales de la pregunta por marcadores {p0}, {p1}...
+
+    Los números se buscan fuera de los textos del SQL y el resto de los
+    literales solo dentro de textos '...', así el valor del usuario siempre
+    queda entre comillas. Devuelve None si algún literal no aparece en el SQL
+    o aparece más de una vez (en "producto 1" con `p.id = 1 AND p.activado = 1`
+    no se sabe cuál 1 es el de la pregunta), o si el SQL tiene fechas fijas que
+    no salieron de la pregunta (por ejemplo "este mes" resuelto a una fecha).
+
+    Args:
+        sql: Consulta que funcionó para la pregunta
+        literals: Literales de la pregunta (tipo, valor)
+    """
+
+    template = sql.replace("{", "{{").replace("}", "}}")
+    for index, (kind, value) in enumerate(literals):
+        spans = _string_spans(template)
+
+        def in_string(match: re.Match) -> bool:
+            return any(start <= match.start() and match.end() <= end for start, end in spans)
+
+        if kind == "numero":
+            pattern = re.compile(rf"(?<![\w.{{]){re.escape(value)}(?![\w.])")
+            matches = [match for match in pattern.finditer(template) if not in_string(match)]
+        else:
+            pattern = re.compile(re.escape(value), re.IGNORECASE)
+            matches = [match for match in pattern.finditer(template) if in_string(match)]
+        if len(matches) != 1:
+            return None
+        match = matches[0]
+        template = template[:match.start()] + "{p" + str(index) + "}" + template[match.end():]
+
+    if _SQL_DATE.search(template):
+        return None
+    return template
+
+
+def _escape_literal(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("'", "''")
+
+
+class PlanCache:
+    """Caché de planes: pregunta normalizada -> SQL que ya funcionó
+
+    Los literales de la pregunta (textos entre comillas, fechas, códigos,
+    números y nombres de establecimientos) se parametrizan, así "stock de la
+    tienda Centro" y "stock de la tienda Norte" usan el mismo plan. El SQL se
+    vuelve a ejecutar contra datos frescos sin pedirle al modelo que lo genere.
+    Un plan que falla `max_failures` veces seguidas se elimina.
+    """
+
+    def __init__(self, max_entries: int, max_failures: int, entity_loader: Callable[[], list[str]], entity_ttl: float):
+        self.max_entries = max_entries
+        self.max_failures = max_failures
+        self.entity_loader = entity_loader
+        self.entity_ttl = entity_ttl
+        self._plans: OrderedDict[str, dict] = OrderedDict()
+        self._entities: list[str] = []
+        self._entities_loaded_at = 0.0
+        self._lock = threading.Lock()
+
+        self._hits = 0
+        self._misses = 0
+        self._stored = 0
+        self._failures = 0
+        self._evictions = 0
+
+
+    async def refresh_entities(self):
+        """Recargar los nombres conocidos si ya vencieron
+
+        Args: none
+        """
+
+        if time.monotonic() - self._entities_loaded_at < self.entity_ttl:
+            return
+        try:
+            names = await asyncio.to_thread(self.entity_loader)
+            self._entities = [_fold(name) for name in names if name]
+        except Exception as e:
+            logging.warning(f"No se pudieron cargar los nombres para el caché de planes: {str(e)}")
+        self._entities_loaded_at = time.monotonic()
+
+
+    def lookup(self, question: str) -> tuple[str, str] | None:
+        """Buscar un plan para la pregunta y devolver (llave, SQL listo para ejecutar)
+
+        Args:
+            question: Pregunta del usuario
+        """
+
+        template, literals = parameterize_question(question, self._entities)
+        with self._lock:
+            plan = self._plans.get(template)
+            if plan is None or [kind for kind, _ in literals] != plan["kinds"]:
+                self._misses += 1
+                return None
+            self._plans.move_to_end(template)
+
+        params = {}
+        for index, (kind, value) in enumerate(literals):
+            if kind == "numero" and not _NUMBER.match(value):
+                with self._lock:
+                    self._misses += 1
+                return None
+            params[f"p{index}"] = _escape_literal(value)
+
+        with self._lock:
+            self._hits += 1
+        return template, plan["sql"].format(**params)
+
+
+    def record(self, question: str, sql: str):
+        """Guardar el SQL que funcionó para una pregunta
+
+        Args:
+            question: Pregunta del usuario
+            sql: Consulta ejecutada con éxito
+        """
+
+        template, literals = parameterize_question(question, self._entities)
+        sql_template = parameterize_sql(sql, literals)
+        if sql_template is None:
+            return
+
+        with self._lock:
+            self._plans[template] = {"sql": sql_template, "kinds": [kind for kind, _ in literals], "failures": 0}
+            self._plans.move_to_end(template)
+            self._stored += 1
+            while len(self._plans) > self.max_entries:
+                self._plans.popitem(last=False)
+                self._evictions += 1
+
+
+    def record_result(self, key: str, success: bool):
+        """Registrar el resultado de ejecutar un plan
+
+        Args:
+            key: Llave devuelta por lookup()
+            success: Si la consulta funcionó
+        """
+
+        with self._lock:
+            plan = self._plans.get(key)
+            if plan is None:
+                return
+            if success:
+                plan["failures"] = 0
+                return
+            self._failures += 1
+            plan["failures"] += 1
+            if plan["failures"] >= self.max_failures:
+                del self._plans[key]
+                self._evictions += 1
+                logging.info(f"Plan eliminado tras {plan['failures']} fallos: {key}")
+
+
+    def stats(self) -> dict:
+        """Aciertos y ocupación del caché de planes
+
+        Args: none
+        """
+
+        with self._lock:
+            lookups = self._hits + self._misses
+            return {
+                "entries": len(self._plans),
+                "hits": self._hits,
+                "misses": self._misses,
+                "hit_rate": self._hits / lookups if lookups else 0.0,
+                "stored": self._stored,
+                "failures": self._failures,
+                "evictions": self._evictions,
+            }
+
+
+def load_establishment_names() -> list[str]:
+    with db_pool.connection() as connection:
+        cursor = connection.cursor()
+        try:
+            cursor.execute("SELECT nombre FROM establecimientos")
+            return [row[0] for row in cursor.fetchall()]
+        finally:
+            cursor.close()
+
+
+def tool_result_succeeded(content) -> bool:
+    """Validar que el resultado de execute_sql_query sea {"success": true, ...}
+
+    Args:
+        content: Contenido devuelto por el servidor MCP
+    """
+
+    try:
+        text = content[0].text if isinstance(content, list) else content
+        return bool(json.loads(text).get("success"))
+    except Exception:
+        return False
+
+
+# Caché de planes compartido por el proceso
+plan_cache = PlanCache(
+    max_entries=config.PLAN_CACHE_MAX_ENTRIES,
+    max_failures=config.PLAN_CACHE_MAX_FAILURES,
+    entity_loader=load_establishment_names,
+    entity_ttl=config.PLAN_CACHE_ENTITY_TTL,
+)
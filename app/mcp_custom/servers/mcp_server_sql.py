@@ -1,158 +1,126 @@
+import asyncio
 import logging
-import mysql.connector
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable
 from mcp.server.fastmcp import FastMCP
-from mysql.connector import Error
 from dotenv import load_dotenv
-import os
+from app.admission import AdmissionRejected, Limiter
+from app.config import config
+from app.db.pool import db_pool
+from app.db.query import run_sql_query
+from app.db.rollups import movement_summary
+from app.db.encoding import dumps_compact
+from app.metrics import collect_spans
 
 load_dotenv()
 
-# Cargar variables de entorno desde .env
-DB_HOST = os.getenv("DB_HOST", "localhost")
-DB_USER = os.getenv("DB_USER", "root")
-DB_PASSWORD = os.getenv("DB_PASSWORD", "password")
-DB_NAME = os.getenv("DB_NAME", "mi_base_de_datos")
-
 # Inicializar el servidor MCP
 mcp = FastMCP("Cerámica de Altura - Agent", dependencies=["mysql-connector-python"], port=4003)
 
+# Las consultas bloqueantes (mysql.connector) corren en hilos de trabajo para
+# que el servidor siga atendiendo otras llamadas mientras tanto
+query_executor = ThreadPoolExecutor(max_workers=max(1, config.MCP_SQL_MAX_IN_FLIGHT), thread_name_prefix="mcp-sql")
+query_limiter = Limiter("mcp_sql", config.MCP_SQL_MAX_IN_FLIGHT, config.MCP_SQL_QUEUE, config.MCP_SQL_QUEUE_TIMEOUT)
 
-def connect_to_database(host: str, user: str, password: str, database: str):
-    """
-    Conecta a una base de datos MySQL y devuelve la conexión.
 
-    :param host: Dirección del servidor MySQL (e.g., 'localhost').
-    :param user: Nombre de usuario para la conexión.
-    :param password: Contraseña del usuario.
-    :param database: Nombre de la base de datos a la que se desea conectar.
-    :return: Objeto de conexión si la conexión es exitosa, None en caso de error.
+async def run_query(function: Callable[..., dict], *args) -> dict:
+    """Ejecutar una consulta en un hilo de trabajo con cupo y plazo
+
+    Si se vence el plazo se corta la consulta en MySQL con KILL QUERY y se
+    responde con un error; el cupo se libera cuando el hilo termina, para no
+    superar el máximo de consultas en curso. Los spans medidos (sql.execute)
+    se agregan al resultado en "_spans" para que el cliente los registre en
+    las métricas de la API.
+
+    Args:
+        function: Función bloqueante que ejecuta la consulta
+        args: Argumentos de la función
     """
+
     try:
-        connection = mysql.connector.connect(
-            host=host, user=user, password=password, database=database
-        )
-        if connection.is_connected():
-            logging.info("Conexión a la base de datos MySQL exitosa.")
-            return connection
-    except Error as e:
-        logging.error(f"Error al conectar a la base de datos: {e}")
-        return None
+        ticket = await query_limiter.acquire()
+    except AdmissionRejected as e:
+        return {"success": False, "error": str(e), "retry_after": e.retry_after}
+
+    owner = object()
+    spans: list = []
 
-    return None
+    def tracked():
+        with collect_spans(spans), db_pool.track(owner):
+            return function(*args)
+
+    loop = asyncio.get_running_loop()
+    future = loop.run_in_executor(query_executor, tracked)
+    future.add_done_callback(lambda _: ticket.release())
+    try:
+        result = await asyncio.wait_for(asyncio.shield(future), config.MCP_SQL_TIMEOUT)
+        return {**result, "_spans": spans} if spans else result
+    except asyncio.TimeoutError:
+        try:
+            # En el executor por defecto: los hilos de query_executor pueden estar todos ocupados
+            killed = await loop.run_in_executor(None, db_pool.kill_queries, owner)
+            logging.warning(f"{function.__name__} superó {config.MCP_SQL_TIMEOUT:g}s, se cortaron {killed} consultas")
+        except Exception as e:
+            logging.error(f"No se pudo cortar la consulta de {function.__name__}: {str(e)}")
+        return {"success": False, "error": f"La consulta superó el tiempo máximo de {config.MCP_SQL_TIMEOUT:g}s, intenta con una consulta más acotada"}
 
 
 @mcp.tool()
-def execute_sql_query(query: str) -> dict:
+async def execute_sql_query(query: str) -> str:
     """
-    Ejecuta una consulta SQL y devuelve los resultados en formato de diccionario.
-
-    Descripción de la tabla usuarios:
-    - id: Identificador único del usuario (int)
-    - nombre: Nombre del usuario (str)
-    - role_id: Identificador del rol asociado (int)
-    - created_at: Fecha de creación del usuario (datetime)
-
-    Descripción de la tabla categorias
-    - id: Identificador único de la categoría (int)
-    - description: Descripción de la categoría (str)
-    - created_at: Fecha de creación de la categoría (datetime)
-
-    Descripción de la tabla detalle_entradas
-    - id: Identificador único del detalle de entrada (int)
-    - entrada_id: Identificador de la entrada asociada (int)
-    - producto_id: Identificador del producto asociado (int)
-    - cantidad_ingresada: Cantidad ingresada del producto (decimal 10,3)
-    - created_at: Fecha de creación del detalle de entrada (datetime)
-
-    Descripción de la tabla detalle_salidas
-    - id: Identificador único del detalle de salida (int)
-    - salida_id: Identificador de la salida asociada (int)
-    - producto_id: Identificador del producto asociado (int)
-    - cantidad_salida: Cantidad salida del producto (decimal 10,3)
-    - created_at: Fecha de creación del detalle de salida (datetime)
-
-    Descripción de la tabla entradas
-    - id: Identificador único de la entrada (int)
-    - establecimiento_id: Identificador del establecimiento asociado (int)
-    - proveedor_id: Identificador del proveedor asociado (int, nullable)
-    - usuario_id: Identificador del usuario que registró la entrada (int)
-    - tipo_entrada: Tipo de entrada (str)
-    - created_at: Fecha de creación de la entrada (datetime)
-
-    Descripción de la tabla establecimientos
-    - id: Identificador único del establecimiento (int)
-    - nombre: Nombre del establecimiento (str)
-    - direccion: Dirección del establecimiento (str)
-    - created_at: Fecha de creación del establecimiento (datetime)
-
-    Descripción de la tabla productos
-    - id: Identificador único del producto (int)
-    - cod_producto: Código único del producto (str)
-    - nombre: Nombre del producto (str)
-    - formato: Formato o presentación del producto (str)
-    - categoria_id: Identificador de la categoría asociada (int)
-    - precio: Precio del producto (decimal 10,2)
-    - activado: Indica si el producto está activo (boolean)
-    - created_at: Fecha de creación del producto (datetime)
-
-    Descripción de la tabla proveedores
-    - id: Identificador único del proveedor (int)
-    - nombre: Nombre del proveedor (str)
-    - created_at: Fecha de creación del proveedor (datetime)
-
-    Descripción de la tabla roles
-    - id: Identificador único del rol (int)
-    - description: Descripción del rol (str)
-    - created_at: Fecha de creación del rol (datetime)
-
-    Descripción de la tabla salidas
-    - id: Identificador único de la salida (int)
-    - establecimiento_id: Identificador del establecimiento asociado (int)
-    - usuario_id: Identificador del usuario que registró la salida (int)
-    - tipo_salida: Tipo de salida (str)
-    - created_at: Fecha de creación de la salida (datetime)
-
-    Descripción de la tabla stock
-    - id: Identificador único del registro de stock (int)
-    - product_id: Identificador del producto asociado (int)
-    - establecimiento_id: Identificador del establecimiento asociado (int)
-    - cantidad: Cantidad disponible del producto (int)
-    - created_at: Fecha de creación del registro de stock (datetime)
+    Ejecuta una consulta SQL de lectura en la base de datos de inventario de
+    Cerámica de Altura y devuelve los resultados en formato de diccionario.
 
-    :param query: Consulta SQL a ejecutar.
-    :return: Diccionario con los resultados de la consulta.
-    """
-    try:
-        connection = connect_to_database(
-            host=DB_HOST,
-            user=DB_USER,
-            password=DB_PASSWORD,
-            database=DB_NAME,
-        )
+    Las tablas, columnas y relaciones (JOINs) relevantes para la pregunta se
+    indican en las instrucciones del sistema.
 
-        if connection:
-            cursor = connection.cursor(dictionary=True)
-            cursor.execute(query)
-            results = cursor.fetchall()
+    Si el resultado trae "columns", "types" y "rows", cada fila de "rows" es una
+    lista de valores en el mismo orden que "columns".
 
-            cursor.close()
-            connection.close()
+    Solo se aceptan consultas de lectura. Si la consulta se rechaza (por
+    ejemplo por examinar demasiadas filas) el error trae "reason" y "hint"
+    para corregirla.
 
-            return {"success": True, "data": results}
+    :param query: Consulta SQL a ejecutar.
+    :return: JSON compacto con los resultados de la consulta.
+    """
+    return dumps_compact(await run_query(run_sql_query, query))
 
-    except Error as e:
-        return {"success": False, "error": str(e)}
 
-    return {
-        "success": False,
-        "error": "No se pudo establecer conexión con la base de datos",
-    }
+@mcp.tool()
+async def get_movement_summary(
+    start: str,
+    end: str,
+    granularity: str = "mes",
+    group_by: list[str] | None = None,
+    producto_id: int | None = None,
+    establecimiento_id: int | None = None,
+    categoria_id: int | None = None,
+) -> str:
+    """
+    Reporte de entradas y salidas (cantidades) desde las tablas resumen ya
+    agregadas. Usar en lugar de sumar detalle_entradas/detalle_salidas para
+    reportes por fecha, producto, establecimiento o categoría.
+
+    :param start: Fecha inicial incluida (AAAA-MM-DD).
+    :param end: Fecha final incluida (AAAA-MM-DD).
+    :param granularity: "dia" o "mes".
+    :param group_by: Agrupar por "fecha", "producto", "establecimiento" y/o "categoria".
+    :param producto_id: Filtrar por producto (opcional).
+    :param establecimiento_id: Filtrar por establecimiento (opcional).
+    :param categoria_id: Filtrar por categoría (opcional).
+    :return: JSON compacto con cantidad_entrada y cantidad_salida por grupo.
+    """
+    return dumps_compact(await run_query(
+        movement_summary, start, end, granularity, group_by, producto_id, establecimiento_id, categoria_id
+    ))
 
 
 if __name__ == "__main__":
     try:
         # Ejecutar el servidor MCP
         logging.info("Iniciando el servidor MCP...")
+        db_pool.warmup()
         mcp.run()
     except Exception as e:
         logging.error(f"Ocurrió un error al iniciar el servidor MCP: {str(e)}")
@@ -0,0 +1,66 @@
+import asyncio
+import logging
+
+from mcp import ClientSession, types
+from openai.types.chat import ChatCompletionToolParam
+
+from app.metrics import span
+
+
+class ToolCatalog:
+    """Catálogo de herramientas de un servidor MCP ya convertido al formato de OpenAI
+
+    Se consulta con list_tools una sola vez y se reutiliza en cada petición.
+    Se invalida cuando el servidor envía notifications/tools/list_changed o
+    cuando el servidor se reinicia.
+    """
+
+    def __init__(self):
+        self._tools: list[ChatCompletionToolParam] | None = None
+        self._lock = asyncio.Lock()
+
+
+    def invalidate(self):
+        self._tools = None
+
+
+    async def get(self, session: ClientSession) -> list[ChatCompletionToolParam]:
+        """Obtener las herramientas, consultando al servidor solo si no están en caché
+
+        Args:
+            session: Sesión MCP del servidor dueño del catálogo
+        """
+
+        tools = self._tools
+        if tools is not None:
+            return tools
+
+        async with self._lock:
+            if self._tools is None:
+                with span("mcp.list_tools"):
+                    response = await session.list_tools()
+                self._tools = [
+                    ChatCompletionToolParam(
+                        type="function",
+                        function={
+                            "name": tool.name,
+                            "description": str(tool.description),
+                            "parameters": tool.inputSchema,
+                        }
+                    )
+                    for tool in response.tools
+                ]
+                logging.info(f"Catálogo de herramientas MCP cargado: {[tool.name for tool in response.tools]}")
+            return self._tools
+
+
+    async def handle_message(self, message):
+        """message_handler de ClientSession: invalida el catálogo ante tools/list_changed
+
+        Args:
+            message: Mensaje entrante del servidor
+        """
+
+        if isinstance(message, types.ServerNotification) and isinstance(message.root, types.ToolListChangedNotification):
+            logging.info("El servidor MCP notificó cambios en sus herramientas")
+            self.invalidate()
@@ -0,0 +1,360 @@
+import time
+import logging
+import threading
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from app.config import config
+
+# Buckets de los histogramas (segundos, bytes y filas)
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+BYTES_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304)
+ROWS_BUCKETS = (1, 10, 100, 1000, 10000, 100000)
+
+# Tiempos de las etapas de la petición en curso (los llena span(), los lee el middleware)
+_request_timings: ContextVar[list | None] = ContextVar("request_timings", default=None)
+# Spans medidos en otro proceso (servidor MCP) que se devuelven a quien llamó (ver collect_spans)
+_collected_spans: ContextVar[list | None] = ContextVar("collected_spans", default=None)
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(names: tuple, values: tuple, extra: str = "") -> str:
+    labels = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        labels.append(extra)
+    return "{" + ",".join(labels) + "}" if labels else ""
+
+
+class Counter:
+    """Contador acumulado por combinación de etiquetas"""
+
+    def __init__(self, name: str, description: str, labelnames: tuple = ()):
+        self.name = name
+        self.description = description
+        self.labelnames = labelnames
+        self._values: dict[tuple, float] = {}
+        self._lock = threading.Lock()
+
+
+    def inc(self, amount: float = 1, **labels):
+        key = tuple(str(labels.get(name, "")) for name in self.labelnames)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+
+    def render(self) -> list[str]:
+        lines = [f"# HELP {self.name} {self.description}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            for key, value in sorted(self._values.items()):
+                lines.append(f"{self.name}{_format_labels(self.labelnames, key)} {value}")
+        return lines
+
+
+class Gauge:
+    """Valor actual por combinación de etiquetas"""
+
+    def __init__(self, name: str, description: str, labelnames: tuple = ()):
+        self.name = name
+        self.description = description
+        self.labelnames = labelnames
+        self._values: dict[tuple, float] = {}
+        self._lock = threading.Lock()
+
+
+    def set(self, value: float, **labels):
+        key = tuple(str(labels.get(name, "")) for name in self.labelnames)
+        with self._lock:
+            self._values[key] = value
+
+
+    def inc(self, amount: float = 1, **labels):
+        key = tuple(str(labels.get(name, "")) for name in self.labelnames)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+
+    def render(self) -> list[str]:
+        lines = [f"# HELP {self.name} {self.description}", f"# TYPE {self.name} gauge"]
+        with self._lock:
+            for key, value in sorted(self._values.items()):
+                lines.append(f"{self.name}{_format_labels(self.labelnames, key)} {value}")
+        return lines
+
+
+class Histogram:
+    """Histograma con buckets fijos por combinación de etiquetas"""
+
+    def __init__(self, name: str, description: str, labelnames: tuple = (), buckets: tuple = LATENCY_BUCKETS):
+        self.name = name
+        self.description = description
+        self.labelnames = labelnames
+        self.buckets = tuple(sorted(buckets))
+        # etiquetas -> [conteo por bucket (+Inf al final), suma, cantidad]
+        self._values: dict[tuple, list] = {}
+        self._lock = threading.Lock()
+
+
+    def observe(self, value: float, **labels):
+        key = tuple(str(labels.get(name, "")) for name in self.labelnames)
+        index = next((i for i, bound in enumerate(self.buckets) if value <= bound), len(self.buckets))
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                state = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            state[0][index] += 1
+            state[1] += value
+            state[2] += 1
+
+
+    def render(self) -> list[str]:
+        lines = [f"# HELP {self.name} {self.description}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            for key, (counts, total, count) in sorted(self._values.items()):
+                cumulative = 0
+                for bound, bucket_count in zip(self.buckets + ("+Inf",), counts):
+                    cumulative += bucket_count
+                    labels = _format_labels(self.labelnames, key, f'le="{bound}"')
+                    lines.append(f"{self.name}_bucket{labels} {cumulative}")
+                labels = _format_labels(self.labelnames, key)
+                lines.append(f"{self.name}_sum{labels} {total}")
+                lines.append(f"{self.name}_count{labels} {count}")
+        return lines
+
+
+class MetricsRegistry:
+    """Métricas del proceso expuestas en formato de texto de Prometheus"""
+
+    def __init__(self):
+        self._metrics: list[Counter | Gauge | Histogram] = []
+
+
+    def counter(self, name: str, description: str, labelnames: tuple = ()) -> Counter:
+        metric = Counter(name, description, labelnames)
+        self._metrics.append(metric)
+        return metric
+
+
+    def gauge(self, name: str, description: str, labelnames: tuple = ()) -> Gauge:
+        metric = Gauge(name, description, labelnames)
+        self._metrics.append(metric)
+        return metric
+
+
+    def histogram(self, name: str, description: str, labelnames: tuple = (), buckets: tuple = LATENCY_BUCKETS) -> Histogram:
+        metric = Histogram(name, description, labelnames, buckets)
+        self._metrics.append(metric)
+        return metric
+
+
+    def render(self) -> str:
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+registry = MetricsRegistry()
+
+stage_duration = registry.histogram(
+    "agent_stage_duration_seconds", "Duración de cada etapa de una consulta", ("stage", "status")
+)
+tool_duration = registry.histogram(
+    "agent_tool_duration_seconds", "Duración de cada llamada a herramienta", ("tool", "status")
+)
+stage_payload_bytes = registry.histogram(
+    "agent_stage_payload_bytes", "Tamaño de los datos producidos por cada etapa", ("stage",), BYTES_BUCKETS
+)
+stage_rows = registry.histogram(
+    "agent_stage_rows", "Filas leídas por cada etapa", ("stage",), ROWS_BUCKETS
+)
+llm_tokens = registry.counter(
+    "agent_llm_tokens_total", "Tokens del modelo por etapa", ("stage", "kind")
+)
+http_duration = registry.histogram(
+    "agent_http_request_duration_seconds", "Duración de las peticiones HTTP hasta el último byte", ("path", "status")
+)
+admission_queue_depth = registry.gauge(
+    "agent_admission_queue_depth", "Peticiones esperando un cupo", ("limiter",)
+)
+admission_in_flight = registry.gauge(
+    "agent_admission_in_flight", "Cupos en uso", ("limiter",)
+)
+admission_wait = registry.histogram(
+    "agent_admission_wait_seconds", "Tiempo de espera por un cupo", ("limiter",)
+)
+admission_rejected = registry.counter(
+    "agent_admission_rejected_total", "Peticiones rechazadas por falta de cupo", ("limiter", "reason")
+)
+
+
+class Span:
+    """Etapa medida con sus atributos (filas, bytes, tokens, ...)"""
+
+    def __init__(self, name: str, attributes: dict):
+        self.name = name
+        self.attributes = attributes
+        self.duration = 0.0
+
+
+    def set(self, **attributes):
+        self.attributes.update(attributes)
+
+
+def record(name: str, duration: float, status: str = "ok", **attributes):
+    """Registrar una etapa ya medida
+
+    Los atributos conocidos alimentan métricas: "tool" usa el histograma de
+    herramientas, "rows" y "bytes" sus histogramas, y "prompt_tokens" /
+    "completion_tokens" el contador de tokens.
+
+    Args:
+        name: Nombre de la etapa (por ejemplo llm.completion, mcp.tool)
+        duration: Duración en segundos
+        status: "ok" o "error"
+        attributes: Atributos de la etapa
+    """
+
+    if not config.METRICS_ENABLED:
+        return
+
+    stage_duration.observe(duration, stage=name, status=status)
+    tool = attributes.get("tool")
+    if tool:
+        tool_duration.observe(duration, tool=tool, status=status)
+    if attributes.get("rows") is not None:
+        stage_rows.observe(attributes["rows"], stage=name)
+    if attributes.get("bytes") is not None:
+        stage_payload_bytes.observe(attributes["bytes"], stage=name)
+    for kind in ("prompt_tokens", "completion_tokens"):
+        if attributes.get(kind):
+            llm_tokens.inc(attributes[kind], stage=name, kind=kind.removesuffix("_tokens"))
+
+    timings = _request_timings.get()
+    if timings is not None:
+        timings.append((f"{name}.{tool}" if tool else name, duration))
+    collected = _collected_spans.get()
+    if collected is not None:
+        collected.append([name, round(duration, 6), status, attributes])
+
+    logging.debug(f"span {name} {duration * 1000:.1f}ms {status} {attributes}")
+
+
+@contextmanager
+def span(name: str, **attributes):
+    """Medir una etapa; sirve tanto en código síncrono como asíncrono
+
+    Uso:
+        with span("sql.execute") as s:
+            ...
+            s.set(rows=len(rows))
+
+    Args:
+        name: Nombre de la etapa
+        attributes: Atributos iniciales de la etapa
+    """
+
+    current = Span(name, attributes)
+    status = "ok"
+    start = time.perf_counter()
+    try:
+        yield current
+    except BaseException:
+        status = "error"
+        raise
+    finally:
+        current.duration = time.perf_counter() - start
+        record(name, current.duration, status, **current.attributes)
+
+
+@contextmanager
+def collect_spans(spans: list | None = None):
+    """Acumular los spans registrados dentro del bloque
+
+    El servidor MCP corre en otro proceso y su registro no llega al /metrics
+    de la API: los spans de cada llamada se devuelven en el resultado de la
+    herramienta y el cliente los registra con record_spans().
+
+    Uso:
+        with collect_spans() as spans:
+            result = run_sql_query(query)
+
+    Args:
+        spans: Lista donde acumular [nombre, segundos, estado, atributos] (por defecto una nueva)
+    """
+
+    spans = [] if spans is None else spans
+    token = _collected_spans.set(spans)
+    try:
+        yield spans
+    finally:
+        _collected_spans.reset(token)
+
+
+def record_spans(spans: list):
+    """Registrar en este proceso los spans acumulados con collect_spans()
+
+    Args:
+        spans: Lista de [nombre, segundos, estado, atributos]
+    """
+
+    for name, duration, status, attributes in spans:
+        record(name, duration, status, **attributes)
+
+
+def server_timing(timings: list) -> str:
+    """Valor del header Server-Timing con las etapas medidas
+
+    Args:
+        timings: Lista de (etapa, segundos)
+    """
+
+    return ", ".join(f"{name};dur={duration * 1000:.2f}" for name, duration in timings)
+
+
+class MetricsMiddleware:
+    """Middleware ASGI que mide cada petición y agrega el header Server-Timing
+
+    Las etapas medidas con span() durante la petición se acumulan en una
+    lista por petición. El header se envía con el inicio de la respuesta, así
+    en las respuestas de streaming solo incluye las etapas previas al primer
+    byte; el desglose completo queda en el log (nivel DEBUG).
+    """
+
+    def __init__(self, app, timing_header: bool = False):
+        self.app = app
+        self.timing_header = timing_header
+
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not config.METRICS_ENABLED:
+            await self.app(scope, receive, send)
+            return
+
+        timings: list = []
+        token = _request_timings.set(timings)
+        start = time.perf_counter()
+        status_code = 500
+
+        async def send_wrapper(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+                if self.timing_header and timings:
+                    headers = list(message.get("headers", []))
+                    headers.append((b"server-timing", server_timing(timings).encode("latin-1")))
+                    message = {**message, "headers": headers}
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            _request_timings.reset(token)
+            duration = time.perf_counter() - start
+            route = scope.get("route")
+            path = getattr(route, "path", None) or "unmatched"
+            http_duration.observe(duration, path=path, status=status_code)
+            if timings:
+                logging.debug(f"{scope['path']} {duration * 1000:.1f}ms Server-Timing: {server_timing(timings)}")
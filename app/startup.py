@@ -0,0 +1,79 @@
+import time
+import asyncio
+import logging
+from typing import Awaitable, Callable
+
+
+class Readiness:
+    """Estado del warm-up de arranque que consulta el endpoint de readiness
+
+    Cada paso se ejecuta en paralelo con los demás; los que fallan se vuelven
+    a intentar cada `retry_seconds` hasta que funcionen. La API está lista
+    cuando todos los pasos terminaron bien.
+    """
+
+    def __init__(self):
+        self.steps: dict[str, dict] = {}
+        self.started_at = time.monotonic()
+        self.ready_after: float | None = None
+
+
+    @property
+    def ready(self) -> bool:
+        return self.ready_after is not None
+
+
+    async def _run_step(self, name: str, step: Callable[[], Awaitable], retry_seconds: float):
+        attempts = 0
+        while True:
+            attempts += 1
+            start = time.perf_counter()
+            self.steps[name] = {"status": "running", "attempts": attempts}
+            try:
+                await step()
+            except Exception as e:
+                self.steps[name] = {"status": "error", "attempts": attempts, "error": str(e)}
+                logging.error(f"Warm-up: el paso {name} falló, se reintentará en {retry_seconds}s: {str(e)}")
+                await asyncio.sleep(retry_seconds)
+                continue
+
+            seconds = time.perf_counter() - start
+            self.steps[name] = {"status": "ok", "attempts": attempts, "seconds": round(seconds, 3)}
+            logging.info(f"Warm-up: {name} listo en {seconds:.2f}s")
+            return
+
+
+    async def warm_up(self, steps: dict[str, Callable[[], Awaitable]], retry_seconds: float):
+        """Ejecutar los pasos del warm-up y marcar la API como lista
+
+        Args:
+            steps: Nombre del paso -> función asíncrona que lo ejecuta
+            retry_seconds: Segundos de espera antes de reintentar un paso fallido
+        """
+
+        self.started_at = time.monotonic()
+        self.ready_after = None
+        for name in steps:
+            self.steps[name] = {"status": "pending", "attempts": 0}
+
+        await asyncio.gather(*(self._run_step(name, step, retry_seconds) for name, step in steps.items()))
+        self.ready_after = time.monotonic() - self.started_at
+        logging.info(f"API lista para recibir tráfico en {self.ready_after:.2f}s")
+
+
+    def mark_ready(self):
+        # Sin warm-up la API se considera lista desde el arranque
+        self.ready_after = time.monotonic() - self.started_at
+
+
+    def status(self) -> dict:
+        return {
+            "ready": self.ready,
+            "ready_after_seconds": round(self.ready_after, 3) if self.ready_after is not None else None,
+            "uptime_seconds": round(time.monotonic() - self.started_at, 3),
+            "steps": self.steps,
+        }
+
+
+# Estado compartido por el lifespan y los endpoints de health
+readiness = Readiness()
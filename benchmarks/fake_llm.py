@@ -0,0 +1,176 @@
+"""Proveedor LLM falso compatible con la API de chat completions de OpenAI
+
+Sirve tanto al cliente AsyncOpenAI de MCPClient como a LiteLlm (modelo
+"openai/..." con OPENAI_API_BASE apuntando aquí). Las respuestas salen de un
+guion (scenarios.json) según la última pregunta del usuario:
+
+- Con herramientas y sin resultados de herramientas todavía: llama a la
+  herramienta del guion con sus argumentos.
+- Con un resultado de herramienta o sin herramientas: responde el texto del guion.
+- Con response_format (chat.completions.parse): responde el JSON del esquema.
+
+La latencia se simula con un tiempo hasta el primer token y un tiempo por token.
+
+Uso:
+    python -m benchmarks.fake_llm --port 4010 --ttft-ms 150 --token-ms 10
+"""
+
+import json
+import time
+import uuid
+import asyncio
+import argparse
+from pathlib import Path
+
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+SCENARIOS_PATH = Path(__file__).parent / "scenarios.json"
+
+app = FastAPI(title="Fake LLM")
+app.state.scenarios = json.loads(SCENARIOS_PATH.read_text(encoding="utf-8"))
+app.state.ttft = 0.15
+app.state.token_delay = 0.01
+app.state.requests = 0
+
+
+def _text(content) -> str:
+    # El contenido puede ser texto o una lista de partes {"type": "text", "text": ...}
+    if isinstance(content, str):
+        return content
+    if isinstance(content, list):
+        return " ".join(part.get("text", "") for part in content if isinstance(part, dict))
+    return ""
+
+
+def _scenario(messages: list[dict]) -> dict:
+    question = next((_text(m.get("content")) for m in reversed(messages) if m.get("role") == "user"), "")
+    scenarios = app.state.scenarios
+    for scenario in scenarios:
+        if scenario["question"] in question:
+            return scenario
+    return scenarios[sum(map(ord, question)) % len(scenarios)]
+
+
+def _plan(body: dict) -> dict:
+    """Decidir la respuesta: llamada a herramienta, texto o JSON estructurado"""
+
+    messages = body.get("messages", [])
+    scenario = _scenario(messages)
+    tools = [tool["function"]["name"] for tool in body.get("tools") or [] if tool.get("type") == "function"]
+    last_user = max((i for i, m in enumerate(messages) if m.get("role") == "user"), default=-1)
+    answered = any(m.get("role") == "tool" for m in messages[last_user + 1:])
+
+    response_format = body.get("response_format") or {}
+    if response_format.get("type") == "json_schema":
+        properties = response_format.get("json_schema", {}).get("schema", {}).get("properties", {})
+        payload: dict = {"list_graphics": [scenario["graphic"]] if scenario.get("graphic") else []}
+        if "summary" in properties:
+            payload["summary"] = scenario["answer"]
+        return {"content": json.dumps(payload, ensure_ascii=False)}
+
+    if tools and not answered:
+        name = scenario["tool"] if scenario["tool"] in tools else tools[0]
+        return {"tool_call": {"id": f"call_{uuid.uuid4().hex[:12]}", "name": name, "arguments": json.dumps(scenario["arguments"], ensure_ascii=False)}}
+
+    return {"content": scenario["answer"]}
+
+
+def _tokens(text: str) -> list[str]:
+    words = text.split(" ")
+    return [word + (" " if i < len(words) - 1 else "") for i, word in enumerate(words)]
+
+
+def _usage(body: dict, completion: str) -> dict:
+    prompt = sum(len(_text(m.get("content"))) for m in body.get("messages", [])) // 4
+    completion_tokens = max(1, len(completion) // 4)
+    return {"prompt_tokens": prompt, "completion_tokens": completion_tokens, "total_tokens": prompt + completion_tokens}
+
+
+def _chunk(completion_id: str, model: str, delta: dict, finish_reason: str | None = None) -> str:
+    chunk = {
+        "id": completion_id,
+        "object": "chat.completion.chunk",
+        "created": int(time.time()),
+        "model": model,
+        "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}],
+    }
+    return f"data: {json.dumps(chunk, ensure_ascii=False)}\n\n"
+
+
+async def _stream(body: dict, plan: dict, completion_id: str, model: str):
+    await asyncio.sleep(app.state.ttft)
+    yield _chunk(completion_id, model, {"role": "assistant", "content": ""})
+
+    if "tool_call" in plan:
+        call = plan["tool_call"]
+        yield _chunk(completion_id, model, {"tool_calls": [{
+            "index": 0, "id": call["id"], "type": "function",
+            "function": {"name": call["name"], "arguments": ""},
+        }]})
+        for token in _tokens(call["arguments"]):
+            await asyncio.sleep(app.state.token_delay)
+            yield _chunk(completion_id, model, {"tool_calls": [{"index": 0, "function": {"arguments": token}}]})
+        yield _chunk(completion_id, model, {}, "tool_calls")
+    else:
+        for token in _tokens(plan["content"]):
+            await asyncio.sleep(app.state.token_delay)
+            yield _chunk(completion_id, model, {"content": token})
+        yield _chunk(completion_id, model, {}, "stop")
+
+    yield "data: [DONE]\n\n"
+
+
+@app.post("/v1/chat/completions")
+@app.post("/chat/completions")
+async def chat_completions(request: Request):
+    body = await request.json()
+    app.state.requests += 1
+    plan = _plan(body)
+    completion_id = f"chatcmpl-{uuid.uuid4().hex[:16]}"
+    model = body.get("model", "fake")
+
+    if body.get("stream"):
+        return StreamingResponse(_stream(body, plan, completion_id, model), media_type="text/event-stream")
+
+    # Sin stream: esperar lo que tardaría en generar toda la respuesta
+    text = plan.get("content") or plan["tool_call"]["arguments"]
+    await asyncio.sleep(app.state.ttft + app.state.token_delay * len(_tokens(text)))
+
+    message: dict = {"role": "assistant", "content": plan.get("content")}
+    finish_reason = "stop"
+    if "tool_call" in plan:
+        call = plan["tool_call"]
+        message["tool_calls"] = [{
+            "id": call["id"], "type": "function",
+            "function": {"name": call["name"], "arguments": call["arguments"]},
+        }]
+        finish_reason = "tool_calls"
+
+    return JSONResponse({
+        "id": completion_id,
+        "object": "chat.completion",
+        "created": int(time.time()),
+        "model": model,
+        "choices": [{"index": 0, "message": message, "finish_reason": finish_reason}],
+        "usage": _usage(body, text),
+    })
+
+
+@app.get("/health")
+async def health():
+    return {"status": "ok", "requests": app.state.requests}
+
+
+if __name__ == "__main__":
+    import uvicorn
+
+    parser = argparse.ArgumentParser(description="Proveedor LLM falso para benchmarks")
+    parser.add_argument("--port", type=int, default=4010)
+    parser.add_argument("--ttft-ms", type=float, default=150, help="Tiempo hasta el primer token")
+    parser.add_argument("--token-ms", type=float, default=10, help="Tiempo por token")
+    args = parser.parse_args()
+
+    app.state.ttft = args.ttft_ms / 1000
+    app.state.token_delay = args.token_ms / 1000
+    uvicorn.run(app, host="127.0.0.1", port=args.port, log_level="warning")
@@ -0,0 +1,105 @@
+"""Presupuesto de tiempo de importación de la API
+
+Importa app.main en un proceso nuevo (python -X importtime) varias veces y
+falla (código 1) si el mejor tiempo supera el presupuesto o si al importar se
+cargan dependencias que deben cargarse recién en el warm-up o en el primer uso
+(google.adk, litellm, openai, mcp).
+
+Uso:
+    python -m benchmarks.import_budget --budget-ms 1500
+"""
+
+import sys
+import time
+import argparse
+import subprocess
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+
+# Paquetes que no deben cargarse al importar app.main
+LAZY_PACKAGES = ("google.adk", "litellm", "openai", "mcp")
+# Mejor tiempo de importación permitido (también lo usa tests/test_import_budget.py)
+BUDGET_MS = 1500
+
+
+def parse_importtime(stderr: str) -> dict[str, int]:
+    """Tiempo acumulado (microsegundos) de cada módulo según -X importtime
+
+    Args:
+        stderr: Salida de error de python -X importtime
+    """
+
+    modules = {}
+    for line in stderr.splitlines():
+        if not line.startswith("import time:"):
+            continue
+        fields = line[len("import time:"):].split("|")
+        if len(fields) != 3 or not fields[1].strip().isdigit():
+            continue
+        # La indentación del nombre indica el nivel de anidamiento
+        modules[fields[2][1:].rstrip()] = int(fields[1])
+    return modules
+
+
+def measure(module: str) -> tuple[float, dict[str, int]]:
+    """Importar un módulo en un proceso nuevo
+
+    Args:
+        module: Módulo a importar
+    """
+
+    start = time.perf_counter()
+    process = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=ROOT, capture_output=True, text=True
+    )
+    elapsed = time.perf_counter() - start
+    if process.returncode != 0:
+        raise RuntimeError(f"No se pudo importar {module}:\n{process.stderr[-2000:]}")
+    return elapsed, parse_importtime(process.stderr)
+
+
+def lazy_packages_loaded(modules: dict[str, int]) -> list[str]:
+    """Paquetes de LAZY_PACKAGES que aparecen entre los módulos importados
+
+    Args:
+        modules: Módulos devueltos por measure()
+    """
+
+    return sorted({
+        package for package in LAZY_PACKAGES
+        for name in modules if name.strip() == package or name.strip().startswith(package + ".")
+    })
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(description="Presupuesto de tiempo de importación de la API")
+    parser.add_argument("--module", default="app.main")
+    parser.add_argument("--budget-ms", type=float, default=BUDGET_MS, help="Tiempo máximo de importación (mejor de --runs)")
+    parser.add_argument("--runs", type=int, default=3)
+    parser.add_argument("--top", type=int, default=10, help="Módulos más lentos a mostrar")
+    args = parser.parse_args(argv)
+
+    runs = [measure(args.module) for _ in range(max(1, args.runs))]
+    best, modules = min(runs, key=lambda run: run[0])
+
+    print(f"Importar {args.module}: {best * 1000:.0f} ms (mejor de {len(runs)}), presupuesto {args.budget_ms:.0f} ms")
+    top_level = {name: us for name, us in modules.items() if not name.startswith(" ")}
+    for name, us in sorted(top_level.items(), key=lambda item: -item[1])[:args.top]:
+        print(f"  {us / 1000:8.1f} ms  {name}")
+
+    failures = []
+    if best * 1000 > args.budget_ms:
+        failures.append(f"la importación tardó {best * 1000:.0f} ms (presupuesto {args.budget_ms:.0f} ms)")
+    loaded = lazy_packages_loaded(modules)
+    if loaded:
+        failures.append(f"se cargaron al importar: {', '.join(loaded)}")
+
+    for failure in failures:
+        print(f"FALLA: {failure}")
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,16 @@
+"""Servidor MCP SQL conectado a la base de datos de benchmark
+
+Se usa con MCP_SERVER_MODULE=benchmarks.mcp_server para que el pool MCP de la
+API lance este módulo en lugar del servidor que usa MySQL.
+"""
+
+from benchmarks.standin_db import install
+
+if __name__ == "__main__":
+    install()
+
+    from app.db.pool import db_pool
+    from app.mcp_custom.servers.mcp_server_sql import mcp
+
+    db_pool.warmup()
+    mcp.run()
@@ -0,0 +1,405 @@
+"""Benchmark de punta a punta de la API sin proveedor LLM ni MySQL reales
+
+Levanta el proveedor LLM falso (benchmarks.fake_llm), crea la base de datos
+SQLite de benchmark, inicia la API apuntando a ambos y reproduce las
+conversaciones de scenarios.json con la concurrencia pedida contra
+/chat-agent, /chat-agent-stream y /chat-agent-v2.
+
+Reporta latencia p50/p95/p99, tiempo al primer byte (TTFB), peticiones por
+segundo y el pico de memoria (RSS) de la API y sus servidores MCP. Los
+resultados se pueden guardar como línea base y comparar contra ella.
+
+Uso:
+    python -m benchmarks.run --concurrency 8 --requests 200
+    python -m benchmarks.run --save-baseline main
+    python -m benchmarks.run --compare main --tolerance 15
+"""
+
+import os
+import sys
+import json
+import time
+import asyncio
+import argparse
+import platform
+import threading
+import subprocess
+from pathlib import Path
+
+import httpx
+
+from benchmarks.standin_db import DB_PATH, create_database
+
+ROOT = Path(__file__).resolve().parent.parent
+BASELINES_DIR = Path(__file__).parent / "baselines"
+RESULTS_DIR = Path(__file__).parent / "results"
+SCENARIOS_PATH = Path(__file__).parent / "scenarios.json"
+
+ENDPOINTS = {
+    "chat-agent": {"path": "/api/v1/chat-agent", "stream": False},
+    "chat-agent-stream": {"path": "/api/v1/chat-agent-stream", "stream": True},
+    "chat-agent-v2": {"path": "/api/v1/chat-agent-v2", "stream": True},
+}
+
+# Métricas comparadas contra la línea base: (nombre, True si más alto es mejor)
+COMPARED_METRICS = [
+    ("latency_p50", False),
+    ("latency_p95", False),
+    ("latency_p99", False),
+    ("ttfb_p95", False),
+    ("requests_per_second", True),
+]
+
+
+def percentile(values: list[float], p: float) -> float | None:
+    """Percentil con interpolación lineal
+
+    Args:
+        values: Muestras
+        p: Percentil entre 0 y 100
+    """
+
+    if not values:
+        return None
+    ordered = sorted(values)
+    rank = (len(ordered) - 1) * p / 100
+    low = int(rank)
+    high = min(low + 1, len(ordered) - 1)
+    return ordered[low] + (ordered[high] - ordered[low]) * (rank - low)
+
+
+class RSSSampler:
+    """Pico de memoria residente de un proceso y sus descendientes (Linux /proc)"""
+
+    def __init__(self, pid: int, interval: float = 0.1):
+        self.pid = pid
+        self.interval = interval
+        self.peak_bytes = 0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+
+    def _children(self, pid: int) -> list[int]:
+        children = []
+        for task in Path(f"/proc/{pid}/task").glob("*"):
+            try:
+                children += [int(child) for child in (task / "children").read_text().split()]
+            except OSError:
+                pass
+        return children
+
+
+    def _rss(self, pid: int) -> int:
+        try:
+            for line in Path(f"/proc/{pid}/status").read_text().splitlines():
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) * 1024
+        except OSError:
+            pass
+        return 0
+
+
+    def sample(self) -> int:
+        total, pending = 0, [self.pid]
+        while pending:
+            pid = pending.pop()
+            total += self._rss(pid)
+            pending += self._children(pid)
+        self.peak_bytes = max(self.peak_bytes, total)
+        return total
+
+
+    def _run(self):
+        while not self._stop.is_set():
+            self.sample()
+            self._stop.wait(self.interval)
+
+
+    def start(self):
+        if Path(f"/proc/{self.pid}/status").exists():
+            self._thread.start()
+
+
+    def stop(self):
+        self._stop.set()
+
+
+def start_process(module: str, args: list[str], env: dict) -> subprocess.Popen:
+    return subprocess.Popen([sys.executable, "-m", module, *args], cwd=ROOT, env=env)
+
+
+async def wait_ready(url: str, timeout: float):
+    deadline = time.monotonic() + timeout
+    async with httpx.AsyncClient() as client:
+        while time.monotonic() < deadline:
+            try:
+                response = await client.get(url)
+                if response.status_code < 500:
+                    return
+            except httpx.HTTPError:
+                pass
+            await asyncio.sleep(0.2)
+    raise RuntimeError(f"{url} no respondió en {timeout}s")
+
+
+async def timed_request(client: httpx.AsyncClient, endpoint: dict, body: dict, stream_format: str) -> dict:
+    """Hacer una petición y medir latencia total y tiempo al primer byte
+
+    Args:
+        client: Cliente HTTP
+        endpoint: Ruta y si es de streaming
+        body: Cuerpo de la petición
+        stream_format: Header Accept de los endpoints de streaming
+    """
+
+    headers = {"Accept": stream_format} if endpoint["stream"] else {}
+    start = time.perf_counter()
+    ttfb = None
+    try:
+        async with client.stream("POST", endpoint["path"], json=body, headers=headers) as response:
+            async for chunk in response.aiter_raw():
+                if ttfb is None and chunk:
+                    ttfb = time.perf_counter() - start
+            status = response.status_code
+    except httpx.HTTPError as e:
+        return {"ok": False, "error": str(e), "latency": time.perf_counter() - start, "ttfb": ttfb}
+
+    return {"ok": status < 400, "status": status, "latency": time.perf_counter() - start, "ttfb": ttfb}
+
+
+async def run_endpoint(base_url: str, name: str, scenarios: list[dict], requests: int, concurrency: int, warmup: int, stream_format: str, timeout: float) -> dict:
+    """Reproducir los escenarios contra un endpoint con `concurrency` usuarios virtuales
+
+    Args:
+        base_url: URL de la API
+        name: Endpoint (chat-agent, chat-agent-stream, chat-agent-v2)
+        scenarios: Conversaciones del guion
+        requests: Peticiones medidas
+        concurrency: Peticiones simultáneas
+        warmup: Peticiones previas que no se miden
+        stream_format: Header Accept de los endpoints de streaming
+        timeout: Segundos máximos por petición
+    """
+
+    endpoint = ENDPOINTS[name]
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    async with httpx.AsyncClient(base_url=base_url, timeout=timeout, limits=limits) as client:
+
+        def body(index: int, worker: int) -> dict:
+            payload = {"mensaje": scenarios[index % len(scenarios)]["question"]}
+            if name == "chat-agent-v2":
+                payload["user_id"] = f"bench-{worker}"
+            return payload
+
+        for i in range(warmup):
+            await timed_request(client, endpoint, body(i, 0), stream_format)
+
+        queue: asyncio.Queue[int] = asyncio.Queue()
+        for i in range(requests):
+            queue.put_nowait(i)
+        samples: list[dict] = []
+
+        async def worker(worker_id: int):
+            while True:
+                try:
+                    index = queue.get_nowait()
+                except asyncio.QueueEmpty:
+                    return
+                samples.append(await timed_request(client, endpoint, body(index, worker_id), stream_format))
+
+        start = time.perf_counter()
+        await asyncio.gather(*(worker(i) for i in range(concurrency)))
+        elapsed = time.perf_counter() - start
+
+    latencies = [s["latency"] for s in samples if s["ok"]]
+    ttfbs = [s["ttfb"] for s in samples if s["ok"] and s["ttfb"] is not None]
+    errors = [s for s in samples if not s["ok"]]
+    return {
+        "requests": len(samples),
+        "errors": len(errors),
+        "error_samples": [e.get("error") or f"HTTP {e.get('status')}" for e in errors[:5]],
+        "duration": elapsed,
+        "requests_per_second": len(latencies) / elapsed if elapsed else 0.0,
+        "latency_p50": percentile(latencies, 50),
+        "latency_p95": percentile(latencies, 95),
+        "latency_p99": percentile(latencies, 99),
+        "latency_max": max(latencies) if latencies else None,
+        "ttfb_p50": percentile(ttfbs, 50),
+        "ttfb_p95": percentile(ttfbs, 95),
+        "ttfb_p99": percentile(ttfbs, 99),
+    }
+
+
+def compare(results: dict, baseline: dict, tolerance: float) -> list[str]:
+    """Comparar contra una línea base y devolver las regresiones
+
+    Args:
+        results: Resultados actuales
+        baseline: Resultados de la línea base
+        tolerance: Porcentaje de empeoramiento permitido
+    """
+
+    regressions = []
+    print(f"\n{'endpoint':<20}{'métrica':<22}{'base':>12}{'actual':>12}{'cambio':>10}")
+    for name, current in results["endpoints"].items():
+        previous = baseline.get("endpoints", {}).get(name)
+        if not previous:
+            continue
+        for metric, higher_is_better in COMPARED_METRICS:
+            before, after = previous.get(metric), current.get(metric)
+            if not before or after is None:
+                continue
+            change = (after - before) / before * 100
+            worse = -change if higher_is_better else change
+            flag = "  <-- regresión" if worse > tolerance else ""
+            print(f"{name:<20}{metric:<22}{before:>12.4f}{after:>12.4f}{change:>+9.1f}%{flag}")
+            if flag:
+                regressions.append(f"{name}.{metric} {change:+.1f}%")
+
+    before, after = baseline.get("peak_rss_mb"), results.get("peak_rss_mb")
+    if before and after:
+        change = (after - before) / before * 100
+        flag = "  <-- regresión" if change > tolerance else ""
+        print(f"{'proceso':<20}{'peak_rss_mb':<22}{before:>12.1f}{after:>12.1f}{change:>+9.1f}%{flag}")
+        if flag:
+            regressions.append(f"peak_rss_mb {change:+.1f}%")
+    return regressions
+
+
+def git_revision() -> str | None:
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, text=True).strip()
+    except Exception:
+        return None
+
+
+async def main(args: argparse.Namespace) -> int:
+    scenarios = json.loads(SCENARIOS_PATH.read_text(encoding="utf-8"))
+    create_database(DB_PATH, movements=args.db_movements)
+
+    llm_url = f"http://127.0.0.1:{args.llm_port}"
+    app_url = f"http://127.0.0.1:{args.app_port}"
+    env = {
+        **os.environ,
+        # Cliente AsyncOpenAI de MCPClient y LiteLlm del agente ADK
+        "OPENAI_API_KEY": "bench",
+        "OPENAI_BASE_URL": f"{llm_url}/v1",
+        "OPENAI_API_BASE": f"{llm_url}/v1",
+        "AGENT_MODEL": "openai/gpt-4o",
+        "MCP_SERVER_MODULE": "benchmarks.mcp_server",
+        "MCP_POOL_SIZE": str(args.mcp_pool_size),
+        "ROLLUPS_ENABLED": "false",
+        "SQL_CACHE_ENABLED": "true" if args.sql_cache else "false",
+        "PLAN_CACHE_ENABLED": "true" if args.plan_cache else "false",
+        "ENVIRONMENT": "benchmark",
+    }
+
+    processes = [
+        start_process("benchmarks.fake_llm", ["--port", str(args.llm_port), "--ttft-ms", str(args.ttft_ms), "--token-ms", str(args.token_ms)], env),
+    ]
+    try:
+        await wait_ready(f"{llm_url}/health", timeout=30)
+        app_process = start_process("benchmarks.serve_app", ["--port", str(args.app_port)], env)
+        processes.append(app_process)
+        started = time.perf_counter()
+        # Liveness (proceso respondiendo) y readiness (warm-up terminado)
+        await wait_ready(f"{app_url}/health/live", timeout=args.startup_timeout)
+        live_seconds = time.perf_counter() - started
+        await wait_ready(f"{app_url}/health/ready", timeout=args.startup_timeout)
+        startup_seconds = time.perf_counter() - started
+
+        sampler = RSSSampler(app_process.pid)
+        sampler.start()
+
+        results: dict = {
+            "revision": git_revision(),
+            "created_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "python": platform.python_version(),
+            "settings": {
+                "concurrency": args.concurrency,
+                "requests": args.requests,
+                "warmup": args.warmup,
+                "ttft_ms": args.ttft_ms,
+                "token_ms": args.token_ms,
+                "stream_format": args.stream_format,
+                "mcp_pool_size": args.mcp_pool_size,
+                "sql_cache": args.sql_cache,
+                "plan_cache": args.plan_cache,
+                "db_movements": args.db_movements,
+            },
+            "live_seconds": live_seconds,
+            "startup_seconds": startup_seconds,
+            "endpoints": {},
+        }
+        for name in args.endpoints:
+            print(f"Ejecutando {name}: {args.requests} peticiones, concurrencia {args.concurrency}...")
+            results["endpoints"][name] = await run_endpoint(
+                app_url, name, scenarios, args.requests, args.concurrency, args.warmup, args.stream_format, args.timeout
+            )
+            stats = results["endpoints"][name]
+            print(
+                f"  p50 {stats['latency_p50'] or 0:.3f}s  p95 {stats['latency_p95'] or 0:.3f}s  "
+                f"p99 {stats['latency_p99'] or 0:.3f}s  ttfb p50 {stats['ttfb_p50'] or 0:.3f}s  "
+                f"{stats['requests_per_second']:.1f} req/s  errores {stats['errors']}"
+            )
+
+        sampler.sample()
+        sampler.stop()
+        results["peak_rss_mb"] = sampler.peak_bytes / (1024 * 1024)
+        print(f"Pico de RSS (API + servidores MCP): {results['peak_rss_mb']:.1f} MB")
+    finally:
+        for process in reversed(processes):
+            process.terminate()
+        for process in processes:
+            try:
+                process.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                process.kill()
+
+    RESULTS_DIR.mkdir(parents=True, exist_ok=True)
+    output = Path(args.output) if args.output else RESULTS_DIR / "latest.json"
+    output.write_text(json.dumps(results, indent=2), encoding="utf-8")
+    print(f"Resultados guardados en {output}")
+
+    if args.save_baseline:
+        BASELINES_DIR.mkdir(parents=True, exist_ok=True)
+        baseline_path = BASELINES_DIR / f"{args.save_baseline}.json"
+        baseline_path.write_text(json.dumps(results, indent=2), encoding="utf-8")
+        print(f"Línea base guardada en {baseline_path}")
+
+    if args.compare:
+        baseline = json.loads((BASELINES_DIR / f"{args.compare}.json").read_text(encoding="utf-8"))
+        regressions = compare(results, baseline, args.tolerance)
+        if regressions:
+            print(f"\nRegresiones sobre {args.tolerance}%: {', '.join(regressions)}")
+            return 1
+        print("\nSin regresiones respecto a la línea base")
+    return 0
+
+
+def parse_args(argv: list[str] | None = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Benchmark de la API con LLM falso y base de datos local")
+    parser.add_argument("--endpoints", nargs="+", default=list(ENDPOINTS), choices=list(ENDPOINTS))
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--requests", type=int, default=100, help="Peticiones medidas por endpoint")
+    parser.add_argument("--warmup", type=int, default=4, help="Peticiones por endpoint antes de medir")
+    parser.add_argument("--ttft-ms", type=float, default=150, help="Tiempo al primer token del LLM falso")
+    parser.add_argument("--token-ms", type=float, default=10, help="Tiempo por token del LLM falso")
+    parser.add_argument("--stream-format", default="text/event-stream", help="Header Accept de los endpoints de streaming")
+    parser.add_argument("--mcp-pool-size", type=int, default=2)
+    parser.add_argument("--sql-cache", action=argparse.BooleanOptionalAction, default=False)
+    parser.add_argument("--plan-cache", action=argparse.BooleanOptionalAction, default=False)
+    parser.add_argument("--db-movements", type=int, default=20000, help="Entradas y salidas en la base de datos de benchmark")
+    parser.add_argument("--llm-port", type=int, default=4010)
+    parser.add_argument("--app-port", type=int, default=4020)
+    parser.add_argument("--timeout", type=float, default=120, help="Segundos máximos por petición")
+    parser.add_argument("--startup-timeout", type=float, default=90)
+    parser.add_argument("--output", help="Archivo de resultados (por defecto benchmarks/results/latest.json)")
+    parser.add_argument("--save-baseline", metavar="NOMBRE", help="Guardar los resultados en benchmarks/baselines/NOMBRE.json")
+    parser.add_argument("--compare", metavar="NOMBRE", help="Comparar contra benchmarks/baselines/NOMBRE.json")
+    parser.add_argument("--tolerance", type=float, default=15, help="Porcentaje de empeoramiento permitido al comparar")
+    return parser.parse_args(argv)
+
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(main(parse_args())))
@@ -0,0 +1,19 @@
+"""Levantar la API con la base de datos de benchmark
+
+Uso (lo lanza benchmarks.run):
+    python -m benchmarks.serve_app --port 4020
+"""
+
+import argparse
+
+from benchmarks.standin_db import install
+
+if __name__ == "__main__":
+    import uvicorn
+
+    parser = argparse.ArgumentParser(description="API con la base de datos de benchmark")
+    parser.add_argument("--port", type=int, default=4020)
+    args = parser.parse_args()
+
+    install()
+    uvicorn.run("app.main:app", host="127.0.0.1", port=args.port, log_level="warning")
@@ -0,0 +1,160 @@
+"""Base de datos local (SQLite) que reemplaza a MySQL durante los benchmarks
+
+Crea las tablas del inventario con datos sintéticos deterministas y conecta el
+pool de la aplicación a ese archivo. La ruta es fija (benchmarks/.data) porque
+el servidor MCP se lanza sin las variables de entorno del proceso padre.
+"""
+
+import random
+import sqlite3
+from datetime import datetime, timedelta
+from pathlib import Path
+
+DB_PATH = Path(__file__).parent / ".data" / "bench.sqlite"
+
+SCHEMA = """
+CREATE TABLE roles (id INTEGER PRIMARY KEY, description TEXT, created_at TEXT);
+CREATE TABLE usuarios (id INTEGER PRIMARY KEY, nombre TEXT, role_id INTEGER, created_at TEXT);
+CREATE TABLE categorias (id INTEGER PRIMARY KEY, description TEXT, created_at TEXT);
+CREATE TABLE establecimientos (id INTEGER PRIMARY KEY, nombre TEXT, direccion TEXT, created_at TEXT);
+CREATE TABLE proveedores (id INTEGER PRIMARY KEY, nombre TEXT, created_at TEXT);
+CREATE TABLE productos (
+    id INTEGER PRIMARY KEY, cod_producto TEXT, nombre TEXT, formato TEXT,
+    categoria_id INTEGER, precio REAL, activado INTEGER, created_at TEXT
+);
+CREATE TABLE stock (id INTEGER PRIMARY KEY, product_id INTEGER, establecimiento_id INTEGER, cantidad INTEGER, created_at TEXT);
+CREATE TABLE entradas (
+    id INTEGER PRIMARY KEY, establecimiento_id INTEGER, proveedor_id INTEGER,
+    usuario_id INTEGER, tipo_entrada TEXT, created_at TEXT
+);
+CREATE TABLE detalle_entradas (
+    id INTEGER PRIMARY KEY, entrada_id INTEGER, producto_id INTEGER,
+    cantidad_ingresada REAL, created_at TEXT
+);
+CREATE TABLE salidas (id INTEGER PRIMARY KEY, establecimiento_id INTEGER, usuario_id INTEGER, tipo_salida TEXT, created_at TEXT);
+CREATE TABLE detalle_salidas (
+    id INTEGER PRIMARY KEY, salida_id INTEGER, producto_id INTEGER,
+    cantidad_salida REAL, created_at TEXT
+);
+CREATE INDEX idx_detalle_entradas_entrada ON detalle_entradas (entrada_id);
+CREATE INDEX idx_detalle_salidas_salida ON detalle_salidas (salida_id);
+CREATE INDEX idx_stock_establecimiento ON stock (establecimiento_id);
+"""
+
+
+def create_database(path: Path = DB_PATH, movements: int = 20000, seed: int = 0) -> Path:
+    """Crear (o recrear) la base de datos de benchmark
+
+    Args:
+        path: Archivo SQLite
+        movements: Cantidad de entradas y de salidas (cada una con 1 a 4 detalles)
+        seed: Semilla de los datos sintéticos
+    """
+
+    path.parent.mkdir(parents=True, exist_ok=True)
+    if path.exists():
+        path.unlink()
+
+    rng = random.Random(seed)
+    start = datetime(2024, 1, 1)
+    now = start.isoformat(sep=" ")
+
+    def moment() -> str:
+        return (start + timedelta(minutes=rng.randrange(60 * 24 * 600))).isoformat(sep=" ")
+
+    connection = sqlite3.connect(path)
+    connection.executescript(SCHEMA)
+
+    connection.executemany("INSERT INTO roles VALUES (?, ?, ?)", [(1, "admin", now), (2, "vendedor", now)])
+    connection.executemany("INSERT INTO usuarios VALUES (?, ?, ?, ?)", [(i, f"Usuario {i}", 1 + i % 2, now) for i in range(1, 21)])
+    categories = ["Cerámicos", "Porcelanatos", "Adhesivos", "Fraguas", "Griferías", "Sanitarios", "Herramientas", "Pinturas"]
+    connection.executemany("INSERT INTO categorias VALUES (?, ?, ?)", [(i, name, now) for i, name in enumerate(categories, 1)])
+    stores = ["Centro", "Norte", "Sur", "Oriente", "Poniente", "Bodega Central"]
+    connection.executemany(
+        "INSERT INTO establecimientos VALUES (?, ?, ?, ?)",
+        [(i, name, f"Calle {i * 100}", now) for i, name in enumerate(stores, 1)]
+    )
+    connection.executemany("INSERT INTO proveedores VALUES (?, ?, ?)", [(i, f"Proveedor {i}", now) for i in range(1, 31)])
+
+    products = 400
+    connection.executemany(
+        "INSERT INTO productos VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+        [
+            (i, f"P-{i:04d}", f"Producto {i}", rng.choice(["caja", "unidad", "saco"]),
+             1 + i % len(categories), round(rng.uniform(1, 300), 2), 1, now)
+            for i in range(1, products + 1)
+        ]
+    )
+    connection.executemany(
+        "INSERT INTO stock VALUES (?, ?, ?, ?, ?)",
+        [
+            (None, product, store, rng.randrange(0, 500), now)
+            for product in range(1, products + 1) for store in range(1, len(stores) + 1)
+        ]
+    )
+
+    entries, entry_details, exits, exit_details = [], [], [], []
+    for i in range(1, movements + 1):
+        created = moment()
+        entries.append((i, rng.randint(1, len(stores)), rng.randint(1, 30), rng.randint(1, 20), "compra", created))
+        for _ in range(rng.randint(1, 4)):
+            entry_details.append((None, i, rng.randint(1, products), rng.randint(1, 50), created))
+        created = moment()
+        exits.append((i, rng.randint(1, len(stores)), rng.randint(1, 20), "venta", created))
+        for _ in range(rng.randint(1, 4)):
+            exit_details.append((None, i, rng.randint(1, products), rng.randint(1, 20), created))
+
+    connection.executemany("INSERT INTO entradas VALUES (?, ?, ?, ?, ?, ?)", entries)
+    connection.executemany("INSERT INTO detalle_entradas VALUES (?, ?, ?, ?, ?)", entry_details)
+    connection.executemany("INSERT INTO salidas VALUES (?, ?, ?, ?, ?)", exits)
+    connection.executemany("INSERT INTO detalle_salidas VALUES (?, ?, ?, ?, ?)", exit_details)
+    connection.commit()
+    connection.close()
+    return path
+
+
+class SQLiteConnection:
+    """Conexión SQLite con la parte de la interfaz de mysql.connector que usa la app"""
+
+    def __init__(self, path: Path):
+        # autocommit como las conexiones MySQL del pool
+        self._connection = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+
+
+    def cursor(self, *args, **kwargs):
+        # buffered/dictionary no aplican a SQLite
+        return self._connection.cursor()
+
+
+    def ping(self, reconnect: bool = False):
+        self._connection.execute("SELECT 1")
+
+
+    def start_transaction(self):
+        self._connection.execute("BEGIN")
+
+
+    def commit(self):
+        self._connection.commit()
+
+
+    def rollback(self):
+        self._connection.rollback()
+
+
+    def close(self):
+        self._connection.close()
+
+
+def install(path: Path = DB_PATH):
+    """Conectar el pool de la aplicación a la base de datos de benchmark
+
+    Args:
+        path: Archivo SQLite creado con create_database()
+    """
+
+    from app.db.pool import db_pool
+
+    if not path.exists():
+        raise FileNotFoundError(f"No existe la base de datos de benchmark {path}, ejecutar benchmarks.run primero")
+    db_pool._connect = lambda: SQLiteConnection(path)
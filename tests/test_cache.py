@@ -0,0 +1,76 @@
+from app.db.cache import QueryCache, normalize_sql, referenced_tables
+
+
+def tables(query: str) -> set[str]:
+    return referenced_tables(normalize_sql(query))
+
+
+def test_string_literal_column_keeps_tables():
+    assert tables("SELECT nombre, 'x' FROM productos") == {"productos"}
+    assert tables("SELECT 'a from b' AS t FROM stock s JOIN productos p ON p.id = s.producto_id") == {"stock", "productos"}
+
+
+def test_from_inside_functions_is_not_a_table():
+    assert tables("SELECT EXTRACT(YEAR FROM fecha) AS anio FROM entradas") == {"entradas"}
+    assert tables("SELECT TRIM(LEADING '0' FROM codigo) FROM productos") == {"productos"}
+    assert tables("SELECT SUBSTRING(nombre FROM 2) FROM categorias") == {"categorias"}
+
+
+def test_subquery_tables_are_found():
+    query = "SELECT * FROM productos WHERE id IN (SELECT producto_id FROM stock WHERE cantidad > 0)"
+    assert tables(query) == {"productos", "stock"}
+
+
+def make_cache(fingerprints: dict) -> QueryCache:
+    return QueryCache(
+        fingerprint=lambda table: fingerprints[table],
+        table_ttls={"stock": 15},
+        default_ttl=30,
+        max_entries=10,
+        max_bytes=1024 * 1024,
+        fingerprint_interval=3600,
+        max_ttl=60,
+    )
+
+
+def test_query_without_tables_is_not_cached():
+    cache = make_cache({})
+    assert cache.prepare("SELECT 1") is None
+
+
+def test_new_rows_invalidate_cached_result():
+    fingerprints = {"stock": (10,)}
+    cache = make_cache(fingerprints)
+    query = "SELECT SUM(cantidad) FROM stock"
+
+    # La primera vez la tabla no tiene huella: no se guarda hasta que el hilo la lea
+    assert cache.prepare(query) is None
+    cache.refresh_fingerprints()
+    prepared = cache.prepare(query)
+    cache.put(prepared, {"success": True, "data": [{"total": 5}]})
+    assert cache.get(query) == {"success": True, "data": [{"total": 5}]}
+
+    # Un INSERT cambia MAX(id): la siguiente lectura invalida la entrada
+    fingerprints["stock"] = (11,)
+    cache.refresh_fingerprints()
+    assert cache.get(query) is None
+    assert cache.stats()["invalidations"] == 1
+
+
+def test_ttl_is_capped_by_max_ttl():
+    cache = make_cache({})
+    assert cache._ttl({"stock"}) == 15
+    cache.table_ttls["productos"] = 3600
+    assert cache._ttl({"productos"}) == 60
+
+
+def test_cached_result_is_a_copy():
+    fingerprints = {"stock": (1,)}
+    cache = make_cache(fingerprints)
+    cache.refresh_fingerprints()
+    query = "SELECT * FROM stock"
+    cache.prepare(query)
+    cache.refresh_fingerprints()
+    cache.put(cache.prepare(query), {"success": True, "data": [{"id": 1}]})
+    cache.get(query)["data"].append({"id": 2})
+    assert cache.get(query) == {"success": True, "data": [{"id": 1}]}
@@ -0,0 +1,88 @@
+import pytest
+
+from app.db.guard import QueryGuard, QueryRejected, estimate_rows_examined, mask_sql
+
+
+def make_guard(max_execution_ms: int = 0) -> QueryGuard:
+    return QueryGuard(enabled=True, max_rows_examined=1_000_000, default_limit=2000, max_execution_ms=max_execution_ms)
+
+
+@pytest.mark.parametrize("query", [
+    "UPDATE productos SET precio = 0",
+    "DELETE FROM stock",
+    "INSERT INTO roles (nombre) VALUES ('x')",
+    "WITH t AS (SELECT 1) DELETE FROM stock",
+    "SELECT * FROM productos FOR UPDATE",
+    "SELECT * FROM productos LOCK IN SHARE MODE",
+    "SELECT SLEEP(10)",
+    "SELECT /*! 1; DROP TABLE stock */ 1",
+])
+def test_rejects_writes_and_locks(query):
+    with pytest.raises(QueryRejected) as error:
+        make_guard().rewrite(query)
+    assert error.value.reason == "not_read_only"
+
+
+def test_rejects_stacked_statements():
+    with pytest.raises(QueryRejected) as error:
+        make_guard().rewrite("SELECT * FROM productos; DROP TABLE stock")
+    assert error.value.reason == "multiple_statements"
+
+
+@pytest.mark.parametrize("query", [
+    "SELECT * FROM productos INTO OUTFILE '/tmp/x.csv'",
+    "SELECT * FROM productos INTO DUMPFILE '/tmp/x'",
+    "SELECT nombre INTO @nombre FROM productos LIMIT 1",
+])
+def test_rejects_select_into(query):
+    with pytest.raises(QueryRejected):
+        make_guard().rewrite(query)
+
+
+def test_keywords_inside_literals_and_string_functions_are_allowed():
+    sql, _ = make_guard().rewrite("SELECT REPLACE(nombre, 'a', 'b') FROM productos WHERE nota = 'update; delete'")
+    assert sql.startswith("SELECT REPLACE(nombre")
+
+
+def test_adds_limit_when_missing():
+    sql, limit = make_guard().rewrite("SELECT * FROM productos;")
+    assert (sql, limit) == ("SELECT * FROM productos LIMIT 2000", 2000)
+
+
+def test_keeps_existing_limit():
+    sql, limit = make_guard().rewrite("SELECT * FROM productos LIMIT 10")
+    assert (sql, limit) == ("SELECT * FROM productos LIMIT 10", None)
+
+
+def test_subquery_limit_does_not_count_as_outer_limit():
+    query = "SELECT * FROM productos WHERE id IN (SELECT producto_id FROM stock ORDER BY cantidad DESC LIMIT 5)"
+    sql, limit = make_guard().rewrite(query)
+    assert limit == 2000
+    assert sql == query + " LIMIT 2000"
+
+
+def test_limit_inside_literal_does_not_count():
+    sql, limit = make_guard().rewrite("SELECT * FROM productos WHERE nombre = 'limit 5'")
+    assert limit == 2000
+
+
+def test_execution_time_hint_goes_after_outer_select():
+    sql, _ = make_guard(max_execution_ms=1500).rewrite("SELECT id FROM (SELECT id FROM productos) p LIMIT 1")
+    assert sql == "SELECT /*+ MAX_EXECUTION_TIME(1500) */ id FROM (SELECT id FROM productos) p LIMIT 1"
+
+
+def test_mask_sql_keeps_length():
+    query = "SELECT 'a;b' -- comentario\nFROM t"
+    masked = mask_sql(query)
+    assert len(masked) == len(query)
+    assert ";" not in masked
+
+
+def test_estimate_rows_examined_nested_loops():
+    plan = [
+        {"id": 1, "table": "s", "rows": 1000, "filtered": 10},
+        {"id": 1, "table": "p", "rows": 1, "filtered": 100},
+    ]
+    # 1000 filas de s y una búsqueda en p por cada una de las 100 que pasan el filtro
+    assert estimate_rows_examined(plan) == 1100
+    assert estimate_rows_examined([{"id": 1, "detail": "SCAN t"}]) is None
@@ -0,0 +1,53 @@
+from app.mcp_custom.history import ConversationHistory, ConversationStore
+
+
+def schema(table: str) -> dict:
+    return {"role": "system", "content": f"Esquema de la base de datos relevante para la consulta:\n{table}"}
+
+
+def test_compaction_drops_schema_message_with_its_turn():
+    history = ConversationHistory("prompt", max_tokens=10_000, keep_turns=1, tool_output_tokens=100)
+    history.append(schema("productos"))
+    history.append({"role": "user", "content": "primera pregunta"})
+    history.append({"role": "assistant", "content": "respuesta " * 400})
+    history.append(schema("stock"))
+    history.append({"role": "user", "content": "segunda pregunta"})
+    history.append({"role": "assistant", "content": "respuesta " * 400})
+
+    history.max_tokens = 300
+    history.append({"role": "assistant", "content": "fin"})
+
+    window = history.window()
+    # El turno antiguo se elimina completo y el turno en curso conserva su esquema
+    assert schema("productos") not in window
+    assert window[1] == schema("stock")
+    assert window[2] == {"role": "user", "content": "segunda pregunta"}
+
+
+def test_same_conversation_continues_history():
+    store = ConversationStore(lambda: ConversationHistory("prompt", 10_000, 2, 100), max_conversations=10, ttl_seconds=60)
+
+    # Primera petición
+    first = store.get("u1", "s1")
+    first.history.append(schema("productos"))
+    first.history.append({"role": "user", "content": "¿cuántos productos hay?"})
+    first.history.append({"role": "assistant", "content": "Hay 42 productos"})
+
+    # Segunda petición con el mismo usuario y sesión: ve el turno anterior
+    second = store.get("u1", "s1")
+    assert {"role": "assistant", "content": "Hay 42 productos"} in second.history.window()
+
+    # Otra sesión empieza vacía
+    assert store.get("u1", "s2").history.window() == [{"role": "system", "content": "prompt"}]
+
+
+def test_conversation_store_evicts_lru_and_expired():
+    store = ConversationStore(lambda: ConversationHistory("prompt", 10_000, 2, 100), max_conversations=2, ttl_seconds=60)
+    first = store.get("u", "a")
+    store.get("u", "b")
+    store.get("u", "c")
+    assert store.get("u", "a") is not first
+
+    store.ttl_seconds = 0
+    store.get("u", "d")
+    assert store.stats()["conversations"] == 1
@@ -0,0 +1,15 @@
+import pytest
+
+from benchmarks.import_budget import BUDGET_MS, lazy_packages_loaded, measure
+
+# Sin las dependencias de la API no se puede importar app.main
+pytest.importorskip("fastapi")
+pytest.importorskip("dotenv")
+pytest.importorskip("mysql.connector")
+
+
+def test_app_main_imports_within_budget():
+    # Mejor de tres para no fallar por un proceso lento aislado
+    best, modules = min((measure("app.main") for _ in range(3)), key=lambda run: run[0])
+    assert best * 1000 <= BUDGET_MS, f"importar app.main tardó {best * 1000:.0f} ms (presupuesto {BUDGET_MS} ms)"
+    assert lazy_packages_loaded(modules) == []
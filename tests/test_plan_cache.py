@@ -0,0 +1,24 @@
+from app.mcp_custom.plan_cache import parameterize_question, parameterize_sql
+
+
+def test_repeated_number_is_not_parameterized():
+    # El 1 de la pregunta aparece dos veces en el SQL: no se puede saber cuál sustituir
+    _, literals = parameterize_question("stock del producto 1", [])
+    sql = "SELECT s.cantidad FROM stock s JOIN productos p ON p.id = s.producto_id WHERE p.id = 1 AND p.activado = 1"
+    assert parameterize_sql(sql, literals) is None
+
+
+def test_number_used_once_is_parameterized():
+    _, literals = parameterize_question("stock del producto 7", [])
+    sql = "SELECT s.cantidad FROM stock s WHERE s.producto_id = 7 AND s.activo = true"
+    assert parameterize_sql(sql, literals) == "SELECT s.cantidad FROM stock s WHERE s.producto_id = {p0} AND s.activo = true"
+
+
+def test_text_only_matches_inside_sql_strings():
+    _, literals = parameterize_question("stock de la tienda centro", ["centro"])
+    sql = "SELECT e.centro_costo, s.cantidad FROM stock s JOIN establecimientos e ON e.id = s.establecimiento_id WHERE e.nombre = 'Centro'"
+    template = parameterize_sql(sql, literals)
+    assert template == (
+        "SELECT e.centro_costo, s.cantidad FROM stock s JOIN establecimientos e ON e.id = s.establecimiento_id "
+        "WHERE e.nombre = '{p0}'"
+    )